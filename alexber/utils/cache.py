@@ -1,60 +1,182 @@
+import asyncio
+import concurrent.futures
+import copy
 import functools
+import heapq
+import itertools
+import logging
+import math
+import os
+import pickle
+import random
+import struct
+import sys
+import threading
 import time
-from collections import defaultdict, deque
-from typing import Any, Optional, Union
-from .thread_locals import RLock
-from .mains import make_hashable, HashableWrapper
+import traceback
+import weakref
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Protocol, Union
+from .thread_locals import RLock, exec_in_executor
+from .mains import make_hashable, HashableWrapper, is_mapping
 import inspect
 
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class CachePolicy(Protocol):
+    """
+    Protocol for the policy engine of `AsyncCache`.
+
+    The engine is created by `factory(maxsize=..., on_evict=...)`, for example, by the engine class itself.
+    It stores the values and decides which key to evict when it is full.
+    `on_evict` (if not None) should be called with every key that the engine evicts by itself
+    (on insert to the full engine or on `_evict()`), but not with the keys removed by `pop()` or `clear()`.
+    """
+    maxsize: int
+
+    def __getitem__(self, key: Any) -> Any:
+        """Returns the value and records the access. Raises KeyError if the key is absent."""
+        ...
+
+    def __setitem__(self, key: Any, value: Any):
+        """Inserts or updates the value, evicts some key (maybe, the inserted one) if the engine is full."""
+        ...
+
+    def __contains__(self, key: Any) -> bool:
+        """Checks presence of the key without recording the access."""
+        ...
+
+    def __len__(self) -> int:
+        ...
+
+    def pop(self, key: Any) -> Any:
+        """Removes exactly the given key and returns its value, raises KeyError if it is absent."""
+        ...
+
+    def _evict(self) -> Any:
+        """Evicts the victim chosen by the policy and returns its key."""
+        ...
+
+    def clear(self):
+        ...
+
+    # Optional, required only by `AsyncCache.dump()` and `AsyncCache.load()`
+
+    def dump_order(self):
+        """
+        Yields (key, value, meta) of all keys without recording the access, the next victim first.
+        meta is the policy metadata (for example, frequency) of the key. Replaying `restore()` in this order should reproduce the state of the engine.
+        """
+        ...
+
+    def restore(self, key: Any, value: Any, meta: Any):
+        """Inserts the value with the metadata yielded by `dump_order()`."""
+        ...
+
+
 class _LRUCache:
-    """A simple LRU (Least Recently Used) cache implementation."""
+    """
+    A simple LRU (Least Recently Used) cache implementation.
+
+    The recency order is kept by `OrderedDict` (hash map plus doubly-linked list),
+    so hits, inserts and evictions are all O(1).
+    """
 
-    def __init__(self, maxsize: int):
+    def __init__(self, maxsize: int, on_evict: Optional[Callable[[Any], None]] = None):
         self.maxsize = maxsize
-        self.cache = {}
-        self.order = deque()
+        self.on_evict = on_evict  # is called with the key evicted by the policy
+        self.cache = OrderedDict()
 
     def __getitem__(self, key: Any) -> Any:
-        if key not in self.cache:
-            raise KeyError(f"Key '{key}' not found in cache.")
-        self.order.remove(key)
-        self.order.append(key)
-        return self.cache[key]
+        try:
+            value = self.cache[key]
+        except KeyError:
+            raise KeyError(f"Key '{key}' not found in cache.") from None
+        self.cache.move_to_end(key)
+        return value
 
     def __setitem__(self, key: Any, value: Any):
         if key in self.cache:
-            self.order.remove(key)
+            self.cache.move_to_end(key)
         elif len(self.cache) >= self.maxsize:
-            oldest_key = self.order.popleft()
-            del self.cache[oldest_key]
+            self._evict()
         self.cache[key] = value
-        self.order.append(key)
+
+    def _evict(self):
+        evict_key, _ = self.cache.popitem(last=False)
+        if self.on_evict is not None:
+            self.on_evict(evict_key)
+        return evict_key
+
+    def pop(self, key: Any) -> Any:
+        """Removes exactly the given key, raises KeyError if it is absent."""
+        return self.cache.pop(key)
+
+    def dump_order(self):
+        """Yields (key, value, None), the least recently used first."""
+        for key, value in self.cache.items():
+            yield key, value, None
+
+    def restore(self, key: Any, value: Any, meta: Any):
+        self[key] = value
 
     def __len__(self) -> int:
         return len(self.cache)
 
     def __contains__(self, key: Any) -> bool:
         return key in self.cache
+
     def clear(self):
         self.cache.clear()
-        self.order.clear()
+
+
+class _FreqNode:
+    """
+    A node of the frequency list of `_LFUCache`.
+    It holds all keys that have the same frequency, in the order they got it.
+    """
+    __slots__ = ('freq', 'keys', 'prev', 'next')
+
+    def __init__(self, freq: int):
+        self.freq = freq
+        self.keys = OrderedDict()  # used as insertion-ordered set
+        self.prev = self
+        self.next = self
 
 
 class _LFUCache:
-    """A simple LFU (Least Frequently Used) cache implementation."""
+    """
+    A simple LFU (Least Frequently Used) cache implementation.
 
-    def __init__(self, maxsize: int):
+    This is the classic O(1) LFU: the frequency nodes form a doubly-linked list sorted by frequency,
+    every node holds an insertion-ordered set of keys. Hits, inserts and evictions are all O(1).
+    Within the same frequency the oldest key is evicted first.
+    """
+
+    def __init__(self, maxsize: int, on_evict: Optional[Callable[[Any], None]] = None):
         self.maxsize = maxsize
+        self.on_evict = on_evict  # is called with the key evicted by the policy
         self.cache = {}
-        self.freq = defaultdict(int)
-        self.min_freq = 0
-        self.freq_list = defaultdict(deque)
+        self.nodes = {}  # key -> _FreqNode that holds it
+        self.head = _FreqNode(0)  # sentinel, head.next is the node with the minimal frequency
+
+    @property
+    def min_freq(self) -> int:
+        return self.head.next.freq
+
+    def frequency(self, key: Any) -> int:
+        return self.nodes[key].freq
 
     def __getitem__(self, key: Any) -> Any:
-        if key not in self.cache:
-            raise KeyError(f"Key '{key}' not found in cache.")
+        try:
+            value = self.cache[key]
+        except KeyError:
+            raise KeyError(f"Key '{key}' not found in cache.") from None
         self._increase_freq(key)
-        return self.cache[key]
+        return value
 
     def __setitem__(self, key: Any, value: Any):
         if key in self.cache:
@@ -64,26 +186,83 @@ class _LFUCache:
             if len(self.cache) >= self.maxsize:
                 self._evict()
             self.cache[key] = value
-            self.freq[key] = 1
-            self.min_freq = 1
-            self.freq_list[1].append(key)
+            node = self.head.next
+            if node.freq != 1:
+                node = self._insert_node_after(self.head, 1)
+            node.keys[key] = None
+            self.nodes[key] = node
+
+    def _insert_node_after(self, node: _FreqNode, freq: int) -> _FreqNode:
+        new_node = _FreqNode(freq)
+        new_node.prev = node
+        new_node.next = node.next
+        node.next.prev = new_node
+        node.next = new_node
+        return new_node
+
+    def _remove_node(self, node: _FreqNode):
+        node.prev.next = node.next
+        node.next.prev = node.prev
 
     def _increase_freq(self, key: Any):
-        freq = self.freq[key]
-        self.freq[key] += 1
-        self.freq_list[freq].remove(key)
-        if not self.freq_list[freq]:
-            del self.freq_list[freq]
-            if self.min_freq == freq:
-                self.min_freq += 1
-        self.freq_list[freq + 1].append(key)
+        node = self.nodes[key]
+        next_node = node.next
+        if next_node.freq != node.freq + 1:
+            # head sentinel has freq 0, so it never matches here
+            next_node = self._insert_node_after(node, node.freq + 1)
+        next_node.keys[key] = None
+        self.nodes[key] = next_node
+        del node.keys[key]
+        if not node.keys:
+            self._remove_node(node)
 
     def _evict(self):
-        evict_key = self.freq_list[self.min_freq].popleft()
-        if not self.freq_list[self.min_freq]:
-            del self.freq_list[self.min_freq]
+        node = self.head.next
+        evict_key, _ = node.keys.popitem(last=False)
+        if not node.keys:
+            self._remove_node(node)
         del self.cache[evict_key]
-        del self.freq[evict_key]
+        del self.nodes[evict_key]
+        if self.on_evict is not None:
+            self.on_evict(evict_key)
+        return evict_key
+
+    def pop(self, key: Any) -> Any:
+        """Removes exactly the given key, raises KeyError if it is absent."""
+        value = self.cache.pop(key)
+        node = self.nodes.pop(key)
+        del node.keys[key]
+        if not node.keys:
+            self._remove_node(node)
+        return value
+
+    def dump_order(self):
+        """Yields (key, value, frequency), the least frequently used first."""
+        node = self.head.next
+        while node is not self.head:
+            for key in node.keys:
+                yield key, self.cache[key], node.freq
+            node = node.next
+
+    def restore(self, key: Any, value: Any, meta: Any):
+        """Inserts the value and raises the frequency of the key to meta."""
+        self[key] = value
+        if key not in self.nodes:
+            return
+        node = self.nodes[key]
+        freq = meta or 1
+        if node.freq >= freq:
+            return
+        target = node
+        while target.next is not self.head and target.next.freq <= freq:
+            target = target.next
+        if target.freq != freq:
+            target = self._insert_node_after(target, freq)
+        target.keys[key] = None
+        self.nodes[key] = target
+        del node.keys[key]
+        if not node.keys:
+            self._remove_node(node)
 
     def __len__(self) -> int:
         return len(self.cache)
@@ -93,174 +272,2491 @@ class _LFUCache:
 
     def clear(self):
         self.cache.clear()
-        self.freq.clear()
-        self.freq_list.clear()
-        self.min_freq = 0
+        self.nodes.clear()
+        self.head = _FreqNode(0)
 
 
-class AsyncCache:
+class _CountMinSketch:
     """
-    An asynchronous cache that supports both LFU (Least Frequently Used) and LRU
-    (Least Recently Used) eviction policies and an optional Time-to-Live (TTL) for cache entries.
+    Count-min sketch, frequency estimator of `_WTinyLFUCache`.
+
+    Counters are 4-bit (saturate at 15). After `sample_size` increments all counters are halved (aging),
+    so the estimate reflects the recent popularity.
     """
 
-    def __init__(self, maxsize, ttl=None, policy="LFU"):
-        """
-        Initializes the AsyncCache with the given parameters.
+    _HALVE = bytes(c >> 1 for c in range(256))
+    _MULTIPLIERS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93)
 
-        Args:
-            maxsize (int): Maximum size of the cache.
-            ttl (Optional[int]): Time-to-Live for cache entries in seconds. Defaults to None.
-            policy (str): Cache eviction policy. Can be either "LFU" or "LRU". Defaults to "LFU".
-        """
-        if policy == "LFU":
-            self.cache = _LFUCache(maxsize=maxsize)
-        elif policy == "LRU":
-            self.cache = _LRUCache(maxsize=maxsize)
-        else:
-            raise ValueError("Invalid policy. Use 'LFU' or 'LRU'.")
+    def __init__(self, width: int, sample_size: Optional[int] = None):
+        self.width = 1 << max(4, (width - 1).bit_length())  # power of 2
+        self._mask = self.width - 1
+        self.rows = [bytearray(self.width) for _ in self._MULTIPLIERS]
+        self.sample_size = sample_size if sample_size is not None else 10 * self.width
+        self.additions = 0
 
-        self.ttl = ttl
-        self.expiry_times = {}  # To track expiry times of keys when ttl is not None
-        self.lock = RLock()
-        self.hits = 0
-        self.misses = 0
-        self.total_time_ns = 0
-        self.total_calls = 0
-        self.max_time_ns = 0
-        self.min_time_ns = float('inf')
+    def _indexes(self, key: Any):
+        h = hash(key) & 0xFFFFFFFFFFFFFFFF
+        mask = self._mask
+        return [((h * m) & 0xFFFFFFFFFFFFFFFF) >> 40 & mask for m in self._MULTIPLIERS]
 
-    def _wrap_key(self, key: Any) -> Union[HashableWrapper, Any]:
+    def increment(self, key: Any):
+        for row, i in zip(self.rows, self._indexes(key)):
+            if row[i] < 15:
+                row[i] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self._reset()
+
+    def estimate(self, key: Any) -> int:
+        return min(row[i] for row, i in zip(self.rows, self._indexes(key)))
+
+    def _reset(self):
+        for i, row in enumerate(self.rows):
+            self.rows[i] = bytearray(row.translate(self._HALVE))
+        self.additions //= 2
+
+    def clear(self):
+        for row in self.rows:
+            row[:] = bytes(self.width)
+        self.additions = 0
+
+
+_MAX_SKETCH_WIDTH = 1 << 20
+
+
+class _WTinyLFUCache:
+    """
+    W-TinyLFU cache implementation, it is resistant to scans.
+
+    New keys enter small LRU window (1% of maxsize). The key that leaves the window is admitted to the main
+    segmented LRU (probation and protected, 80% of it, segments) only if its frequency, estimated by
+    count-min sketch, is higher than the frequency of the main victim. So one-off keys of the scan don't
+    wash the hot working set out. All operations are O(1).
+
+    If maxsize is `sys.maxsize` (the cache is limited by max_bytes only), the window, the protected segment
+    and the sketch are sized from the live entry count. The main segments have no fixed capacity, the entries
+    are evicted by `_evict()`, probation first, so the scan still doesn't reach the protected keys.
+    """
+
+    def __init__(self, maxsize: int, on_evict: Optional[Callable[[Any], None]] = None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict  # is called with the key evicted by the policy
+        self.adaptive = maxsize >= sys.maxsize
+        self.window_maxsize = max(1, maxsize // 100)
+        main_maxsize = maxsize - self.window_maxsize
+        self.protected_maxsize = int(main_maxsize * 0.8)
+        self.main_maxsize = main_maxsize
+        self.cache = {}
+        self.window = OrderedDict()  # keys are used as ordered sets
+        self.probation = OrderedDict()
+        self.protected = OrderedDict()
+        # in adaptive mode the sketch starts small and grows with the number of entries
+        self.sketch = _CountMinSketch(16 if self.adaptive else min(maxsize, _MAX_SKETCH_WIDTH))
+
+    def _window_limit(self) -> int:
+        if self.adaptive:
+            return max(1, len(self.cache) // 100)
+        return self.window_maxsize
+
+    def __getitem__(self, key: Any) -> Any:
         try:
-            _ = hash(key)
-            return key
-        except TypeError:
-            return HashableWrapper(key)
+            value = self.cache[key]
+        except KeyError:
+            raise KeyError(f"Key '{key}' not found in cache.") from None
+        self.sketch.increment(key)
+        self._on_access(key)
+        return value
 
-    async def __getitem__(self, key):
-        key = self._wrap_key(key)
+    def _on_access(self, key: Any):
+        if key in self.window:
+            self.window.move_to_end(key)
+        elif key in self.protected:
+            self.protected.move_to_end(key)
+        else:
+            # promote from probation to protected
+            del self.probation[key]
+            self.protected[key] = None
+            if not self.adaptive and len(self.protected) > self.protected_maxsize:
+                demoted, _ = self.protected.popitem(last=False)
+                self.probation[demoted] = None
 
-        async with self.lock:
-            current_time = time.perf_counter_ns()
-            if key in self.cache:
-                if self.ttl is not None:
-                    if current_time < self.expiry_times.get(key, float('inf')):
-                        # Cache hit
-                        self.hits += 1
-                        return self.cache[key]
-                    else:
-                        # Expired, remove it from both caches
-                        self.cache._evict()
-                        self.expiry_times.pop(key, None)
-                        self.misses += 1
-                        raise KeyError(f"Key '{key}' has expired.")
-                else:
-                    # Cache hit without TTL
-                    self.hits += 1
-                    return self.cache[key]
-            else:
-                self.misses += 1
-                raise KeyError(f"Key '{key}' not found in cache.")
+    def __setitem__(self, key: Any, value: Any):
+        self.sketch.increment(key)
+        if key in self.cache:
+            self.cache[key] = value
+            self._on_access(key)
+            return
 
-    async def __setitem__(self, key, value):
-        key = self._wrap_key(key)
+        self.cache[key] = value
+        self.window[key] = None
+        if self.adaptive and len(self.cache) > self.sketch.width and self.sketch.width < _MAX_SKETCH_WIDTH:
+            # the counts start over, it happens log(n) times only
+            self.sketch = _CountMinSketch(min(2 * len(self.cache), _MAX_SKETCH_WIDTH))
+        if len(self.window) > self._window_limit():
+            candidate, _ = self.window.popitem(last=False)
+            self._admit(candidate)
 
-        async with self.lock:
+    def _admit(self, candidate: Any):
+        if self.adaptive or len(self.probation) + len(self.protected) < self.main_maxsize:
+            self.probation[candidate] = None
+            return
+
+        segment = self.probation if self.probation else self.protected
+        victim = next(iter(segment), None)
+        if victim is not None and self.sketch.estimate(candidate) > self.sketch.estimate(victim):
+            del segment[victim]
+            self.probation[candidate] = None
+            self._drop(victim)
+        else:
+            self._drop(candidate)
+
+    def _drop(self, key: Any):
+        del self.cache[key]
+        if self.on_evict is not None:
+            self.on_evict(key)
+
+    def _evict(self):
+        if self.adaptive:
+            # the protected segment is rebalanced when the cache is full, not while it is still growing
+            protected_maxsize = int((len(self.cache) - len(self.window)) * 0.8)
+            while len(self.protected) > protected_maxsize:
+                demoted, _ = self.protected.popitem(last=False)
+                self.probation[demoted] = None
+        for segment in (self.probation, self.protected, self.window):
+            if segment:
+                evict_key, _ = segment.popitem(last=False)
+                self._drop(evict_key)
+                return evict_key
+        raise KeyError("Cache is empty.")
+
+    def pop(self, key: Any) -> Any:
+        """Removes exactly the given key, raises KeyError if it is absent."""
+        value = self.cache.pop(key)
+        for segment in (self.window, self.probation, self.protected):
+            if key in segment:
+                del segment[key]
+                break
+        return value
+
+    def dump_order(self):
+        """Yields (key, value, estimated frequency), probation first, then protected, then window."""
+        for segment in (self.probation, self.protected, self.window):
+            for key in segment:
+                yield key, self.cache[key], self.sketch.estimate(key)
+
+    def restore(self, key: Any, value: Any, meta: Any):
+        """Records the estimated frequency in the sketch before inserting, so the key passes admission."""
+        for _ in range(max(0, (meta or 0) - 1)):
+            self.sketch.increment(key)
+        self[key] = value
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self.cache
+
+    def clear(self):
+        self.cache.clear()
+        self.window.clear()
+        self.probation.clear()
+        self.protected.clear()
+        self.sketch.clear()
+
+
+class _SieveNode:
+    __slots__ = ('key', 'visited', 'prev', 'next')
+
+    def __init__(self, key: Any):
+        self.key = key
+        self.visited = False
+        self.prev = None  # towards the head (newer)
+        self.next = None  # towards the tail (older)
+
+
+class _SIEVECache:
+    """
+    SIEVE cache implementation, it is resistant to scans.
+
+    Keys are kept in insertion order (FIFO queue), hit only sets "visited" bit and doesn't move the key.
+    On eviction the hand moves from the tail (the oldest) to the head, clears visited bits and evicts the first
+    not visited key. New keys that are not accessed again (for example, by the scan) are evicted quickly,
+    while the hot keys stay. All operations are amortized O(1).
+    """
+
+    def __init__(self, maxsize: int, on_evict: Optional[Callable[[Any], None]] = None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict  # is called with the key evicted by the policy
+        self.cache = {}
+        self.nodes = {}
+        self.head = None  # the newest
+        self.tail = None  # the oldest
+        self.hand = None
+
+    def __getitem__(self, key: Any) -> Any:
+        try:
+            value = self.cache[key]
+        except KeyError:
+            raise KeyError(f"Key '{key}' not found in cache.") from None
+        self.nodes[key].visited = True
+        return value
+
+    def __setitem__(self, key: Any, value: Any):
+        if key in self.cache:
             self.cache[key] = value
-            if self.ttl is not None:
-                self.expiry_times[key] = time.perf_counter_ns() + self.ttl * 1e9  # ttl is in seconds, convert to ns
+            self.nodes[key].visited = True
+            return
+        if len(self.cache) >= self.maxsize:
+            self._evict()
+        self.cache[key] = value
+        node = _SieveNode(key)
+        node.next = self.head
+        if self.head is not None:
+            self.head.prev = node
+        self.head = node
+        if self.tail is None:
+            self.tail = node
+        self.nodes[key] = node
 
-    async def update_profiling(self, exec_time_ns):
-        async with self.lock:
-            self.total_calls += 1
-            self.total_time_ns += exec_time_ns
-            self.max_time_ns = max(self.max_time_ns, exec_time_ns)
-            self.min_time_ns = min(self.min_time_ns, exec_time_ns)
+    def _unlink(self, node: _SieveNode):
+        if node.prev is not None:
+            node.prev.next = node.next
+        else:
+            self.head = node.next
+        if node.next is not None:
+            node.next.prev = node.prev
+        else:
+            self.tail = node.prev
 
-    async def get_stats(self):
-        async with self.lock:
-            avg_time_ns = self.total_time_ns / self.total_calls if self.total_calls > 0 else 0.0
-            hit_miss_ratio = self.hits / (self.hits + self.misses) if (self.hits + self.misses) > 0 else 0.0
-            return {
-                'hits': self.hits,
-                'misses': self.misses,
-                'hit_miss_ratio': f"{hit_miss_ratio:.4f}",
-                'max_time': f"{self.max_time_ns / 1e9:.4f} s",
-                'min_time': f"{(self.min_time_ns / 1e9) if self.min_time_ns != float('inf') else 0.0:.4f} s",
-                'avg_time': f"{avg_time_ns / 1e9:.4f} s",
-                'total_calls': self.total_calls,
-                'current_size': len(self.cache),
-                'max_size': self.cache.maxsize,
-                'ttl_sec': f"{self.ttl:.4f}" if self.ttl is not None else "None"
-            }
+    def _evict(self):
+        node = self.hand if self.hand is not None else self.tail
+        if node is None:
+            raise KeyError("Cache is empty.")
+        while node.visited:
+            node.visited = False
+            node = node.prev if node.prev is not None else self.tail
+        self.hand = node.prev
+        self._unlink(node)
+        evict_key = node.key
+        del self.cache[evict_key]
+        del self.nodes[evict_key]
+        if self.on_evict is not None:
+            self.on_evict(evict_key)
+        return evict_key
 
-    async def clear(self):
-        """Clear the cache and reset all stats."""
-        async with self.lock:
-            self.cache.clear()
-            self.expiry_times.clear()
-            self.hits = 0
-            self.misses = 0
-            self.total_time_ns = 0
-            self.total_calls = 0
-            self.max_time_ns = 0
-            self.min_time_ns = float('inf')
+    def pop(self, key: Any) -> Any:
+        """Removes exactly the given key, raises KeyError if it is absent."""
+        value = self.cache.pop(key)
+        node = self.nodes.pop(key)
+        if self.hand is node:
+            self.hand = node.prev
+        self._unlink(node)
+        return value
 
+    def dump_order(self):
+        """Yields (key, value, visited), the oldest first."""
+        node = self.tail
+        while node is not None:
+            yield node.key, self.cache[node.key], node.visited
+            node = node.prev
 
+    def restore(self, key: Any, value: Any, meta: Any):
+        self[key] = value
+        if key in self.nodes:
+            self.nodes[key].visited = bool(meta)
 
+    def __len__(self) -> int:
+        return len(self.cache)
 
-_MAX_SIZE_SENTINEL = object()
-_TTL_SENTINEL = object()
+    def __contains__(self, key: Any) -> bool:
+        return key in self.cache
+
+    def clear(self):
+        self.cache.clear()
+        self.nodes.clear()
+        self.head = self.tail = self.hand = None
 
-def async_cache(maxsize=_MAX_SIZE_SENTINEL, ttl=_TTL_SENTINEL, policy="LFU"):
+
+_POLICIES = {
+    "LFU": _LFUCache,
+    "LRU": _LRUCache,
+    "W-TinyLFU": _WTinyLFUCache,
+    "SIEVE": _SIEVECache,
+}
+
+
+def register_policy(name: str, factory: Callable[..., CachePolicy]):
     """
-    A decorator to apply asynchronous caching to a function.
+    Registers the policy engine, so it can be used by name, for example, `AsyncCache(policy=name)`.
 
     Args:
-        maxsize (int): Maximum size of the cache.
-        ttl (Optional[int]): Time-to-Live for cache entries in seconds. Defaults to None.
-        policy (str): Cache eviction policy. Can be either "LFU" or "LRU". Defaults to "LFU".
+        name (str): Name of the policy.
+        factory: Callable that accepts maxsize and on_evict keyword arguments and returns `CachePolicy`,
+            for example, the engine class itself.
     """
-    kwargs = {}
-    if maxsize is not _MAX_SIZE_SENTINEL:
-        kwargs['maxsize'] = maxsize
-    if ttl is not _TTL_SENTINEL:
-        kwargs['ttl'] = ttl
+    _POLICIES[name] = factory
 
-    cache_instance = AsyncCache(**kwargs, policy=policy)
 
-    def decorator(fn):
-        @functools.wraps(fn)
-        async def wrapped_instance(*args, **kwargs):
-            if not args:
-                # No positional arguments; cache key based only on keyword arguments
-                cache_key = make_hashable((None, frozenset(kwargs.items())))
-            else:
-                # Check if the first argument is a class instance (indicating a bound method)
-                b = inspect.isclass(args[0].__class__)
-                if b:
-                    # The function is a method bound to an instance
-                    instance_id = id(args[0])
-                    cache_key = make_hashable((instance_id, args[1:], frozenset(kwargs.items())))
-                else:
-                    # The function is a standalone function
-                    cache_key = make_hashable((args, frozenset(kwargs.items())))
+def _create_policy(policy, maxsize: int, on_evict: Callable[[Any], None]) -> CachePolicy:
+    if isinstance(policy, str):
+        try:
+            factory = _POLICIES[policy]
+        except KeyError:
+            names = ", ".join(f"'{name}'" for name in _POLICIES)
+            raise ValueError(f"Invalid policy. Use one of {names} or CachePolicy factory.") from None
+    elif callable(policy):
+        factory = policy
+    else:
+        raise ValueError("Invalid policy. It should be policy name or CachePolicy factory.")
+    return factory(maxsize=maxsize, on_evict=on_evict)
 
-            # Try to get the result from the cache
+
+def _wrap_key(key: Any) -> Union[HashableWrapper, Any]:
+    try:
+        _ = hash(key)
+        return key
+    except TypeError:
+        return HashableWrapper(key)
+
+
+def deep_sizeof(obj: Any) -> int:
+    """
+    Estimates the memory (in bytes) occupied by the object together with the objects it references.
+
+    This is the default weigher of `AsyncCache(max_bytes=...)`.
+    Containers (dict, list, tuple, set, frozenset), instance `__dict__` and `__slots__` are traversed,
+    every object is counted once. For bytes-like objects and numpy arrays the size of the buffer is used
+    (numpy is not imported here, array is recognized by `nbytes` attribute).
+    """
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+
+        if isinstance(o, (str, bytes, bytearray, int, float, complex, bool)) or o is None:
+            size += sys.getsizeof(o)
+            continue
+        if isinstance(o, memoryview):
+            size += sys.getsizeof(o) + o.nbytes
+            continue
+        nbytes = getattr(o, 'nbytes', None)
+        if isinstance(nbytes, int) and type(o).__module__ == 'numpy':
+            # numpy counts the buffer in __sizeof__ only if the array owns it, the view keeps the buffer alive
+            owns_data = getattr(getattr(o, 'flags', None), 'owndata', True)
+            size += sys.getsizeof(o) + (0 if owns_data else nbytes)
+            if o.dtype.hasobject:
+                stack.extend(o.ravel().tolist())
+            continue
+
+        size += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        else:
+            d = getattr(o, '__dict__', None)
+            if d is not None:
+                stack.append(d)
+            for slots in (getattr(cls, '__slots__', ()) for cls in type(o).__mro__):
+                if isinstance(slots, str):
+                    slots = (slots,)
+                for name in slots:
+                    if name not in ('__dict__', '__weakref__') and hasattr(o, name):
+                        stack.append(getattr(o, name))
+    return size
+
+
+_SUB_BUCKET_BITS = 6
+_HALF_SUB_BUCKETS = 1 << (_SUB_BUCKET_BITS - 1)
+_HISTOGRAM_BUCKETS = (64 - _SUB_BUCKET_BITS + 2) * _HALF_SUB_BUCKETS
+_PERCENTILES = (('p50', 50.0), ('p90', 90.0), ('p99', 99.0), ('p999', 99.9))
+
+
+def _bucket_index(value: int) -> int:
+    """
+    Maps the value to the bucket of log-linear histogram (as HdrHistogram does). Values below 2**_SUB_BUCKET_BITS
+    have their own buckets, every next power of 2 is split into _HALF_SUB_BUCKETS linear buckets,
+    so the relative error is below 1/_HALF_SUB_BUCKETS (about 3%).
+    """
+    shift = value.bit_length() - _SUB_BUCKET_BITS
+    if shift <= 0:
+        return value
+    return shift * _HALF_SUB_BUCKETS + (value >> shift)
+
+
+def _bucket_upper_bound(index: int) -> int:
+    """Returns the highest value that is mapped to the bucket, see `_bucket_index()`."""
+    if index < 2 * _HALF_SUB_BUCKETS:
+        return index
+    shift = (index >> (_SUB_BUCKET_BITS - 1)) - 1
+    sub_bucket = index - shift * _HALF_SUB_BUCKETS
+    return ((sub_bucket + 1) << shift) - 1
+
+
+class _HistogramStripe:
+    """Counts of `LatencyHistogram` that are written by one thread only."""
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * _HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = float('inf')
+        self.max = 0
+
+
+class LatencySnapshot:
+    """
+    Immutable copy of `LatencyHistogram` counts. Snapshots of different histograms (for example, of shards)
+    can be combined by `merge()`.
+    """
+
+    def __init__(self, counts=None, count=0, total=0, min_value=float('inf'), max_value=0):
+        self.counts = counts if counts is not None else [0] * _HISTOGRAM_BUCKETS
+        self.count = count
+        self.total = total
+        self.min = min_value
+        self.max = max_value
+
+    def merge(self, other: 'LatencySnapshot') -> 'LatencySnapshot':
+        """Returns new snapshot with the counts of both snapshots."""
+        return LatencySnapshot([a + b for a, b in zip(self.counts, other.counts)], self.count + other.count,
+                               self.total + other.total, min(self.min, other.min), max(self.max, other.max))
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def percentile(self, percentile: float) -> int:
+        """
+        Returns the value (in ns) that is not exceeded by the given percent of the recorded values.
+        The value is the upper bound of its bucket (but not more than the maximal recorded value).
+        Returns 0 if nothing was recorded.
+        """
+        if self.count == 0:
+            return 0
+        rank = max(1, -(-int(percentile * self.count) // 100))  # ceil, 1-based
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(_bucket_upper_bound(index), self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        """Returns count, total, min, max, mean and p50/p90/p99/p999 (all in ns)."""
+        ret = {
+            'count': self.count,
+            'total_ns': self.total,
+            'min_ns': self.min if self.count > 0 else 0,
+            'max_ns': self.max,
+            'mean_ns': self.mean,
+        }
+        for name, percentile in _PERCENTILES:
+            ret[f"{name}_ns"] = self.percentile(percentile)
+        return ret
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram (in the style of HdrHistogram) with lock-free recording.
+
+    Every thread records to its own stripe, so `record()` doesn't take any lock and doesn't contend
+    with the cache traffic. `snapshot()` sums the stripes, it can be called at any time from any thread,
+    the value that is being recorded concurrently may be missed by it.
+    """
+
+    def __init__(self):
+        self._stripes = {}  # thread ident -> _HistogramStripe
+        self._stripes_lock = threading.Lock()
+
+    def _stripe(self) -> _HistogramStripe:
+        ident = threading.get_ident()
+        stripe = self._stripes.get(ident)
+        if stripe is None:
+            with self._stripes_lock:
+                stripe = self._stripes.setdefault(ident, _HistogramStripe())
+        return stripe
+
+    def record(self, value_ns: int):
+        stripe = self._stripe()
+        value_ns = max(0, int(value_ns))
+        stripe.counts[_bucket_index(value_ns)] += 1
+        stripe.count += 1
+        stripe.total += value_ns
+        if value_ns < stripe.min:
+            stripe.min = value_ns
+        if value_ns > stripe.max:
+            stripe.max = value_ns
+
+    def mean(self) -> float:
+        """Returns the mean of the recorded values without building the snapshot."""
+        stripes = list(self._stripes.values())
+        count = sum(stripe.count for stripe in stripes)
+        return sum(stripe.total for stripe in stripes) / count if count > 0 else 0.0
+
+    def snapshot(self) -> LatencySnapshot:
+        ret = LatencySnapshot()
+        for stripe in list(self._stripes.values()):
+            ret = ret.merge(LatencySnapshot(list(stripe.counts), stripe.count, stripe.total, stripe.min, stripe.max))
+        return ret
+
+    def reset(self):
+        with self._stripes_lock:
+            self._stripes = {}
+
+
+def _format_latency(snapshot: LatencySnapshot) -> dict:
+    return {name: f"{snapshot.percentile(percentile) / 1e9:.6f} s" for name, percentile in _PERCENTILES}
+
+
+def _format_stats(raw):
+    """Formats raw numeric stats (see `AsyncCache._raw_stats()`) as returned by `get_stats()`."""
+    miss_latency = raw['miss_latency']
+    hit_latency = raw['hit_latency']
+    total_calls = miss_latency.count
+    hits = raw['hits']
+    misses = raw['misses']
+    hit_miss_ratio = hits / (hits + misses) if (hits + misses) > 0 else 0.0
+    min_time_ns = miss_latency.min
+    ttl = raw['ttl']
+    stale_ttl = raw['stale_ttl']
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_miss_ratio': f"{hit_miss_ratio:.4f}",
+        'max_time': f"{miss_latency.max / 1e9:.4f} s",
+        'min_time': f"{(min_time_ns / 1e9) if min_time_ns != float('inf') else 0.0:.4f} s",
+        'avg_time': f"{miss_latency.mean / 1e9:.4f} s",
+        'miss_latency': _format_latency(miss_latency),
+        'hit_latency': _format_latency(hit_latency),
+        'total_calls': total_calls,
+        'current_size': raw['current_size'],
+        'max_size': raw['max_size'],
+        'current_bytes': raw['current_bytes'],
+        'max_bytes': raw['max_bytes'],
+        'expired': raw['expired'],
+        'stale_hits': raw['stale_hits'],
+        'refreshes': raw['refreshes'],
+        'failed_refreshes': raw['failed_refreshes'],
+        'l2_hits': raw['l2_hits'],
+        'l2_misses': raw['l2_misses'],
+        'invalidated': raw['invalidated'],
+        'early_refreshes': raw['early_refreshes'],
+        'ttl_sec': f"{ttl:.4f}" if ttl is not None else "None",
+        'stale_ttl_sec': f"{stale_ttl:.4f}" if stale_ttl is not None else "None"
+    }
+
+
+_DUMP_MAGIC = b'ABUCACHE'
+_DUMP_VERSION = 1
+_DUMP_HEADER = struct.Struct('>8sBd')  # magic, version, wall clock time of the dump
+_DUMP_RECORD_LENGTH = struct.Struct('>I')
+_LOAD_CHUNK_SIZE = 1024
+
+
+def _write_dump(path, records) -> int:
+    """
+    Writes the records (see `_BaseCache._dump_records()`) to the file, record by record.
+    The file is written to temporary file that replaces path at the end, so the previous dump stays intact
+    on failure. The record is length-prefixed pickle of (key, value, ttl left, policy metadata, tags).
+    The entry which key or value can't be pickled is skipped.
+
+    Returns:
+        int: Number of written entries.
+    """
+    written = 0
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_DUMP_HEADER.pack(_DUMP_MAGIC, _DUMP_VERSION, time.time()))
+        for record in records:
             try:
-                value = await cache_instance.__getitem__(cache_key)
-                return value
-            except KeyError:
-                pass
-            # Calculate the result and store it in the cache
-            start_time_ns = time.perf_counter_ns()
-            result = await fn(*args, **kwargs)
-            exec_time_ns = time.perf_counter_ns() - start_time_ns
-            await cache_instance.update_profiling(exec_time_ns)
-            await cache_instance.__setitem__(cache_key, result)
-            return result
+                data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                logger.debug("Entry %s can't be pickled, it is not dumped", record[0], exc_info=True)
+                continue
+            f.write(_DUMP_RECORD_LENGTH.pack(len(data)))
+            f.write(data)
+            written += 1
+    os.replace(tmp_path, path)
+    return written
+
+
+class _DumpReader:
+    """Reads the file written by `_write_dump()` in chunks of records."""
+
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        try:
+            header = self.f.read(_DUMP_HEADER.size)
+            if len(header) != _DUMP_HEADER.size:
+                raise ValueError(f"{path} is not cache dump.")
+            magic, version, self.dumped_at = _DUMP_HEADER.unpack(header)
+            if magic != _DUMP_MAGIC:
+                raise ValueError(f"{path} is not cache dump.")
+            if version != _DUMP_VERSION:
+                raise ValueError(f"Unsupported version {version} of cache dump {path}.")
+        except BaseException:
+            self.f.close()
+            raise
+
+    def read_chunk(self, size: int) -> list:
+        records = []
+        while len(records) < size:
+            prefix = self.f.read(_DUMP_RECORD_LENGTH.size)
+            if len(prefix) < _DUMP_RECORD_LENGTH.size:
+                break
+            (length,) = _DUMP_RECORD_LENGTH.unpack(prefix)
+            data = self.f.read(length)
+            if len(data) < length:
+                logger.warning("Cache dump %s is truncated", self.f.name)
+                break
+            records.append(pickle.loads(data))
+        return records
+
+    def close(self):
+        self.f.close()
+
+
+async def _warm_up(cache_instance, keys, loader: Callable[[Any], Awaitable[Any]], concurrency: int) -> int:
+    """See `AsyncCache.warm_up()`."""
+    if concurrency < 1:
+        raise ValueError("concurrency should be positive.")
+    keys = iter(keys)
+    loaded = 0
+
+    async def worker():
+        nonlocal loaded
+        for key in keys:  # the iterator is shared, so every key is taken by one worker
+            try:
+                value = await loader(key)
+            except Exception:
+                logger.warning("Warm up of %s failed", key, exc_info=True)
+                continue
+            await cache_instance.__setitem__(key, value)
+            loaded += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return loaded
+
+
+def _has_method(obj: Any, name: str) -> bool:
+    """Checks that the class of obj defines the method (instance attributes, for example, of mocks, don't count)."""
+    return callable(getattr(type(obj), name, None))
+
+
+def _add_invalidation_listener(l2, callback):
+    """Registers the callback of L1 in L2 tier, if the tier sends invalidation messages (see `CacheTier`)."""
+    if _has_method(l2, 'add_invalidation_listener'):
+        l2.add_invalidation_listener(callback)
+
+
+class _BaseCache:
+    """
+    State and logic shared by `AsyncCache` and `SyncCache`: the policy engine, TTL expiry index,
+    byte budget and stats. Methods of this class should be called with the lock acquired.
+    """
+
+    def __init__(self, maxsize=None, ttl=None, policy="LFU", stale_ttl=None, l2=None, max_bytes=None,
+                 weigher=None, early_refresh_beta=None, ttl_jitter=None):
+        if stale_ttl is not None and ttl is None:
+            raise ValueError("stale_ttl requires ttl.")
+        if (early_refresh_beta is not None or ttl_jitter is not None) and ttl is None:
+            raise ValueError("early_refresh_beta and ttl_jitter require ttl.")
+        if early_refresh_beta is not None and early_refresh_beta <= 0:
+            raise ValueError("early_refresh_beta should be positive.")
+        if ttl_jitter is not None and not 0 <= ttl_jitter < 1:
+            raise ValueError("ttl_jitter should be in [0, 1).")
+        if maxsize is None and max_bytes is None:
+            raise ValueError("maxsize or max_bytes should be set.")
+        self.cache = _create_policy(policy, maxsize if maxsize is not None else sys.maxsize, self._forget)
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.weigher = weigher if weigher is not None else deep_sizeof
+        self.weights = {}  # To track weights of keys when max_bytes is not None
+        self.current_bytes = 0
+
+        self.ttl = ttl
+        self._ttl_ns = int(ttl * 1e9) if ttl is not None else None  # ttl is in seconds, convert to ns
+        self.stale_ttl = stale_ttl
+        self._stale_ns = int(stale_ttl * 1e9) if stale_ttl is not None else 0
+        self.early_refresh_beta = early_refresh_beta
+        self.ttl_jitter = ttl_jitter
+        self.compute_times = {}  # key -> recompute time in ns, used only if early_refresh_beta is set
+        self.l2 = l2
+        self.expiry_times = {}  # To track expiry times of keys when ttl is not None or per-entry ttl was used
+        # True if the entries may expire: the cache has ttl or some entry was stored with its own ttl
+        self._expiring = ttl is not None
+        # min-heap of (expiry time, sequence number, key), entries that doesn't match expiry_times are outdated
+        self._expiry_heap = []
+        self._expiry_seq = itertools.count()
+        self.tag_index = {}  # tag -> set of keys
+        self.key_tags = {}  # key -> frozenset of tags, only for tagged keys
+        self.lock = RLock()
+        self.miss_latency = LatencyHistogram()  # execution time of the wrapped function
+        self.hit_latency = LatencyHistogram()
+        self._reset_stats()
+
+    def _wrap_key(self, key: Any) -> Union[HashableWrapper, Any]:
+        return _wrap_key(key)
+
+    def _forget(self, key: Any):
+        """Drops the metadata of the key that is no longer in the policy engine."""
+        self.expiry_times.pop(key, None)
+        if self.max_bytes is not None:
+            self.current_bytes -= self.weights.pop(key, 0)
+        if self.early_refresh_beta is not None:
+            self.compute_times.pop(key, None)
+        if self.key_tags:
+            self._untag(key)
+
+    def _untag(self, key: Any):
+        for tag in self.key_tags.pop(key, ()):
+            keys = self.tag_index[tag]
+            keys.discard(key)
+            if not keys:
+                del self.tag_index[tag]
+
+    def _tag(self, key: Any, tags):
+        """Replaces the tags of the stored key. Should be called with the lock acquired."""
+        if self.key_tags:
+            self._untag(key)
+        if not tags or key not in self.cache:
+            return
+        tags = frozenset(tags)
+        self.key_tags[key] = tags
+        for tag in tags:
+            self.tag_index.setdefault(tag, set()).add(key)
+
+    def _invalidate_tag(self, tag: Any) -> list:
+        """
+        Removes all entries with the tag, O(number of them). Should be called with the lock acquired.
+
+        Returns:
+            list: Removed keys.
+        """
+        keys = list(self.tag_index.get(tag, ()))
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+        return keys
+
+    def _invalidate_where(self, predicate: Callable[[Any, Any], bool]) -> list:
+        """
+        Removes all entries for which predicate(key, value) is true, all entries are checked.
+        Should be called with the lock acquired.
+
+        Returns:
+            list: Removed keys.
+        """
+        keys = [key for key, value in self._entries() if predicate(key, value)]
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+        return keys
+
+    def _entries(self):
+        """Yields (key, value) of all entries without recording the access."""
+        dump_order = getattr(self.cache, 'dump_order', None)
+        if dump_order is None:
+            raise TypeError(f"Policy {type(self.cache).__qualname__} doesn't support iteration, "
+                            f"it should implement dump_order().")
+        for key, value, _ in dump_order():
+            yield key, value
+
+    def _remove(self, key: Any):
+        """Removes exactly the given key from the cache."""
+        self.cache.pop(key)
+        self._forget(key)
+
+    def _purge_expired(self, current_time: int) -> int:
+        """
+        Removes all entries which expiry time (plus stale_ttl grace window) is not after current_time.
+        Should be called with the lock acquired.
+
+        Returns:
+            int: Number of purged entries.
+        """
+        heap = self._expiry_heap
+        purged = 0
+        deadline = current_time - self._stale_ns
+        while heap and heap[0][0] <= deadline:
+            expiry_time, _, key = heapq.heappop(heap)
+            if self.expiry_times.get(key) == expiry_time:
+                self._remove(key)
+                purged += 1
+        self.expirations += purged
+
+        # outdated entries (of overwritten or evicted keys) are dropped lazily, compact if they dominate
+        if len(heap) > 2 * len(self.expiry_times) + 64:
+            self._expiry_heap = [entry for entry in heap if self.expiry_times.get(entry[2]) == entry[0]]
+            heapq.heapify(self._expiry_heap)
+        return purged
+
+    def _lookup(self, key: Any, current_time: int, allow_stale: bool):
+        """
+        Returns (value, is_stale) or raises KeyError. Should be called with the lock acquired.
+        """
+        if key not in self.cache:
+            self.misses += 1
+            raise KeyError(f"Key '{key}' not found in cache.")
+
+        if self._expiring:
+            expiry_time = self.expiry_times.get(key, float('inf'))
+            if current_time >= expiry_time:
+                if current_time < expiry_time + self._stale_ns:
+                    if allow_stale:
+                        # Cache hit on expired value within the grace window
+                        self.hits += 1
+                        self.stale_hits += 1
+                        return self.cache[key], True
+                else:
+                    # Expired, remove exactly this key
+                    self._remove(key)
+                    self.expirations += 1
+                self.misses += 1
+                raise KeyError(f"Key '{key}' has expired.")
+            if allow_stale and self.early_refresh_beta is not None and \
+                    self._should_refresh_early(key, current_time, expiry_time):
+                # Cache hit, but the caller should refresh the value before it expires
+                self.hits += 1
+                self.early_refreshes += 1
+                return self.cache[key], True
+
+        # Cache hit
+        self.hits += 1
+        return self.cache[key], False
+
+    def _put(self, key: Any, value: Any, meta: Any = _MISSING):
+        if meta is _MISSING:
+            self.cache[key] = value
+        else:
+            self.cache.restore(key, value, meta)
+
+    def _should_refresh_early(self, key: Any, current_time: int, expiry_time: int) -> bool:
+        """
+        Probabilistic early expiration (XFetch): the key is refreshed if
+        `current_time - delta * beta * ln(rand()) >= expiry_time`, where delta is the recompute time of the key.
+        The closer the expiry and the longer the recompute, the more probable the refresh is,
+        so the key is refreshed by single caller before it expires.
+        """
+        delta = self.compute_times.get(key)
+        if delta is None:
+            delta = self.miss_latency.mean()
+        if not delta:
+            return False
+        # 1 - random() is in (0, 1], so log() is defined
+        return current_time - delta * self.early_refresh_beta * math.log(1.0 - random.random()) >= expiry_time
+
+    def _store(self, key: Any, value: Any, current_time: int, ttl_ns: Optional[int] = None, meta: Any = _MISSING,
+               tags=None, compute_time_ns: Optional[int] = None):
+        """
+        Stores the value in L1. ttl_ns overrides the ttl of the cache (for example, for negative entries),
+        it is used even if the cache has no ttl.
+        meta is the policy metadata of the restored entry, see `CachePolicy.restore()`.
+        tags (iterable) replace the tags of the key. compute_time_ns is the recompute time of the value,
+        it is used by early refresh.
+        Should be called with the lock acquired.
+        """
+        if self._expiring:
+            # expired entries should free their slots before the policy evicts live one
+            self._purge_expired(current_time)
+
+        if self.max_bytes is not None:
+            if not self._store_weight(key, value, meta):
+                return
+        else:
+            self._put(key, value, meta)
+            if key not in self.cache:
+                # the policy (for example, W-TinyLFU admission) rejected the key
+                return
+
+        if tags or self.key_tags:
+            self._tag(key, tags)
+
+        if ttl_ns is not None:
+            self._expiring = True
+        elif self.ttl is None:
+            if self._expiring:
+                # the entry that was stored with its own ttl is overwritten by the entry that never expires
+                self.expiry_times.pop(key, None)
+            return
+
+        if ttl_ns is None:
+            ttl_ns = self._ttl_ns
+            if self.ttl_jitter:
+                # spread the expiry of entries inserted together
+                ttl_ns = int(ttl_ns * (1.0 - random.random() * self.ttl_jitter))
+        expiry_time = current_time + ttl_ns
+        self.expiry_times[key] = expiry_time
+        if self.early_refresh_beta is not None and compute_time_ns is not None:
+            self.compute_times[key] = compute_time_ns
+        heapq.heappush(self._expiry_heap, (expiry_time, next(self._expiry_seq), key))
+
+    def _store_weight(self, key: Any, value: Any, meta: Any = _MISSING) -> bool:
+        """
+        Stores the value in L1 and evicts entries until the cache fits max_bytes.
+        Should be called with the lock acquired.
+
+        Returns:
+            bool: False if the value is heavier than max_bytes, so it was not stored.
+        """
+        weight = self.weigher(value)
+        if weight > self.max_bytes:
+            logger.debug("Value of %s weights %d bytes, it is more than max_bytes, it is not cached", key, weight)
+            if key in self.cache:
+                self._remove(key)
+            return False
+
+        self._put(key, value, meta)  # may evict other key by count
+        if key not in self.cache:
+            # the policy (for example, W-TinyLFU admission) rejected the key
+            return False
+        self.current_bytes += weight - self.weights.get(key, 0)
+        self.weights[key] = weight
+        while self.current_bytes > self.max_bytes:
+            self.cache._evict()  # on_evict updates current_bytes
+        return key in self.cache
+
+    def _dump_records(self, current_time: int) -> list:
+        """
+        Returns [(key, value, ttl left in seconds or None, policy metadata, tags)] of all live entries, the next
+        victim first. Should be called with the lock acquired.
+        """
+        dump_order = getattr(self.cache, 'dump_order', None)
+        if dump_order is None:
+            raise TypeError(f"Policy {type(self.cache).__qualname__} doesn't support dump, "
+                            f"it should implement dump_order() and restore().")
+        records = []
+        for key, value, meta in dump_order():
+            ttl_left = None
+            if self._expiring:
+                expiry_time = self.expiry_times.get(key)
+                if expiry_time is not None:
+                    if expiry_time <= current_time:
+                        continue
+                    ttl_left = (expiry_time - current_time) / 1e9
+            records.append((key, value, ttl_left, meta, self.key_tags.get(key)))
+        return records
+
+    def _restore(self, records, current_time: int, elapsed: float) -> int:
+        """
+        Stores the records read by `_DumpReader`, elapsed is the time (in seconds) passed since the dump.
+        Should be called with the lock acquired.
+
+        Returns:
+            int: Number of restored entries.
+        """
+        restored = 0
+        for key, value, ttl_left, meta, tags in records:
+            ttl_ns = None
+            if ttl_left is not None:
+                ttl_left -= elapsed
+                if ttl_left <= 0:
+                    continue
+                ttl_ns = int(ttl_left * 1e9)
+                if self._ttl_ns is not None:
+                    ttl_ns = min(self._ttl_ns, ttl_ns)
+            if not hasattr(self.cache, 'restore'):
+                meta = _MISSING
+            self._store(key, value, current_time, ttl_ns, meta, tags)
+            restored += 1
+        return restored
+
+    def _update_profiling(self, exec_time_ns, hit=False):
+        """Records the latency, doesn't require the lock."""
+        if hit:
+            self.hit_latency.record(exec_time_ns)
+        else:
+            self.miss_latency.record(exec_time_ns)
+
+    def latency_stats(self) -> dict:
+        """
+        Returns latency percentiles (in ns) of misses (execution time of the wrapped function) and of hits.
+        It doesn't take the lock, so it can be scraped periodically without blocking the cache traffic,
+        see `export_latency_periodically()`.
+
+        Returns:
+            dict: {'misses': {...}, 'hits': {...}}, see `LatencySnapshot.to_dict()`.
+        """
+        return {'misses': self.miss_latency.snapshot().to_dict(), 'hits': self.hit_latency.snapshot().to_dict()}
+
+    def _raw_stats(self):
+        """Returns numeric stats. Should be called with the lock acquired."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_hits': self.stale_hits,
+            'refreshes': self.refreshes,
+            'failed_refreshes': self.failed_refreshes,
+            'miss_latency': self.miss_latency.snapshot(),
+            'hit_latency': self.hit_latency.snapshot(),
+            'current_size': len(self.cache),
+            'max_size': self.maxsize,
+            'current_bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
+            'expired': self.expirations,
+            'l2_hits': self.l2_hits,
+            'l2_misses': self.l2_misses,
+            'invalidated': self.invalidations,
+            'early_refreshes': self.early_refreshes,
+            'ttl': self.ttl,
+            'stale_ttl': self.stale_ttl,
+        }
+
+    def _release(self):
+        """
+        Drops all L1 entries. Should be called with the lock acquired
+        or when the cache is no longer reachable by its users.
+        """
+        self.cache.clear()
+        self.expiry_times.clear()
+        self._expiry_heap.clear()
+        self.weights.clear()
+        self.current_bytes = 0
+        self.tag_index.clear()
+        self.key_tags.clear()
+        self.compute_times.clear()
+        self._expiring = self.ttl is not None
+
+    def _reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.failed_refreshes = 0
+        self.expirations = 0
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.invalidations = 0
+        self.early_refreshes = 0
+        self.miss_latency.reset()
+        self.hit_latency.reset()
+
+
+class AsyncCache(_BaseCache):
+    """
+    An asynchronous cache that supports LFU (Least Frequently Used), LRU (Least Recently Used),
+    scan-resistant W-TinyLFU and SIEVE eviction policies (or custom `CachePolicy`)
+    and an optional Time-to-Live (TTL) for cache entries.
+
+    Expired entries are purged proactively: expiry times are indexed by min-heap,
+    every write purges the entries whose TTL has passed (amortized O(log n) per entry)
+    before the policy is asked to evict anything. `purge_expired()` can be also called
+    explicitly, for example, from a periodic background task.
+
+    If `stale_ttl` is set, the expired entry is kept for `stale_ttl` more seconds (the grace window).
+    Within this window `lookup()` returns it marked as stale and the caller is expected to
+    refresh it in the background, see `schedule_refresh()`.
+
+    If `l2` tier is set (see `cache_tiers.py`), on L1 (in-memory) miss the L2 tier is checked
+    before reporting miss, the L2 hit is promoted to L1. Every write is written through to L2.
+    Failures of L2 tier are logged and treated as misses. If L2 is remote (see `RespCacheTier`), L1 is near cache,
+    the keys changed by other nodes are dropped from it on invalidation messages of the tier.
+
+    If `max_bytes` is set, the entries are weighted (see `deep_sizeof()`) and the policy evicts entries
+    until the total weight of the cache fits the budget. The value that is heavier than the whole budget
+    is not stored.
+
+    Latencies of misses and hits are recorded to lock-free `LatencyHistogram`s, `get_stats()` reports
+    their p50/p90/p99/p999, `latency_stats()` returns them without taking the lock.
+
+    If `early_refresh_beta` is set, `lookup()` marks the live entry as stale with probability that grows
+    as its expiry approaches (XFetch, probabilistic early recomputation), so it is refreshed by single caller
+    before it expires. `ttl_jitter` spreads the expiry of entries inserted together.
+    """
+
+    def __init__(self, maxsize=None, ttl=None, policy="LFU", stale_ttl=None, l2=None, max_bytes=None,
+                 weigher=None, early_refresh_beta=None, ttl_jitter=None):
+        """
+        Initializes the AsyncCache with the given parameters.
+
+        Args:
+            maxsize (Optional[int]): Maximum number of entries in the cache. Can be None only if max_bytes is set.
+            ttl (Optional[int]): Time-to-Live for cache entries in seconds. Defaults to None.
+            policy (str or callable): Cache eviction policy. Can be "LFU", "LRU", "W-TinyLFU", "SIEVE",
+                another name registered by `register_policy()` or `CachePolicy` factory. Defaults to "LFU".
+            stale_ttl (Optional[int]): Grace window in seconds after TTL expiry, within it
+                the expired value can still be served while it is being refreshed. Requires ttl. Defaults to None.
+            l2 (Optional[CacheTier]): Second-level tier, for example, `SqliteCacheTier`. Defaults to None.
+            max_bytes (Optional[int]): Memory budget of the cache in bytes. Defaults to None.
+            weigher (Optional[Callable[[Any], int]]): Returns the weight (in bytes) of the value,
+                it is used only if max_bytes is set. Defaults to `deep_sizeof()`.
+            early_refresh_beta (Optional[float]): Enables probabilistic early refresh. The larger it is,
+                the earlier the entry is refreshed, 1.0 is good default. Requires ttl. Defaults to None.
+            ttl_jitter (Optional[float]): Fraction in [0, 1), ttl of every entry is reduced by random part of it.
+                Requires ttl. Defaults to None.
+        """
+        super().__init__(maxsize=maxsize, ttl=ttl, policy=policy, stale_ttl=stale_ttl, l2=l2, max_bytes=max_bytes,
+                         weigher=weigher, early_refresh_beta=early_refresh_beta, ttl_jitter=ttl_jitter)
+        # (event loop, key) -> asyncio.Task of the background refresh
+        self._refreshing = {}
+        if l2 is not None:
+            _add_invalidation_listener(l2, self._on_l2_invalidation)
+
+    async def _on_l2_invalidation(self, key):
+        """
+        Is called by L2 tier (for example, `RespCacheTier`) when the key was changed by another node,
+        drops it from L1 (None means all keys).
+        """
+        async with self.lock:
+            if key is None:
+                self.invalidations += len(self.cache)
+                self._release()
+            elif key in self.cache:
+                self._remove(key)
+                self.invalidations += 1
+
+    async def __getitem__(self, key):
+        key = self._wrap_key(key)
+
+        async with self.lock:
+            try:
+                value, _ = self._lookup(key, time.perf_counter_ns(), allow_stale=False)
+                return value
+            except KeyError:
+                if self.l2 is None:
+                    raise
+        return await self._l2_lookup(key)
+
+    def _l2_ttl_ns(self, ttl_left):
+        """
+        Returns ttl (in ns) of the entry promoted from L2. The remaining ttl of L2 entry is kept even if the cache
+        has no ttl, the entry may have its own one (for example, negative entry).
+        """
+        if ttl_left is None:
+            return None
+        ttl_ns = int(ttl_left * 1e9)
+        if self._ttl_ns is not None:
+            ttl_ns = min(self._ttl_ns, ttl_ns)
+        return ttl_ns
+
+    async def _l2_lookup(self, key):
+        """Looks the key up in L2 tier and promotes it to L1 on hit. Raises KeyError on miss."""
+        try:
+            value, ttl_left = await self.l2.get(key)
+        except KeyError:
+            async with self.lock:
+                self.l2_misses += 1
+            raise
+        except Exception:
+            logger.warning("L2 lookup of %s failed", key, exc_info=True)
+            async with self.lock:
+                self.l2_misses += 1
+            raise KeyError(f"Key '{key}' not found in cache.") from None
+
+        async with self.lock:
+            self.l2_hits += 1
+            self._store(key, value, time.perf_counter_ns(), self._l2_ttl_ns(ttl_left))
+        return value
+
+    async def lookup(self, key):
+        """
+        Like `__getitem__()`, but within stale_ttl grace window the expired value is returned too.
+        If early_refresh_beta is set, the live value that was chosen for early refresh is marked as stale too.
+
+        Returns:
+            tuple: (value, is_stale).
+        Raises:
+            KeyError: If the key is not found or it is expired (and is not within grace window).
+        """
+        key = self._wrap_key(key)
+
+        async with self.lock:
+            try:
+                return self._lookup(key, time.perf_counter_ns(), allow_stale=True)
+            except KeyError:
+                if self.l2 is None:
+                    raise
+        return await self._l2_lookup(key), False
+
+    async def schedule_refresh(self, key, loader: Callable[[], Awaitable[Any]]) -> bool:
+        """
+        Schedules single background refresh of the key, if it is not being refreshed already.
+
+        Args:
+            key: The cache key.
+            loader: Coroutine function without arguments that recomputes the value and stores it in the cache.
+
+        Returns:
+            bool: True if the refresh was scheduled, False if the key is being refreshed already.
+        """
+        key = self._wrap_key(key)
+        flight_key = (asyncio.get_running_loop(), key)
+
+        async with self.lock:
+            if flight_key in self._refreshing:
+                return False
+            self.refreshes += 1
+            self._refreshing[flight_key] = asyncio.ensure_future(self._refresh(flight_key, loader))
+            return True
+
+    async def _refresh(self, flight_key, loader):
+        try:
+            await loader()
+        except Exception:
+            logger.warning("Background refresh of %s failed", flight_key[1], exc_info=True)
+            async with self.lock:
+                self.failed_refreshes += 1
+        finally:
+            self._refreshing.pop(flight_key, None)
+
+    async def __setitem__(self, key, value, tags=None, compute_time_ns=None, ttl=None):
+        """
+        Stores the value, tags (iterable, optional) are used by `invalidate_tag()`,
+        compute_time_ns (optional) is the recompute time of the value, it is used by early refresh.
+        ttl (optional, in seconds) overrides the ttl of the cache for this entry (for example, for negative entry),
+        it is applied even if the cache has no ttl.
+        """
+        key = self._wrap_key(key)
+
+        async with self.lock:
+            self._store(key, value, time.perf_counter_ns(), ttl_ns=int(ttl * 1e9) if ttl is not None else None,
+                        tags=tags, compute_time_ns=compute_time_ns)
+
+        if self.l2 is not None:
+            try:
+                await self.l2.set(key, value, ttl=ttl if ttl is not None else self.ttl)
+            except Exception:
+                logger.warning("L2 write of %s failed", key, exc_info=True)
+
+    async def get_many(self, keys) -> dict:
+        """
+        Like `__getitem__()` for many keys at once, L1 is looked up under single lock acquisition,
+        L1 misses are looked up in L2 tier concurrently.
+
+        Returns:
+            dict: key -> value for the found keys only (unhashable key is wrapped by `HashableWrapper`).
+        """
+        found = {}
+        missing = []
+        async with self.lock:
+            current_time = time.perf_counter_ns()
+            for key in keys:
+                key = self._wrap_key(key)
+                try:
+                    found[key], _ = self._lookup(key, current_time, allow_stale=False)
+                except KeyError:
+                    missing.append(key)
+
+        if self.l2 is not None and missing:
+            if _has_method(self.l2, 'get_many'):
+                found.update(await self._l2_lookup_many(missing))
+            else:
+                results = await asyncio.gather(*(self._l2_lookup(key) for key in missing), return_exceptions=True)
+                for key, result in zip(missing, results):
+                    if not isinstance(result, BaseException):
+                        found[key] = result
+        return found
+
+    async def _l2_lookup_many(self, keys) -> dict:
+        """Looks the keys up in L2 tier by single `get_many()` (pipelined) and promotes the hits to L1."""
+        try:
+            results = await self.l2.get_many(keys)
+        except Exception:
+            logger.warning("L2 lookup of %d keys failed", len(keys), exc_info=True)
+            results = {}
+
+        found = {}
+        async with self.lock:
+            current_time = time.perf_counter_ns()
+            self.l2_hits += len(results)
+            self.l2_misses += len(keys) - len(results)
+            for key, (value, ttl_left) in results.items():
+                self._store(key, value, current_time, self._l2_ttl_ns(ttl_left))
+                found[key] = value
+        return found
+
+    async def set_many(self, items):
+        """
+        Like `__setitem__()` for many entries at once, L1 is updated under single lock acquisition.
+
+        Args:
+            items: Mapping or iterable of (key, value) pairs.
+        """
+        if is_mapping(items):
+            items = items.items()
+        items = [(self._wrap_key(key), value) for key, value in items]
+
+        async with self.lock:
+            current_time = time.perf_counter_ns()
+            for key, value in items:
+                self._store(key, value, current_time)
+
+        if self.l2 is not None and _has_method(self.l2, 'set_many'):
+            try:
+                await self.l2.set_many(items, ttl=self.ttl)
+            except Exception:
+                logger.warning("L2 write of %d entries failed", len(items), exc_info=True)
+        elif self.l2 is not None:
+            results = await asyncio.gather(*(self.l2.set(key, value, ttl=self.ttl) for key, value in items),
+                                           return_exceptions=True)
+            for (key, _), result in zip(items, results):
+                if isinstance(result, Exception):
+                    logger.warning("L2 write of %s failed", key, exc_info=result)
+
+    async def invalidate_tag(self, tag) -> int:
+        """
+        Removes all entries with the tag (from L2 tier too), in time proportional to their number.
+        Stats are not reset.
+
+        Returns:
+            int: Number of removed entries.
+        """
+        async with self.lock:
+            keys = self._invalidate_tag(tag)
+        await self._l2_delete(keys)
+        return len(keys)
+
+    async def invalidate_where(self, predicate: Callable[[Any, Any], bool]) -> int:
+        """
+        Removes all entries for which predicate(key, value) returns true (from L2 tier too).
+        Every entry is checked, so it is O(size of the cache), prefer `invalidate_tag()`. Stats are not reset.
+
+        Returns:
+            int: Number of removed entries.
+        """
+        async with self.lock:
+            keys = self._invalidate_where(predicate)
+        await self._l2_delete(keys)
+        return len(keys)
+
+    async def _l2_delete(self, keys):
+        if self.l2 is None or not keys:
+            return
+        results = await asyncio.gather(*(self.l2.delete(key) for key in keys), return_exceptions=True)
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                logger.warning("L2 delete of %s failed", key, exc_info=result)
+
+    async def dump(self, path, executor=None) -> int:
+        """
+        Writes all live entries with their remaining TTL and policy metadata (frequency, recency order)
+        to the file in compact binary format, see `load()`. The entries are collected under the lock,
+        the file is written off the event loop. Keys and values should be picklable, keys that contain
+        `id()` (of `self` of the method) are meaningless in another process.
+
+        Args:
+            path: Path of the file.
+            executor: Executor for the file I/O, see `exec_in_executor()`. Defaults to None.
+
+        Returns:
+            int: Number of dumped entries.
+        """
+        async with self.lock:
+            records = self._dump_records(time.perf_counter_ns())
+        return await exec_in_executor(executor, _write_dump, path, records)
+
+    async def load(self, path, executor=None) -> int:
+        """
+        Loads the entries written by `dump()`. The file is read off the event loop in chunks, every chunk
+        is stored under single lock acquisition. Remaining TTL is reduced by the time passed since the dump,
+        the entries that expired meanwhile are skipped. The file should be trusted (it is unpickled).
+
+        Returns:
+            int: Number of loaded entries.
+        """
+        reader = await exec_in_executor(executor, _DumpReader, path)
+        try:
+            loaded = 0
+            while True:
+                records = await exec_in_executor(executor, reader.read_chunk, _LOAD_CHUNK_SIZE)
+                if not records:
+                    return loaded
+                async with self.lock:
+                    loaded += self._restore(records, time.perf_counter_ns(), time.time() - reader.dumped_at)
+        finally:
+            reader.close()
+
+    async def warm_up(self, keys, loader: Callable[[Any], Awaitable[Any]], concurrency: int = 8) -> int:
+        """
+        Fills the cache at startup, for example, with the hottest keys. Up to concurrency values are loaded
+        in parallel. Failures of the loader are logged, the key is skipped.
+
+        Args:
+            keys: Iterable of keys.
+            loader: Coroutine function that returns the value of the key.
+            concurrency (int): Maximum number of concurrent calls of the loader. Defaults to 8.
+
+        Returns:
+            int: Number of loaded entries.
+        """
+        return await _warm_up(self, keys, loader, concurrency)
+
+    async def purge_expired(self) -> int:
+        """
+        Removes all expired entries.
+
+        Returns:
+            int: Number of purged entries.
+        """
+        async with self.lock:
+            if not self._expiring:
+                return 0
+            return self._purge_expired(time.perf_counter_ns())
+
+    async def update_profiling(self, exec_time_ns, hit=False):
+        """Records the latency of the miss (execution time) or of the hit, it doesn't take the lock."""
+        self._update_profiling(exec_time_ns, hit=hit)
+
+    async def get_stats(self):
+        async with self.lock:
+            return _format_stats(self._raw_stats())
+
+    async def clear(self):
+        """Clear the cache (including L2 tier) and reset all stats."""
+        if self.l2 is not None:
+            await self.l2.clear()
+        async with self.lock:
+            self._release()
+            self._reset_stats()
+
+
+class SyncCache(_BaseCache):
+    """
+    A thread-safe synchronous cache, the counterpart of `AsyncCache` for the code that runs in threads,
+    for example, in `exec_in_executor()` workers.
+
+    It uses the same policy engines, TTL expiry index, byte budget and stats as `AsyncCache`,
+    the synchronous side of `RLock` is used. `stale_ttl` and `l2` are not supported (L2 tiers are asynchronous).
+    """
+
+    def __init__(self, maxsize=None, ttl=None, policy="LFU", max_bytes=None, weigher=None, ttl_jitter=None):
+        """
+        Initializes the SyncCache with the given parameters.
+
+        Args:
+            maxsize (Optional[int]): Maximum number of entries in the cache. Can be None only if max_bytes is set.
+            ttl (Optional[int]): Time-to-Live for cache entries in seconds. Defaults to None.
+            policy (str or callable): Cache eviction policy, see `AsyncCache`. Defaults to "LFU".
+            max_bytes (Optional[int]): Memory budget of the cache in bytes. Defaults to None.
+            weigher (Optional[Callable[[Any], int]]): Returns the weight (in bytes) of the value,
+                it is used only if max_bytes is set. Defaults to `deep_sizeof()`.
+            ttl_jitter (Optional[float]): Fraction in [0, 1), ttl of every entry is reduced by random part of it,
+                see `AsyncCache`. Defaults to None.
+        """
+        super().__init__(maxsize=maxsize, ttl=ttl, policy=policy, max_bytes=max_bytes, weigher=weigher,
+                         ttl_jitter=ttl_jitter)
+
+    def __getitem__(self, key):
+        key = self._wrap_key(key)
+
+        with self.lock:
+            value, _ = self._lookup(key, time.perf_counter_ns(), allow_stale=False)
+            return value
+
+    def __setitem__(self, key, value, tags=None, ttl=None):
+        """
+        Stores the value, tags (iterable, optional) are used by `invalidate_tag()`,
+        ttl (optional, in seconds) overrides the ttl of the cache for this entry, see `AsyncCache.__setitem__()`.
+        """
+        key = self._wrap_key(key)
+
+        with self.lock:
+            self._store(key, value, time.perf_counter_ns(), ttl_ns=int(ttl * 1e9) if ttl is not None else None,
+                        tags=tags)
+
+    def invalidate_tag(self, tag) -> int:
+        """
+        Removes all entries with the tag, see `AsyncCache.invalidate_tag()`.
+
+        Returns:
+            int: Number of removed entries.
+        """
+        with self.lock:
+            return len(self._invalidate_tag(tag))
+
+    def invalidate_where(self, predicate: Callable[[Any, Any], bool]) -> int:
+        """
+        Removes all entries for which predicate(key, value) returns true, see `AsyncCache.invalidate_where()`.
+
+        Returns:
+            int: Number of removed entries.
+        """
+        with self.lock:
+            return len(self._invalidate_where(predicate))
+
+    def dump(self, path) -> int:
+        """
+        Writes all live entries to the file, see `AsyncCache.dump()`.
+
+        Returns:
+            int: Number of dumped entries.
+        """
+        with self.lock:
+            records = self._dump_records(time.perf_counter_ns())
+        return _write_dump(path, records)
+
+    def load(self, path) -> int:
+        """
+        Loads the entries written by `dump()`, see `AsyncCache.load()`.
+
+        Returns:
+            int: Number of loaded entries.
+        """
+        reader = _DumpReader(path)
+        try:
+            loaded = 0
+            while True:
+                records = reader.read_chunk(_LOAD_CHUNK_SIZE)
+                if not records:
+                    return loaded
+                with self.lock:
+                    loaded += self._restore(records, time.perf_counter_ns(), time.time() - reader.dumped_at)
+        finally:
+            reader.close()
+
+    def purge_expired(self) -> int:
+        """
+        Removes all expired entries.
+
+        Returns:
+            int: Number of purged entries.
+        """
+        with self.lock:
+            if not self._expiring:
+                return 0
+            return self._purge_expired(time.perf_counter_ns())
+
+    def update_profiling(self, exec_time_ns, hit=False):
+        """Records the latency of the miss (execution time) or of the hit, it doesn't take the lock."""
+        self._update_profiling(exec_time_ns, hit=hit)
+
+    def get_stats(self):
+        with self.lock:
+            return _format_stats(self._raw_stats())
+
+    def clear(self):
+        """Clear the cache and reset all stats."""
+        with self.lock:
+            self._release()
+            self._reset_stats()
+
+
+
+
+def _split_limit(limit: Optional[int], parts: int, index: int) -> Optional[int]:
+    """
+    Returns the share of the part `index` of the limit split into `parts`, the shares sum exactly to the limit:
+    the first `limit % parts` parts get one more.
+    """
+    if limit is None:
+        return None
+    share, remainder = divmod(limit, parts)
+    return share + 1 if index < remainder else share
+
+
+class ShardedAsyncCache:
+    """
+    An asynchronous cache that hashes keys to N independent `AsyncCache` shards.
+
+    Every shard has its own policy engine, expiry index and lock, so concurrent tasks
+    that access different keys don't serialize on one lock. The `maxsize` (and `max_bytes`) is split
+    between the shards, so that the shares sum exactly to it, eviction is done per shard. `get_stats()` aggregates all shards.
+    """
+
+    def __init__(self, maxsize=None, ttl=None, policy="LFU", shards=8, stale_ttl=None, l2=None, max_bytes=None,
+                 weigher=None, early_refresh_beta=None, ttl_jitter=None):
+        """
+        Initializes the ShardedAsyncCache with the given parameters.
+
+        Args:
+            maxsize (Optional[int]): Maximum number of entries in the cache (of all shards together).
+                Can be None only if max_bytes is set.
+            ttl (Optional[int]): Time-to-Live for cache entries in seconds. Defaults to None.
+            policy (str or callable): Cache eviction policy. Can be "LFU", "LRU", "W-TinyLFU", "SIEVE",
+                another name registered by `register_policy()` or `CachePolicy` factory. Defaults to "LFU".
+            shards (int): Number of shards, not greater than maxsize (and max_bytes). Defaults to 8.
+            stale_ttl (Optional[int]): Grace window in seconds after TTL expiry, see `AsyncCache`. Defaults to None.
+            l2 (Optional[CacheTier]): Second-level tier shared by all shards, see `AsyncCache`. Defaults to None.
+            max_bytes (Optional[int]): Memory budget in bytes (of all shards together), see `AsyncCache`.
+                Defaults to None.
+            weigher (Optional[Callable[[Any], int]]): Returns the weight (in bytes) of the value,
+                see `AsyncCache`. Defaults to None.
+            early_refresh_beta (Optional[float]): Enables probabilistic early refresh, see `AsyncCache`.
+                Defaults to None.
+            ttl_jitter (Optional[float]): Spreads the expiry of entries, see `AsyncCache`. Defaults to None.
+        """
+        if shards < 1:
+            raise ValueError("shards should be positive.")
+        if maxsize is not None and shards > maxsize:
+            raise ValueError(f"shards ({shards}) should not be greater than maxsize ({maxsize}).")
+        if max_bytes is not None and shards > max_bytes:
+            raise ValueError(f"shards ({shards}) should not be greater than max_bytes ({max_bytes}).")
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.shards = [AsyncCache(maxsize=_split_limit(maxsize, shards, i), ttl=ttl, policy=policy,
+                                  stale_ttl=stale_ttl, max_bytes=_split_limit(max_bytes, shards, i), weigher=weigher,
+                                  early_refresh_beta=early_refresh_beta, ttl_jitter=ttl_jitter)
+                       for i in range(shards)]
+        self.l2 = l2
+        for shard in self.shards:
+            shard.l2 = l2
+        if l2 is not None:
+            _add_invalidation_listener(l2, self._on_l2_invalidation)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._profiling_counter = itertools.count()
+
+    def _shard_for(self, key: Any) -> AsyncCache:
+        return self.shards[hash(key) % len(self.shards)]
+
+    async def _on_l2_invalidation(self, key):
+        if key is None:
+            for shard in self.shards:
+                await shard._on_l2_invalidation(None)
+        else:
+            await self._shard_for(key)._on_l2_invalidation(key)
+
+    async def __getitem__(self, key):
+        key = _wrap_key(key)
+        return await self._shard_for(key).__getitem__(key)
+
+    async def __setitem__(self, key, value, tags=None, compute_time_ns=None, ttl=None):
+        key = _wrap_key(key)
+        await self._shard_for(key).__setitem__(key, value, tags=tags, compute_time_ns=compute_time_ns, ttl=ttl)
+
+    async def invalidate_tag(self, tag) -> int:
+        """Like `AsyncCache.invalidate_tag()`, every shard has its own tag index."""
+        removed = 0
+        for shard in self.shards:
+            removed += await shard.invalidate_tag(tag)
+        return removed
+
+    async def invalidate_where(self, predicate: Callable[[Any, Any], bool]) -> int:
+        """See `AsyncCache.invalidate_where()`."""
+        removed = 0
+        for shard in self.shards:
+            removed += await shard.invalidate_where(predicate)
+        return removed
+
+    async def lookup(self, key):
+        key = _wrap_key(key)
+        return await self._shard_for(key).lookup(key)
+
+    def _group_by_shard(self, keys):
+        groups = {}
+        for key in keys:
+            groups.setdefault(self._shard_for(key), []).append(key)
+        return groups
+
+    async def get_many(self, keys) -> dict:
+        """Like `AsyncCache.get_many()`, keys are grouped by shard, shards are looked up concurrently."""
+        groups = self._group_by_shard(_wrap_key(key) for key in keys)
+        found = {}
+        for shard_found in await asyncio.gather(*(shard.get_many(group) for shard, group in groups.items())):
+            found.update(shard_found)
+        return found
+
+    async def set_many(self, items):
+        """Like `AsyncCache.set_many()`, entries are grouped by shard."""
+        if is_mapping(items):
+            items = items.items()
+        groups = {}
+        for key, value in items:
+            key = _wrap_key(key)
+            groups.setdefault(self._shard_for(key), []).append((key, value))
+        await asyncio.gather(*(shard.set_many(group) for shard, group in groups.items()))
+
+    async def schedule_refresh(self, key, loader: Callable[[], Awaitable[Any]]) -> bool:
+        key = _wrap_key(key)
+        return await self._shard_for(key).schedule_refresh(key, loader)
+
+    async def dump(self, path, executor=None) -> int:
+        """Like `AsyncCache.dump()`, the entries of all shards are written to one file."""
+        records = []
+        for shard in self.shards:
+            async with shard.lock:
+                records.extend(shard._dump_records(time.perf_counter_ns()))
+        return await exec_in_executor(executor, _write_dump, path, records)
+
+    async def load(self, path, executor=None) -> int:
+        """Like `AsyncCache.load()`, every entry is routed to its shard, so the file can be written with
+        another number of shards."""
+        reader = await exec_in_executor(executor, _DumpReader, path)
+        try:
+            loaded = 0
+            while True:
+                records = await exec_in_executor(executor, reader.read_chunk, _LOAD_CHUNK_SIZE)
+                if not records:
+                    return loaded
+                elapsed = time.time() - reader.dumped_at
+                groups = {}
+                for record in records:
+                    groups.setdefault(self._shard_for(record[0]), []).append(record)
+                for shard, group in groups.items():
+                    async with shard.lock:
+                        loaded += shard._restore(group, time.perf_counter_ns(), elapsed)
+        finally:
+            reader.close()
+
+    async def warm_up(self, keys, loader: Callable[[Any], Awaitable[Any]], concurrency: int = 8) -> int:
+        """See `AsyncCache.warm_up()`."""
+        return await _warm_up(self, keys, loader, concurrency)
+
+    async def purge_expired(self) -> int:
+        """
+        Removes all expired entries from all shards.
+
+        Returns:
+            int: Number of purged entries.
+        """
+        purged = 0
+        for shard in self.shards:
+            purged += await shard.purge_expired()
+        return purged
+
+    async def update_profiling(self, exec_time_ns, hit=False):
+        # exec time is not related to the key, spread the updates between shards round-robin
+        shard = self.shards[next(self._profiling_counter) % len(self.shards)]
+        await shard.update_profiling(exec_time_ns, hit=hit)
+
+    def latency_stats(self) -> dict:
+        """Like `AsyncCache.latency_stats()`, the histograms of all shards are merged."""
+        misses = LatencySnapshot()
+        hits = LatencySnapshot()
+        for shard in self.shards:
+            misses = misses.merge(shard.miss_latency.snapshot())
+            hits = hits.merge(shard.hit_latency.snapshot())
+        return {'misses': misses.to_dict(), 'hits': hits.to_dict()}
+
+    async def get_stats(self):
+        raw = None
+        for shard in self.shards:
+            async with shard.lock:
+                shard_raw = shard._raw_stats()
+            if raw is None:
+                raw = shard_raw
+                continue
+            for name in ('hits', 'misses', 'stale_hits', 'refreshes', 'failed_refreshes', 'l2_hits', 'l2_misses',
+                         'current_size', 'expired', 'current_bytes', 'invalidated', 'early_refreshes'):
+                raw[name] += shard_raw[name]
+            for name in ('miss_latency', 'hit_latency'):
+                raw[name] = raw[name].merge(shard_raw[name])
+        raw['max_size'] = self.maxsize
+        raw['max_bytes'] = self.max_bytes
+        stats = _format_stats(raw)
+        stats['shards'] = len(self.shards)
+        return stats
+
+    def _release(self):
+        """Drops all L1 entries of all shards, see `AsyncCache._release()`."""
+        for shard in self.shards:
+            shard._release()
+
+    async def clear(self):
+        """Clear all shards (and L2 tier) and reset all stats."""
+        # L2 is shared by the shards, it is cleared once
+        if self.l2 is not None:
+            await self.l2.clear()
+        for shard in self.shards:
+            async with shard.lock:
+                shard._release()
+                shard._reset_stats()
+
+
+async def export_latency_periodically(cache_instance, callback: Callable[[dict], Any], interval: float = 60.0,
+                                      reset: bool = False):
+    """
+    Export hook for latency histograms. Every interval seconds calls callback with `latency_stats()`
+    of the cache (it can be `AsyncCache`, `ShardedAsyncCache` or `SyncCache`), for example, to push
+    the percentiles to the metrics system. The cache lock is not taken, so the cache traffic is not blocked.
+    If callback returns awaitable, it is awaited. Runs until cancelled, should be started by
+    `asyncio.create_task()`.
+
+    Args:
+        cache_instance: The cache, for example, `wrapped.cache_instance` of `async_cache()`.
+        callback: Is called with the dict returned by `latency_stats()`.
+        interval (float): Interval in seconds. Defaults to 60.
+        reset (bool): If True, the histograms are reset after every export, so every export covers
+            only its interval. Defaults to False.
+    """
+    caches = getattr(cache_instance, 'shards', None) or [cache_instance]
+    while True:
+        await asyncio.sleep(interval)
+        stats = cache_instance.latency_stats()
+        if reset:
+            for c in caches:
+                c.miss_latency.reset()
+                c.hit_latency.reset()
+        try:
+            result = callback(stats)
+            if inspect.isawaitable(result):
+                await result
+        except Exception:
+            logger.warning("Latency export failed", exc_info=True)
+
+
+_MAX_SIZE_SENTINEL = object()
+_TTL_SENTINEL = object()
+
+
+def _finish_in_flight(in_flight, flight_key, task):
+    """
+    Done callback of the in-flight task of `async_cache(coalesce=True)`.
+    Removes the task from the in-flight registry. The exception (if any) is retrieved here,
+    because it was already propagated to all waiters (or there are none of them, if all were cancelled).
+    """
+    in_flight.pop(flight_key, None)
+    if not task.cancelled():
+        task.exception()
+
+
+_HASHABLE_PRIMITIVES = frozenset({int, str, bytes, float, bool, type(None)})
+
+
+def _to_hashable(value: Any) -> Any:
+    """Like `make_hashable()`, but primitives (the most common case) are returned as is without any walk."""
+    if type(value) in _HASHABLE_PRIMITIVES:
+        return value
+    return make_hashable(value)
+
+
+class _CachedException:
+    """
+    The exception raised by the wrapped function of `async_cache(cache_exceptions=...)`,
+    it is stored in the cache instead of the result and is re-raised to the callers on hit.
+    """
+    __slots__ = ('exception',)
+
+    def __init__(self, exception: BaseException):
+        # the traceback pins the frames (and their locals) of the failed call for the ttl of the entry,
+        # the copy without traceback is stored, the original is re-raised to the first caller untouched
+        try:
+            self.exception = copy.copy(exception).with_traceback(None)
+        except Exception:
+            traceback.clear_frames(exception.__traceback__)
+            self.exception = exception
+
+    def reraise(self):
+        # every caller gets its own copy, so tracebacks of the callers don't pile up on the cached instance
+        try:
+            exception = copy.copy(self.exception)
+        except Exception:
+            exception = self.exception
+        raise exception.with_traceback(None)
+
+
+def _call_tags(tags: Optional[Callable], args, kwargs):
+    """Returns the tags of the call (see `async_cache(tags=...)`) as iterable or None."""
+    if tags is None:
+        return None
+    ret = tags(*args, **kwargs)
+    if ret is None:
+        return None
+    if isinstance(ret, (str, bytes)) or not isinstance(ret, (list, tuple, set, frozenset)):
+        return (ret,)
+    return ret
+
+
+def _method_self_name(fn: Callable) -> Optional[str]:
+    """Returns the name of the first parameter of fn if it is `self` or `cls` (so fn is method), otherwise None."""
+    try:
+        params = list(inspect.signature(fn).parameters.values())
+    except (TypeError, ValueError):
+        return None
+    if params and params[0].name in ('self', 'cls') and \
+            params[0].kind in (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD):
+        return params[0].name
+    return None
+
+
+class _PerInstanceCaches:
+    """
+    Registry of per-instance caches of `async_cache(per_instance=True)`.
+
+    The cache is kept as `id(instance) -> (weak reference to instance, cache)`, so the instance doesn't have to be
+    hashable. `weakref.finalize()` drops the cache (with all its entries) as soon as the instance is garbage
+    collected. The identity of the instance is checked on every lookup, so the reused `id()` never hits
+    the cache of another (dead) instance.
+    """
+
+    def __init__(self, fn: Callable, factory: Callable[[], Any]):
+        self.self_name = _method_self_name(fn)
+        if self.self_name is None:
+            raise ValueError(f"per_instance requires method, the first parameter of {fn.__qualname__} "
+                             f"should be 'self' or 'cls'.")
+        self.factory = factory
+        self.caches = {}
+        self._lock = threading.Lock()
+
+    def for_call(self, args, kwargs):
+        """Returns the cache of the instance the method is called on."""
+        return self.get(args[0] if args else kwargs[self.self_name])
+
+    def get(self, instance: Any):
+        """Returns the cache of the instance, creates it on the first call."""
+        instance_id = id(instance)
+        entry = self.caches.get(instance_id)
+        if entry is not None and entry[0]() is instance:
+            return entry[1]
+
+        with self._lock:
+            entry = self.caches.get(instance_id)
+            if entry is not None and entry[0]() is instance:
+                return entry[1]
+            try:
+                ref = weakref.ref(instance)
+            except TypeError:
+                raise TypeError(f"per_instance cache requires weak-referenceable instance, "
+                                f"{type(instance).__qualname__} is not "
+                                f"(add '__weakref__' to its __slots__).") from None
+            cache_instance = self.factory()
+            self.caches[instance_id] = (ref, cache_instance)
+            weakref.finalize(instance, self._discard, instance_id, ref)
+            return cache_instance
+
+    def _discard(self, instance_id: int, ref: weakref.ref):
+        with self._lock:
+            entry = self.caches.get(instance_id)
+            if entry is None or entry[0] is not ref:
+                return
+            del self.caches[instance_id]
+        # the cache object itself may wait for cyclic gc, but its entries are freed right now
+        entry[1]._release()
+
+    def __len__(self) -> int:
+        return len(self.caches)
+
+
+def _make_key_builder(fn: Callable, key: Optional[Callable] = None, typed: bool = False) -> Callable:
+    """
+    Precompiles the function that builds the cache key of the call of fn: `build(args, kwargs) -> key`.
+
+    The signature of fn is inspected once. Arguments are bound to parameters, defaults are applied,
+    so `f(1, b=2)`, `f(1, 2)` and `f(1)` (if the default of b is 2) share the key.
+    If the first parameter is named `self` or `cls`, fn is treated as a method,
+    `id()` of the first argument is used in the key.
+
+    Args:
+        fn: The decorated function.
+        key: If set, it is called with the arguments of the call and its result (made hashable) is the key.
+        typed: If True, arguments of different types are cached separately, for example, `f(1)` and `f(1.0)`.
+    """
+    if key is not None:
+        def build_custom(args, kwargs):
+            return _to_hashable(key(*args, **kwargs))
+        return build_custom
+
+    try:
+        sig = inspect.signature(fn)
+    except (TypeError, ValueError):
+        sig = None
+
+    def finish(values):
+        if typed:
+            return tuple(values) + tuple(type(v) for v in values)
+        return tuple(values)
+
+    if sig is None:
+        def build_unknown(args, kwargs):
+            values = [_to_hashable(v) for v in args]
+            values.extend(_to_hashable(item) for item in sorted(kwargs.items()))
+            return finish(values)
+        return build_unknown
+
+    params = list(sig.parameters.values())
+    is_method = _method_self_name(fn) is not None
+    P = inspect.Parameter
+
+    if all(p.kind == P.POSITIONAL_OR_KEYWORD for p in params):
+        # the common case, arguments are mapped to positions without Signature.bind()
+        n = len(params)
+        names = {p.name: i for i, p in enumerate(params)}
+        defaults = tuple(_MISSING if p.default is P.empty else p.default for p in params)
+
+        def build_simple(args, kwargs):
+            if kwargs or len(args) != n:
+                if len(args) > n or any(names.get(name, -1) < len(args) for name in kwargs):
+                    sig.bind(*args, **kwargs)  # raises TypeError, as the call of fn would
+                values = list(args) + [_MISSING] * (n - len(args))
+                for name, value in kwargs.items():
+                    values[names[name]] = value
+                for i in range(len(args), n):
+                    if values[i] is _MISSING:
+                        if defaults[i] is _MISSING:
+                            sig.bind(*args, **kwargs)  # raises TypeError on missing argument
+                        values[i] = defaults[i]
+            else:
+                values = args
+            if is_method:
+                # self (cls) is never walked by _to_hashable(), it may be large iterable or even iterator
+                key_values = [id(values[0])]
+                key_values.extend(_to_hashable(v) for v in values[1:])
+            else:
+                key_values = [_to_hashable(v) for v in values]
+            return finish(key_values)
+        return build_simple
+
+    def build_bound(args, kwargs):
+        bound = sig.bind(*args, **kwargs)
+        bound.apply_defaults()
+        values = []
+        arguments = iter(bound.arguments.items())
+        if is_method:
+            values.append(id(next(arguments)[1]))
+        for name, value in arguments:
+            kind = sig.parameters[name].kind
+            if kind == P.VAR_POSITIONAL:
+                values.extend(_to_hashable(v) for v in value)
+            elif kind == P.VAR_KEYWORD:
+                values.extend((k, _to_hashable(v)) for k, v in sorted(value.items()))
+            else:
+                values.append(_to_hashable(value))
+        return finish(values)
+    return build_bound
+
+
+def async_cache(maxsize=_MAX_SIZE_SENTINEL, ttl=_TTL_SENTINEL, policy="LFU", coalesce=False, shards=None,
+                stale_ttl=None, l2=None, max_bytes=None, weigher=None, key=None, typed=False, per_instance=False,
+                tags=None, early_refresh_beta=None, ttl_jitter=None, cache_none=True, negative_ttl=None,
+                cache_exceptions=(), exception_ttl=None):
+    """
+    A decorator to apply asynchronous caching to a function.
+
+    Args:
+        maxsize (int): Maximum size of the cache.
+        ttl (Optional[int]): Time-to-Live for cache entries in seconds. Defaults to None.
+        policy (str or callable): Cache eviction policy. Can be "LFU", "LRU", "W-TinyLFU", "SIEVE",
+            another name registered by `register_policy()` or `CachePolicy` factory. Defaults to "LFU".
+        coalesce (bool): If True, concurrent misses on the same key are coalesced (single-flight).
+            The first caller starts the computation, all concurrent callers await the same in-flight task,
+            so the wrapped function is called (and the result is stored) only once.
+            If the computation raises, the exception is propagated to all waiters and nothing is cached.
+            Coalescing is done per event loop. Defaults to False.
+        shards (Optional[int]): If set, `ShardedAsyncCache` with this number of shards is used
+            instead of `AsyncCache`, each shard has its own lock. Defaults to None.
+        stale_ttl (Optional[int]): Stale-while-revalidate grace window in seconds after TTL expiry.
+            Within it the expired value is returned at once and single background refresh
+            of the key is scheduled. Requires ttl. Defaults to None.
+        l2 (Optional[CacheTier]): Second-level tier, for example, `SqliteCacheTier` (see `cache_tiers.py`).
+            On L1 miss it is checked before calling the wrapped function. Its namespace should be unique
+            per decorated function. Defaults to None.
+        max_bytes (Optional[int]): Memory budget of the cache in bytes, entries are evicted until
+            their total weight fits it. Defaults to None.
+        weigher (Optional[Callable[[Any], int]]): Returns the weight (in bytes) of the result,
+            it is used only if max_bytes is set. Defaults to `deep_sizeof()`.
+        key (Optional[Callable]): Builds the cache key, it is called with the same arguments as
+            the decorated function. By default, the key is built from all arguments bound to the parameters
+            of the function (with defaults applied), `self`/`cls` is represented by its `id()`. Defaults to None.
+        typed (bool): If True, arguments of different types are cached separately,
+            for example, `f(1)` and `f(1.0)`. Defaults to False.
+        per_instance (bool): Only for methods (the first parameter is `self` or `cls`). If True, every instance
+            gets its own cache (maxsize, max_bytes, etc. are per instance). The cache of the instance is freed
+            as soon as the instance is garbage collected and the reused `id()` of the dead instance never hits.
+            The instance should be weak-referenceable. `wrapped.cache_for(instance)` returns the cache of the
+            instance, `wrapped.cache_instance` is None in this mode. Defaults to False.
+        tags (Optional[Callable]): Returns the tags (tag or iterable of tags) of the entry, it is called with
+            the same arguments as the decorated function. `cache_instance.invalidate_tag(tag)` removes all entries
+            with the tag, for example, all entries of one tenant. Defaults to None.
+        early_refresh_beta (Optional[float]): Enables probabilistic early refresh (XFetch). The entry is refreshed
+            in the background before it expires, the probability of the refresh grows as the expiry approaches,
+            recompute time of the entry and beta (1.0 is good default, larger means earlier) scale it.
+            So the entries inserted together don't expire together. Requires ttl. Defaults to None.
+        ttl_jitter (Optional[float]): Fraction in [0, 1), ttl of every entry is reduced by random part of it,
+            so one burst of inserts doesn't lead to one burst of expiries. Requires ttl. Defaults to None.
+        cache_none (bool): If False, None result ("not found") is not cached. Defaults to True.
+        negative_ttl (Optional[float]): Time-to-Live in seconds of None result, it is applied even if
+            the cache has no ttl. Defaults to None (ttl of the cache).
+        cache_exceptions (tuple): Exception types (for example, known transient errors) that are cached,
+            the cached exception is re-raised to the callers, so the hot failing key doesn't hammer the upstream.
+            Defaults to () (exceptions are not cached).
+        exception_ttl (Optional[float]): Time-to-Live in seconds of the cached exception, it is applied even if
+            the cache has no ttl. Defaults to None (ttl of the cache).
+    """
+    kwargs = {}
+    if maxsize is not _MAX_SIZE_SENTINEL:
+        kwargs['maxsize'] = maxsize
+    if ttl is not _TTL_SENTINEL:
+        kwargs['ttl'] = ttl
+
+    def new_cache():
+        if shards is None:
+            return AsyncCache(**kwargs, policy=policy, stale_ttl=stale_ttl, l2=l2, max_bytes=max_bytes,
+                              weigher=weigher, early_refresh_beta=early_refresh_beta, ttl_jitter=ttl_jitter)
+        return ShardedAsyncCache(**kwargs, policy=policy, shards=shards, stale_ttl=stale_ttl, l2=l2,
+                                 max_bytes=max_bytes, weigher=weigher, early_refresh_beta=early_refresh_beta,
+                                 ttl_jitter=ttl_jitter)
+
+    cache_instance = None if per_instance else new_cache()
+
+    def decorator(fn):
+        # (event loop, cache_key) -> asyncio.Task, used only if coalesce is True
+        in_flight = {}
+        build_key = _make_key_builder(fn, key=key, typed=typed)
+
+        instance_caches = _PerInstanceCaches(fn, new_cache) if per_instance else None
+
+        def _cache_for(args, kwargs):
+            if instance_caches is None:
+                return cache_instance
+            return instance_caches.for_call(args, kwargs)
+
+        async def _load(cache, cache_key, args, kwargs):
+            # Calculate the result and store it in the cache
+            start_time_ns = time.perf_counter_ns()
+            try:
+                result = await fn(*args, **kwargs)
+            except cache_exceptions as e:
+                exec_time_ns = time.perf_counter_ns() - start_time_ns
+                await cache.update_profiling(exec_time_ns)
+                await cache.__setitem__(cache_key, _CachedException(e), tags=_call_tags(tags, args, kwargs),
+                                        compute_time_ns=exec_time_ns, ttl=exception_ttl)
+                raise
+            exec_time_ns = time.perf_counter_ns() - start_time_ns
+            await cache.update_profiling(exec_time_ns)
+            if result is None and not cache_none:
+                return result
+            await cache.__setitem__(cache_key, result, tags=_call_tags(tags, args, kwargs),
+                                    compute_time_ns=exec_time_ns, ttl=negative_ttl if result is None else None)
+            return result
+
+        async def _load_coalesced(cache, cache_key, args, kwargs):
+            flight_key = (asyncio.get_running_loop(), cache_key)
+            task = in_flight.get(flight_key)
+            if task is None:
+                task = asyncio.ensure_future(_load(cache, cache_key, args, kwargs))
+                in_flight[flight_key] = task
+                task.add_done_callback(functools.partial(_finish_in_flight, in_flight, flight_key))
+            # cancellation of one of the waiters shouldn't cancel the computation for others
+            return await asyncio.shield(task)
+
+        @functools.wraps(fn)
+        async def wrapped_instance(*args, **kwargs):
+            start_time_ns = time.perf_counter_ns()
+            cache_key = build_key(args, kwargs)
+            cache = _cache_for(args, kwargs)
+
+            # Try to get the result from the cache
+            try:
+                value, is_stale = await cache.lookup(cache_key)
+            except KeyError:
+                pass
+            else:
+                if is_stale:
+                    await cache.schedule_refresh(cache_key, functools.partial(_load, cache, cache_key, args, kwargs))
+                await cache.update_profiling(time.perf_counter_ns() - start_time_ns, hit=True)
+                if isinstance(value, _CachedException):
+                    value.reraise()
+                return value
+
+            if coalesce:
+                return await _load_coalesced(cache, cache_key, args, kwargs)
+            return await _load(cache, cache_key, args, kwargs)
+
+        def cache_for(instance):
+            """Returns the cache of the instance (only if per_instance is True)."""
+            if instance_caches is None:
+                raise ValueError("cache_for() is available only if per_instance is True.")
+            return instance_caches.get(instance)
+
+        wrapped_instance.cache_instance = cache_instance  # Attach the cache instance to the function
+        wrapped_instance.cache_for = cache_for
+        return wrapped_instance
+
+    return decorator
+
+
+class _BatchLoader:
+    """
+    DataLoader-style cached loader, see `async_batch_cache()`.
+
+    Keys that are requested in the same event loop tick are collected into one batch. The batch is split
+    into hits and misses by single `get_many()` of the cache, the bulk loader is called once for all misses
+    (in chunks of max_batch_size) and the results are stored by `set_many()`. The key that is queued or being
+    loaded is not requested again, its callers await the same future.
+    """
+
+    def __init__(self, fn: Callable, cache_instance, max_batch_size: Optional[int] = None):
+        if max_batch_size is not None and max_batch_size < 1:
+            raise ValueError("max_batch_size should be positive.")
+        functools.update_wrapper(self, fn)
+        self.fn = fn
+        self.cache_instance = cache_instance
+        self.max_batch_size = max_batch_size
+        # (event loop, key) -> asyncio.Future of the key that is queued or being loaded
+        self._in_flight = {}
+        # event loop -> {key: (original key, asyncio.Future)} queued for the next dispatch
+        self._pending = {}
+        self._tasks = set()
+
+    async def __call__(self, key):
+        """Returns the value of the key. Raises KeyError if the bulk loader didn't return it."""
+        # cancellation of one of the callers shouldn't cancel the load for others
+        return await asyncio.shield(self._enqueue(key))
+
+    async def load_many(self, keys) -> list:
+        """Returns the values of the keys (in the same order), all keys are loaded in one batch."""
+        futures = [self._enqueue(key) for key in keys]
+        return list(await asyncio.shield(asyncio.gather(*futures)))
+
+    def _enqueue(self, key) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        wrapped_key = _wrap_key(key)
+        flight_key = (loop, wrapped_key)
+        future = self._in_flight.get(flight_key)
+        if future is not None:
+            return future
+
+        future = loop.create_future()
+        self._in_flight[flight_key] = future
+        future.add_done_callback(functools.partial(_finish_in_flight, self._in_flight, flight_key))
+        batch = self._pending.get(loop)
+        if batch is None:
+            batch = self._pending[loop] = {}
+            # runs after all callbacks that are ready now, so all keys of this tick are in the batch
+            loop.call_soon(self._dispatch, loop)
+        batch[wrapped_key] = (key, future)
+        return future
+
+    def _dispatch(self, loop):
+        batch = self._pending.pop(loop)
+        task = loop.create_task(self._load_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        # the batch task that is cancelled before it resolved all keys shouldn't leave their callers hanging
+        task.add_done_callback(functools.partial(self._cancel, batch, batch.keys()))
+
+    async def _load_batch(self, batch):
+        try:
+            found = await self.cache_instance.get_many(batch.keys())
+        except Exception as e:
+            self._fail(batch, batch.keys(), e)
+            return
+
+        for key, value in found.items():
+            future = batch[key][1]
+            if not future.done():
+                future.set_result(value)
+
+        misses = [key for key in batch if key not in found]
+        if not misses:
+            return
+        size = self.max_batch_size or len(misses)
+        await asyncio.gather(*(self._load_chunk(batch, misses[i:i + size]) for i in range(0, len(misses), size)))
+
+    async def _load_chunk(self, batch, chunk):
+        try:
+            start_time_ns = time.perf_counter_ns()
+            result = await self.fn([batch[key][0] for key in chunk])
+            exec_time_ns = time.perf_counter_ns() - start_time_ns
+            await self.cache_instance.update_profiling(exec_time_ns)
+
+            if is_mapping(result):
+                values = {_wrap_key(key): value for key, value in result.items()}
+            else:
+                result = list(result)
+                if len(result) != len(chunk):
+                    raise ValueError(f"Bulk loader {self.fn.__qualname__} returned {len(result)} values "
+                                     f"for {len(chunk)} keys.")
+                values = dict(zip(chunk, result))
+            await self.cache_instance.set_many([(key, values[key]) for key in chunk if key in values])
+        except Exception as e:
+            self._fail(batch, chunk, e)
+            return
+        except BaseException:
+            # CancelledError (of the bulk loader or of the batch task), the callers are cancelled too
+            self._cancel(batch, chunk)
+            raise
+
+        for key in chunk:
+            original_key, future = batch[key]
+            if future.done():
+                continue
+            if key in values:
+                future.set_result(values[key])
+            else:
+                future.set_exception(KeyError(f"Key '{original_key}' was not returned by the bulk loader."))
+
+    @staticmethod
+    def _fail(batch, keys, e):
+        for key in keys:
+            future = batch[key][1]
+            if not future.done():
+                future.set_exception(e)
+
+    @staticmethod
+    def _cancel(batch, keys, *args):
+        """Cancels the futures of the keys that are not resolved yet. args is the task of the done callback."""
+        for key in keys:
+            batch[key][1].cancel()
+
+
+def async_batch_cache(maxsize=_MAX_SIZE_SENTINEL, ttl=_TTL_SENTINEL, policy="LFU", shards=None, l2=None,
+                      max_bytes=None, weigher=None, max_batch_size=None):
+    """
+    A decorator that turns the bulk loader into the cached loader of single key (DataLoader-style).
+
+    The decorated coroutine function `fn(keys: list)` should return mapping key -> value or the sequence of
+    values in the same order as keys. `await loader(key)` returns the value of one key, all keys requested
+    in the same event loop tick (for example, by concurrent tasks or by `await loader.load_many(keys)`)
+    are collected into one batch. The hits are served from the cache, fn is called once for all misses,
+    so many requests of single keys cost one upstream round-trip. If fn raises, the exception is propagated
+    to the callers of the keys of this call, nothing is cached. If fn (or the batch) is cancelled, so are its
+    callers. The key that fn didn't return raises KeyError.
+
+    Args:
+        maxsize (int): Maximum size of the cache.
+        ttl (Optional[int]): Time-to-Live for cache entries in seconds. Defaults to None.
+        policy (str or callable): Cache eviction policy, see `async_cache()`. Defaults to "LFU".
+        shards (Optional[int]): If set, `ShardedAsyncCache` with this number of shards is used. Defaults to None.
+        l2 (Optional[CacheTier]): Second-level tier, see `async_cache()`. Defaults to None.
+        max_bytes (Optional[int]): Memory budget of the cache in bytes, see `async_cache()`. Defaults to None.
+        weigher (Optional[Callable[[Any], int]]): Returns the weight (in bytes) of the value. Defaults to None.
+        max_batch_size (Optional[int]): Maximum number of keys passed to one call of fn,
+            larger batch is split into concurrent calls. Defaults to None (unlimited).
+    """
+    kwargs = {}
+    if maxsize is not _MAX_SIZE_SENTINEL:
+        kwargs['maxsize'] = maxsize
+    if ttl is not _TTL_SENTINEL:
+        kwargs['ttl'] = ttl
+
+    if shards is None:
+        cache_instance = AsyncCache(**kwargs, policy=policy, l2=l2, max_bytes=max_bytes, weigher=weigher)
+    else:
+        cache_instance = ShardedAsyncCache(**kwargs, policy=policy, shards=shards, l2=l2, max_bytes=max_bytes,
+                                           weigher=weigher)
+
+    def decorator(fn):
+        return _BatchLoader(fn, cache_instance, max_batch_size=max_batch_size)
+
+    return decorator
+
+
+def cache(maxsize=_MAX_SIZE_SENTINEL, ttl=_TTL_SENTINEL, policy="LFU", coalesce=False, max_bytes=None, weigher=None,
+          key=None, typed=False, per_instance=False, tags=None, ttl_jitter=None, cache_none=True, negative_ttl=None,
+          cache_exceptions=(), exception_ttl=None):
+    """
+    A decorator to apply thread-safe caching to a synchronous function, the counterpart of `async_cache()`.
+    `SyncCache` is used, so the cache has TTL, the same policies and `get_stats()`.
+
+    Args:
+        maxsize (int): Maximum size of the cache.
+        ttl (Optional[int]): Time-to-Live for cache entries in seconds. Defaults to None.
+        policy (str or callable): Cache eviction policy, see `async_cache()`. Defaults to "LFU".
+        coalesce (bool): If True, concurrent misses on the same key from different threads are coalesced
+            (single-flight). The first thread calls the function, other threads wait for its result.
+            If the function raises, the exception is propagated to all waiting threads and nothing is cached.
+            Defaults to False.
+        max_bytes (Optional[int]): Memory budget of the cache in bytes, see `async_cache()`. Defaults to None.
+        weigher (Optional[Callable[[Any], int]]): Returns the weight (in bytes) of the result. Defaults to None.
+        key (Optional[Callable]): Builds the cache key, see `async_cache()`. Defaults to None.
+        typed (bool): If True, arguments of different types are cached separately. Defaults to False.
+        per_instance (bool): Only for methods, every instance gets its own cache, see `async_cache()`.
+            Defaults to False.
+        tags (Optional[Callable]): Returns the tags of the entry, see `async_cache()`. Defaults to None.
+        ttl_jitter (Optional[float]): Spreads the expiry of entries, see `async_cache()`. Defaults to None.
+        cache_none (bool): If False, None result is not cached. Defaults to True.
+        negative_ttl (Optional[float]): Time-to-Live in seconds of None result, see `async_cache()`.
+            Defaults to None.
+        cache_exceptions (tuple): Exception types that are cached and re-raised, see `async_cache()`.
+            Defaults to ().
+        exception_ttl (Optional[float]): Time-to-Live in seconds of the cached exception. Defaults to None.
+    """
+    kwargs = {}
+    if maxsize is not _MAX_SIZE_SENTINEL:
+        kwargs['maxsize'] = maxsize
+    if ttl is not _TTL_SENTINEL:
+        kwargs['ttl'] = ttl
+
+    def new_cache():
+        return SyncCache(**kwargs, policy=policy, max_bytes=max_bytes, weigher=weigher, ttl_jitter=ttl_jitter)
+
+    cache_instance = None if per_instance else new_cache()
+
+    def decorator(fn):
+        # cache_key -> (concurrent.futures.Future, ident of the computing thread), used only if coalesce is True
+        in_flight = {}
+        in_flight_lock = threading.Lock()
+        build_key = _make_key_builder(fn, key=key, typed=typed)
+
+        instance_caches = _PerInstanceCaches(fn, new_cache) if per_instance else None
+
+        def _cache_for(args, kwargs):
+            if instance_caches is None:
+                return cache_instance
+            return instance_caches.for_call(args, kwargs)
+
+        def _load(cache, cache_key, args, kwargs):
+            # Calculate the result and store it in the cache
+            start_time_ns = time.perf_counter_ns()
+            try:
+                result = fn(*args, **kwargs)
+            except cache_exceptions as e:
+                cache.update_profiling(time.perf_counter_ns() - start_time_ns)
+                cache.__setitem__(cache_key, _CachedException(e), tags=_call_tags(tags, args, kwargs),
+                                  ttl=exception_ttl)
+                raise
+            exec_time_ns = time.perf_counter_ns() - start_time_ns
+            cache.update_profiling(exec_time_ns)
+            if result is None and not cache_none:
+                return result
+            cache.__setitem__(cache_key, result, tags=_call_tags(tags, args, kwargs),
+                              ttl=negative_ttl if result is None else None)
+            return result
+
+        def _load_coalesced(cache, cache_key, args, kwargs):
+            current_ident = threading.get_ident()
+            with in_flight_lock:
+                entry = in_flight.get(cache_key)
+                if entry is None:
+                    future = concurrent.futures.Future()
+                    in_flight[cache_key] = (future, current_ident)
+                else:
+                    future, ident = entry
+            if entry is not None:
+                if ident == current_ident:
+                    # recursive call on the same key, waiting for itself would deadlock
+                    return _load(cache, cache_key, args, kwargs)
+                return future.result()
+
+            try:
+                result = _load(cache, cache_key, args, kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            else:
+                future.set_result(result)
+                return result
+            finally:
+                with in_flight_lock:
+                    in_flight.pop(cache_key, None)
+
+        @functools.wraps(fn)
+        def wrapped_instance(*args, **kwargs):
+            start_time_ns = time.perf_counter_ns()
+            cache_key = build_key(args, kwargs)
+            cache = _cache_for(args, kwargs)
+
+            # Try to get the result from the cache
+            try:
+                value = cache.__getitem__(cache_key)
+            except KeyError:
+                pass
+            else:
+                cache.update_profiling(time.perf_counter_ns() - start_time_ns, hit=True)
+                if isinstance(value, _CachedException):
+                    value.reraise()
+                return value
+
+            if coalesce:
+                return _load_coalesced(cache, cache_key, args, kwargs)
+            return _load(cache, cache_key, args, kwargs)
+
+        def cache_for(instance):
+            """Returns the cache of the instance (only if per_instance is True)."""
+            if instance_caches is None:
+                raise ValueError("cache_for() is available only if per_instance is True.")
+            return instance_caches.get(instance)
 
         wrapped_instance.cache_instance = cache_instance  # Attach the cache instance to the function
+        wrapped_instance.cache_for = cache_for
         return wrapped_instance
 
     return decorator
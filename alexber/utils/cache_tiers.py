@@ -0,0 +1,913 @@
+"""
+This module contains second-level (L2) tiers for `AsyncCache`, see `cache.py`.
+
+L1 is in-memory LFU/LRU of `AsyncCache`. On L1 miss the L2 tier is checked before calling the wrapped function,
+every write to `AsyncCache` is written through to L2.
+
+Values are stored in serialized form (pickle by default), keys are stored as stable digests, see `stable_key_digest()`.
+So the entries survive restart of the process and can be shared between processes.
+
+`SqliteCacheTier` is persistent disk-backed tier, `SharedMemoryCacheTier` is shared by all processes on the host,
+`RespCacheTier` is remote tier that speaks Redis RESP protocol, `RespStandInServer` is in-process stand-in server for it.
+"""
+import asyncio
+import contextlib
+import errno
+import fnmatch
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Protocol, Tuple
+
+from .mains import HashableWrapper
+from .thread_locals import exec_in_executor
+
+logger = logging.getLogger(__name__)
+
+# Is returned by the blocking helpers that run in the executor on miss, KeyError is raised on the event loop side,
+# so the miss is not reported by exec_in_executor() as unhandled exception
+_MISSING = object()
+
+
+class CacheTier(Protocol):
+    """
+    Protocol for the second-level (L2) tier of `AsyncCache`.
+
+    Keys are the cache keys of `AsyncCache`, it is up to the tier to turn them into stable digests.
+    """
+
+    async def get(self, key: Any) -> Tuple[Any, Optional[float]]:
+        """
+        Returns the value and its remaining Time-to-Live in seconds (None if it has no TTL).
+
+        Raises:
+            KeyError: If the key is not found or it is expired.
+        """
+        ...
+
+    async def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        """Stores the value with optional Time-to-Live in seconds."""
+        ...
+
+    async def delete(self, key: Any) -> None:
+        """Removes the key, if it is present."""
+        ...
+
+    async def clear(self) -> None:
+        """Removes all entries."""
+        ...
+
+    # Optional, used by `AsyncCache` if present:
+    #
+    # async def get_many(self, keys) -> Dict[Any, Tuple[Any, Optional[float]]]
+    #     Returns key -> (value, remaining TTL) for the found keys only.
+    # async def set_many(self, items, ttl: Optional[float] = None) -> None
+    #     Stores many (key, value) pairs.
+    # def add_invalidation_listener(self, callback: Callable[[Any], Awaitable[None]]) -> None
+    #     Registers the coroutine function that is called with the key that was changed by another node
+    #     (None means all keys), so the L1 (near cache) of this node drops it.
+
+
+def _canonical_bytes(obj: Any) -> bytes:
+    """
+    Returns representation of obj that doesn't depend on the process (for example, on hash randomization).
+    Sets and mappings are sorted by the representation of their items.
+    """
+    if obj is None or isinstance(obj, (bool, int, float, complex)):
+        return f"{type(obj).__name__}:{obj!r}".encode()
+    elif isinstance(obj, str):
+        return b"str:" + obj.encode('utf-8', 'surrogatepass')
+    elif isinstance(obj, (bytes, bytearray)):
+        return b"bytes:" + bytes(obj)
+    elif isinstance(obj, HashableWrapper):
+        return b"wrapped:" + _canonical_bytes(obj.obj)
+    elif isinstance(obj, (tuple, list)):
+        tag = b"tuple(" if isinstance(obj, tuple) else b"list("
+        return tag + b",".join(_canonical_bytes(e) for e in obj) + b")"
+    elif isinstance(obj, (frozenset, set)):
+        return b"set(" + b",".join(sorted(_canonical_bytes(e) for e in obj)) + b")"
+    elif isinstance(obj, dict):
+        items = sorted(_canonical_bytes(k) + b":" + _canonical_bytes(v) for k, v in obj.items())
+        return b"dict(" + b",".join(items) + b")"
+    else:
+        # repr should be stable for such objects to be used as persistent keys
+        cls = type(obj)
+        return f"{cls.__module__}.{cls.__qualname__}:{obj!r}".encode()
+
+
+def stable_key_digest(key: Any, namespace: str = '') -> bytes:
+    """
+    Returns 16-bytes digest of the cache key that is the same in every process.
+
+    Args:
+        key: The cache key.
+        namespace (str): Is mixed into the digest. Should be different for different functions
+            that share the same storage.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(namespace.encode('utf-8'))
+    h.update(b"\0")
+    h.update(_canonical_bytes(key))
+    return h.digest()
+
+
+class SqliteCacheTier:
+    """
+    Persistent L2 tier of `AsyncCache` based on sqlite.
+
+    The file survives restart of the process, so after restart `AsyncCache` starts warm.
+    Size of the stored (serialized) values is limited by `max_bytes`, when it is exceeded the least
+    recently accessed entries are evicted down to `low_watermark` fraction of the budget.
+    All I/O is done off the event loop via `exec_in_executor()`.
+    """
+
+    def __init__(self, path, max_bytes: Optional[int] = None, namespace: str = '', serializer=pickle,
+                 low_watermark: float = 0.9, executor=None):
+        """
+        Initializes the SqliteCacheTier with the given parameters.
+
+        Args:
+            path: Path to sqlite file. It will be created, if it doesn't exist.
+            max_bytes (Optional[int]): Budget of the serialized values in bytes. Defaults to None (unlimited).
+            namespace (str): Namespace of the keys. Should be different for different functions that
+                share the same file. Defaults to ''.
+            serializer: Object with `dumps()` and `loads()` functions. Defaults to pickle.
+            low_watermark (float): On budget overflow the entries are evicted down to this fraction of max_bytes.
+                Defaults to 0.9.
+            executor (Optional[Executor]): Executor to run I/O in, see `exec_in_executor()`. Defaults to None.
+        """
+        self.path = os.fspath(path)
+        self.max_bytes = max_bytes
+        self.namespace = namespace
+        self.serializer = serializer
+        self.low_watermark = low_watermark
+        self.executor = executor
+        self.evictions = 0
+        self._conn = None
+        self._lock = threading.Lock()
+        self._total_bytes = None  # estimate, it is re-synced with the file on budget overflow
+
+    def _connection(self) -> sqlite3.Connection:
+        # should be called with self._lock acquired
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS entries ("
+                         "digest BLOB PRIMARY KEY, "
+                         "value BLOB NOT NULL, "
+                         "size INTEGER NOT NULL, "
+                         "expires_at REAL, "
+                         "accessed_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries(accessed_at)")
+            self._conn = conn
+            self._total_bytes = self._sum_bytes()
+        return self._conn
+
+    def _sum_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _get(self, key):
+        digest = stable_key_digest(key, self.namespace)
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value, expires_at FROM entries WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                return _MISSING
+            data, expires_at = row
+            now = time.time()
+            if expires_at is not None and expires_at <= now:
+                self._delete_locked(digest)
+                return _MISSING
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE digest = ?", (now, digest))
+        value = self.serializer.loads(data)
+        return value, (expires_at - now) if expires_at is not None else None
+
+    def _set(self, key, value, ttl):
+        digest = stable_key_digest(key, self.namespace)
+        data = self.serializer.dumps(value)
+        size = len(data)
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        if self.max_bytes is not None and size > self.max_bytes:
+            # doesn't fit at all, drop the old version, if any
+            self._delete(key)
+            return
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT size FROM entries WHERE digest = ?", (digest,)).fetchone()
+            conn.execute("INSERT OR REPLACE INTO entries (digest, value, size, expires_at, accessed_at) "
+                         "VALUES (?, ?, ?, ?, ?)", (digest, data, size, expires_at, now))
+            self._total_bytes += size - (row[0] if row is not None else 0)
+            if self.max_bytes is not None and self._total_bytes > self.max_bytes:
+                self._evict_locked(now)
+
+    def _evict_locked(self, now):
+        conn = self._conn
+        # other processes may share the file, so re-sync the estimate first
+        conn.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        self._total_bytes = self._sum_bytes()
+        target = int(self.max_bytes * self.low_watermark)
+        while self._total_bytes > target:
+            rows = conn.execute("SELECT digest, size FROM entries ORDER BY accessed_at LIMIT 64").fetchall()
+            if not rows:
+                break
+            for digest, size in rows:
+                conn.execute("DELETE FROM entries WHERE digest = ?", (digest,))
+                self._total_bytes -= size
+                self.evictions += 1
+                if self._total_bytes <= target:
+                    break
+
+    def _delete_locked(self, digest):
+        row = self._conn.execute("SELECT size FROM entries WHERE digest = ?", (digest,)).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM entries WHERE digest = ?", (digest,))
+            self._total_bytes -= row[0]
+
+    def _delete(self, key):
+        digest = stable_key_digest(key, self.namespace)
+        with self._lock:
+            self._connection()
+            self._delete_locked(digest)
+
+    def _clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM entries")
+            self._total_bytes = 0
+
+    def _close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @property
+    def current_bytes(self) -> int:
+        """Estimate of the size of the stored values in bytes."""
+        return self._total_bytes or 0
+
+    async def get(self, key: Any) -> Tuple[Any, Optional[float]]:
+        result = await exec_in_executor(self.executor, self._get, key)
+        if result is _MISSING:
+            raise KeyError(f"Key '{key}' not found in cache or has expired.")
+        return result
+
+    async def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        await exec_in_executor(self.executor, self._set, key, value, ttl)
+
+    async def delete(self, key: Any) -> None:
+        await exec_in_executor(self.executor, self._delete, key)
+
+    async def clear(self) -> None:
+        await exec_in_executor(self.executor, self._clear)
+
+    async def close(self) -> None:
+        await exec_in_executor(self.executor, self._close)
+
+
+try:
+    import fcntl
+    _is_available_fcntl = True
+except ImportError:
+    fcntl = None
+    _is_available_fcntl = False
+
+
+class SharedMemoryCacheTier:
+    """
+    L2 tier of `AsyncCache` that is shared by all processes on the host, for example, by pre-forked workers.
+
+    It is fixed-size open-addressing hash table in mmap'd file. The key digest selects a window of `probes`
+    consecutive slots, the key can be stored only in this window. When the window is full, the least recently
+    accessed slot of it is overwritten.
+
+    The slots are split into blocks of `probes` slots, every window lies in one or two adjacent blocks.
+    For the duration of the operation the blocks of the window are locked: by threading lock of every block
+    within the process and by `fcntl` byte-range lock across the processes. `fcntl` locks are owned by
+    the process, overlapping ranges of two threads would merge and unlock of one of them would release
+    the other, so the threading locks keep the ranges held by the threads of the process disjoint.
+
+    Values are stored in serialized form (pickle by default), values larger than the slot payload are not stored.
+    Every operation touches a few slots of shared memory only, so it is tried directly on the event loop
+    without blocking. If the blocks are locked by another thread or process, the operation waits for them
+    in the executor via `exec_in_executor()`, so the event loop is never blocked.
+
+    It requires `fcntl`, so it is available on POSIX only.
+    """
+
+    _MAGIC = b'ABSC'
+    _VERSION = 1
+    _FILE_HEADER = struct.Struct('<4sIIII')  # magic, version, slots, slot_size, probes
+    _SLOT_HEADER = struct.Struct('<B3xI16sdd')  # state, length, digest, expires_at, accessed_at
+    _EMPTY = 0
+    _USED = 1
+
+    def __init__(self, path, slots: int = 4096, slot_size: int = 4096, probes: int = 8, namespace: str = '',
+                 serializer=pickle, executor=None):
+        """
+        Initializes the SharedMemoryCacheTier with the given parameters.
+        The file is created and initialized by the first process, others attach to it
+        (the layout, that is slots, slot_size and probes, of the existing file is used).
+
+        Args:
+            path: Path to the backing file, it is better to place it on tmpfs, for example, in /dev/shm.
+            slots (int): Number of slots. Defaults to 4096.
+            slot_size (int): Size of the slot in bytes (including 40 bytes of slot header). Defaults to 4096.
+            probes (int): Number of slots in the window of the key. Defaults to 8.
+            namespace (str): Namespace of the keys. Should be different for different functions that
+                share the same file. Defaults to ''.
+            serializer: Object with `dumps()` and `loads()` functions. Defaults to pickle.
+            executor (Optional[Executor]): Executor to wait for the locked blocks in, see `exec_in_executor()`.
+                Defaults to None.
+        """
+        if not _is_available_fcntl:
+            raise NotImplementedError("SharedMemoryCacheTier requires fcntl, it is available on POSIX only.")
+        if slot_size <= self._SLOT_HEADER.size:
+            raise ValueError(f"slot_size should be greater than {self._SLOT_HEADER.size}.")
+        if not 0 < probes <= slots:
+            raise ValueError("probes should be positive and not greater than slots.")
+        self.path = os.fspath(path)
+        self.namespace = namespace
+        self.serializer = serializer
+        self.executor = executor
+
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self.slots, self.slot_size, self.probes = self._init_file(slots, slot_size, probes)
+            self._mm = mmap.mmap(self._fd, self._FILE_HEADER.size + self.slots * self.slot_size)
+        except Exception:
+            os.close(self._fd)
+            raise
+        self.max_value_size = self.slot_size - self._SLOT_HEADER.size
+        self._block_locks = [threading.Lock() for _ in range(-(-self.slots // self.probes))]
+
+    def _init_file(self, slots, slot_size, probes):
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self._fd, self._FILE_HEADER.size, 0)
+            if len(header) < self._FILE_HEADER.size:
+                # the first process initializes the file
+                os.ftruncate(self._fd, self._FILE_HEADER.size + slots * slot_size)
+                os.pwrite(self._fd, self._FILE_HEADER.pack(self._MAGIC, self._VERSION, slots, slot_size, probes), 0)
+                return slots, slot_size, probes
+            magic, version, slots, slot_size, probes = self._FILE_HEADER.unpack(header)
+            if magic != self._MAGIC or version != self._VERSION:
+                raise ValueError(f"{self.path} is not a shared cache file.")
+            # the layout of existing file wins
+            return slots, slot_size, probes
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def _window(self, digest: bytes) -> int:
+        # the window never wraps around the end of the table
+        return int.from_bytes(digest[:8], 'little') % (self.slots - self.probes + 1)
+
+    def _offset(self, index: int) -> int:
+        return self._FILE_HEADER.size + index * self.slot_size
+
+    @contextlib.contextmanager
+    def _locked_window(self, start: int, blocking: bool = True):
+        """
+        Locks the blocks of the window that starts at the slot `start`.
+
+        Raises:
+            BlockingIOError: If `blocking` is False and the blocks are locked by another thread or process.
+        """
+        first, last = start // self.probes, (start + self.probes - 1) // self.probes
+        with contextlib.ExitStack() as stack:
+            for block in range(first, last + 1):  # always in ascending order, so there is no deadlock
+                lock = self._block_locks[block]
+                if not lock.acquire(blocking):
+                    raise BlockingIOError("The window is locked by another thread.")
+                stack.callback(lock.release)
+            offset = self._offset(first * self.probes)
+            length = (min((last + 1) * self.probes, self.slots) - first * self.probes) * self.slot_size
+            try:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB, length, offset)
+            except OSError as e:
+                if e.errno in (errno.EACCES, errno.EAGAIN):
+                    raise BlockingIOError("The window is locked by another process.") from e
+                raise
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+
+    def _read_header(self, index):
+        return self._SLOT_HEADER.unpack_from(self._mm, self._offset(index))
+
+    def _find(self, start, digest):
+        # should be called with the window locked
+        for index in range(start, start + self.probes):
+            state, length, slot_digest, expires_at, _ = self._read_header(index)
+            if state == self._USED and slot_digest == digest:
+                return index, length, expires_at
+        return None, 0, 0.0
+
+    def _get(self, key: Any, blocking: bool = True) -> Tuple[Any, Optional[float]]:
+        digest = stable_key_digest(key, self.namespace)
+        start = self._window(digest)
+        with self._locked_window(start, blocking):
+            index, length, expires_at = self._find(start, digest)
+            if index is None:
+                return _MISSING
+            now = time.time()
+            offset = self._offset(index)
+            if expires_at and expires_at <= now:
+                self._SLOT_HEADER.pack_into(self._mm, offset, self._EMPTY, 0, b'', 0.0, 0.0)
+                return _MISSING
+            self._SLOT_HEADER.pack_into(self._mm, offset, self._USED, length, digest, expires_at, now)
+            payload_offset = offset + self._SLOT_HEADER.size
+            data = self._mm[payload_offset:payload_offset + length]
+        return self.serializer.loads(data), (expires_at - now) if expires_at else None
+
+    def _set(self, key: Any, value: Any, ttl: Optional[float] = None, blocking: bool = True) -> None:
+        digest = stable_key_digest(key, self.namespace)
+        data = self.serializer.dumps(value)
+        start = self._window(digest)
+        now = time.time()
+        with self._locked_window(start, blocking):
+            index, _, _ = self._find(start, digest)
+            if len(data) > self.max_value_size:
+                # doesn't fit at all, drop the old version, if any
+                if index is not None:
+                    self._SLOT_HEADER.pack_into(self._mm, self._offset(index), self._EMPTY, 0, b'', 0.0, 0.0)
+                return
+            if index is None:
+                index = self._choose_victim(start, now)
+            offset = self._offset(index)
+            payload_offset = offset + self._SLOT_HEADER.size
+            self._mm[payload_offset:payload_offset + len(data)] = data
+            expires_at = now + ttl if ttl is not None else 0.0
+            self._SLOT_HEADER.pack_into(self._mm, offset, self._USED, len(data), digest, expires_at, now)
+
+    def _choose_victim(self, start, now):
+        # empty or expired slot first, otherwise the least recently accessed one
+        victim, victim_accessed_at = start, float('inf')
+        for index in range(start, start + self.probes):
+            state, _, _, expires_at, accessed_at = self._read_header(index)
+            if state == self._EMPTY or (expires_at and expires_at <= now):
+                return index
+            if accessed_at < victim_accessed_at:
+                victim, victim_accessed_at = index, accessed_at
+        return victim
+
+    def _delete(self, key: Any, blocking: bool = True) -> None:
+        digest = stable_key_digest(key, self.namespace)
+        start = self._window(digest)
+        with self._locked_window(start, blocking):
+            index, _, _ = self._find(start, digest)
+            if index is not None:
+                self._SLOT_HEADER.pack_into(self._mm, self._offset(index), self._EMPTY, 0, b'', 0.0, 0.0)
+
+    def _clear(self) -> None:
+        # block by block, so the other processes are not stopped for the whole pass
+        for start in range(0, self.slots, self.probes):
+            start = min(start, self.slots - self.probes)
+            with self._locked_window(start):
+                for index in range(start, start + self.probes):
+                    self._SLOT_HEADER.pack_into(self._mm, self._offset(index), self._EMPTY, 0, b'', 0.0, 0.0)
+
+    def _close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+            os.close(self._fd)
+
+    async def _run(self, func, *args):
+        try:
+            return func(*args, blocking=False)
+        except BlockingIOError:
+            # contention, wait for the window off the event loop
+            return await exec_in_executor(self.executor, func, *args)
+
+    async def get(self, key: Any) -> Tuple[Any, Optional[float]]:
+        result = await self._run(self._get, key)
+        if result is _MISSING:
+            raise KeyError(f"Key '{key}' not found in cache or has expired.")
+        return result
+
+    async def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        await self._run(self._set, key, value, ttl)
+
+    async def delete(self, key: Any) -> None:
+        await self._run(self._delete, key)
+
+    async def clear(self) -> None:
+        # many windows, it is always done off the event loop
+        await exec_in_executor(self.executor, self._clear)
+
+    async def close(self) -> None:
+        self._close()
+
+
+class RespError(Exception):
+    """Error reply of RESP server."""
+
+
+def _resp_encode(*args) -> bytes:
+    """Encodes the command as RESP array of bulk strings."""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode('utf-8')
+        elif isinstance(arg, int):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+def _resp_encode_reply(value) -> bytes:
+    """Encodes the reply of the server."""
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, RespError):
+        return b"-ERR %s\r\n" % str(value).encode()
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode()
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, (bytes, bytearray)):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    return b"*%d\r\n" % len(value) + b"".join(_resp_encode_reply(v) for v in value)
+
+
+async def _resp_read(reader: asyncio.StreamReader):
+    """
+    Reads one RESP value. Error reply is returned (not raised) as `RespError`, so the rest of the pipeline is read.
+    """
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection is closed.")
+    prefix, payload = line[:1], line[1:-2]
+    if prefix == b"+":
+        return payload.decode()
+    if prefix == b"-":
+        return RespError(payload.decode())
+    if prefix == b":":
+        return int(payload)
+    if prefix == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if prefix == b"*":
+        length = int(payload)
+        if length < 0:
+            return None
+        return [await _resp_read(reader) for _ in range(length)]
+    raise RespError(f"Unexpected RESP reply {line!r}.")
+
+
+class _RespConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def execute(self, *commands) -> list:
+        """Sends all commands in one write (pipeline) and reads their replies."""
+        self.writer.write(b"".join(_resp_encode(*command) for command in commands))
+        await self.writer.drain()
+        return [await _resp_read(self.reader) for _ in commands]
+
+    def close(self):
+        self.writer.close()
+
+
+class RespCacheTier:
+    """
+    Remote L2 tier of `AsyncCache` that speaks Redis RESP protocol over asyncio streams,
+    so the L1 of `AsyncCache` (for example, LFU) is near cache in front of it.
+
+    Connections are pooled (up to `max_connections`, the connection that failed is dropped).
+    `get_many()` and `set_many()` send all commands in one pipeline, TTL is applied by the server (SET PX).
+    If `channel` is set, every write publishes invalidation message to this channel and the tier subscribes
+    to it, the messages of other nodes are passed to the listeners (see `add_invalidation_listener()`),
+    so the near caches of all nodes stay coherent. Values and keys in the messages are serialized
+    (pickle by default), so the server and the other nodes should be trusted.
+
+    It should be used from single event loop. `RespStandInServer` can be used instead of Redis in tests.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 6379, namespace: str = '', serializer=pickle,
+                 max_connections: int = 8, channel: Optional[str] = None):
+        """
+        Initializes the RespCacheTier with the given parameters.
+
+        Args:
+            host (str): Host of the server. Defaults to '127.0.0.1'.
+            port (int): Port of the server. Defaults to 6379.
+            namespace (str): Namespace of the keys (prefix of the keys on the server). Should be different for
+                different functions that share the same server. Defaults to ''.
+            serializer: Object with `dumps()` and `loads()` functions. Defaults to pickle.
+            max_connections (int): Maximum number of pooled connections. Defaults to 8.
+            channel (Optional[str]): Pub/sub channel of invalidation messages. Defaults to None (no messages).
+        """
+        if max_connections < 1:
+            raise ValueError("max_connections should be positive.")
+        self.host = host
+        self.port = port
+        self.namespace = namespace
+        self.serializer = serializer
+        self.max_connections = max_connections
+        self.channel = channel
+        self.node_id = uuid.uuid4().bytes
+        self._prefix = f"abu:{namespace}:".encode('utf-8')
+        self._idle: List[_RespConnection] = []
+        self._semaphore = None
+        self._listeners = []
+        self._subscriber = None
+        self._subscribed = asyncio.Event()
+
+    def _key(self, key: Any) -> bytes:
+        return self._prefix + stable_key_digest(key, self.namespace).hex().encode()
+
+    async def _connect(self) -> _RespConnection:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        return _RespConnection(reader, writer)
+
+    async def _execute(self, *commands) -> list:
+        if self._listeners and self._subscriber is None:
+            self._start_subscriber()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+        async with self._semaphore:
+            conn = self._idle.pop() if self._idle else await self._connect()
+            try:
+                replies = await conn.execute(*commands)
+            except BaseException:
+                conn.close()
+                raise
+            self._idle.append(conn)
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def _publish_command(self, payload: bytes):
+        return 'PUBLISH', self.channel, self.node_id + payload
+
+    @staticmethod
+    def _ttl_left(pttl) -> Optional[float]:
+        return pttl / 1000 if isinstance(pttl, int) and pttl >= 0 else None
+
+    async def get(self, key: Any) -> Tuple[Any, Optional[float]]:
+        k = self._key(key)
+        data, pttl = await self._execute(('GET', k), ('PTTL', k))
+        if data is None:
+            raise KeyError(f"Key '{key}' not found in cache.")
+        return self.serializer.loads(data), self._ttl_left(pttl)
+
+    async def get_many(self, keys: Iterable[Any]) -> Dict[Any, Tuple[Any, Optional[float]]]:
+        """Returns key -> (value, remaining TTL) for the found keys only, all keys are fetched in one pipeline."""
+        keys = list(keys)
+        if not keys:
+            return {}
+        commands = []
+        for key in keys:
+            k = self._key(key)
+            commands.append(('GET', k))
+            commands.append(('PTTL', k))
+        replies = await self._execute(*commands)
+        found = {}
+        for i, key in enumerate(keys):
+            data, pttl = replies[2 * i], replies[2 * i + 1]
+            if data is not None:
+                found[key] = (self.serializer.loads(data), self._ttl_left(pttl))
+        return found
+
+    def _set_commands(self, key: Any, value: Any, ttl: Optional[float]) -> list:
+        command = ['SET', self._key(key), self.serializer.dumps(value)]
+        if ttl is not None:
+            command.extend(('PX', max(1, int(ttl * 1000))))
+        commands = [command]
+        if self.channel is not None:
+            commands.append(self._publish_command(b"K" + self.serializer.dumps(key)))
+        return commands
+
+    async def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        await self._execute(*self._set_commands(key, value, ttl))
+
+    async def set_many(self, items: Iterable[Tuple[Any, Any]], ttl: Optional[float] = None) -> None:
+        """Stores many (key, value) pairs in one pipeline."""
+        commands = []
+        for key, value in items:
+            commands.extend(self._set_commands(key, value, ttl))
+        if commands:
+            await self._execute(*commands)
+
+    async def delete(self, key: Any) -> None:
+        commands = [('DEL', self._key(key))]
+        if self.channel is not None:
+            commands.append(self._publish_command(b"K" + self.serializer.dumps(key)))
+        await self._execute(*commands)
+
+    async def clear(self) -> None:
+        """Removes all keys of the namespace."""
+        cursor = b"0"
+        while True:
+            (reply,) = await self._execute(('SCAN', cursor, 'MATCH', self._prefix + b"*", 'COUNT', 1000))
+            cursor, keys = reply
+            if keys:
+                await self._execute(('DEL', *keys))
+            if cursor in (b"0", 0):
+                break
+        if self.channel is not None:
+            await self._execute(self._publish_command(b"C"))
+
+    def add_invalidation_listener(self, callback: Callable[[Any], Awaitable[None]]) -> None:
+        """
+        Registers the coroutine function that is called with the key changed by another node (None means all keys).
+        Only if channel is set. The subscription is started on the first command or by `start()`.
+        """
+        if self.channel is not None:
+            self._listeners.append(callback)
+
+    async def start(self) -> None:
+        """
+        Starts the subscription to invalidation messages and waits until it is established.
+        It is not required, but otherwise the messages published before the first command are missed.
+        """
+        if self._listeners:
+            if self._subscriber is None:
+                self._start_subscriber()
+            await self._subscribed.wait()
+
+    def _start_subscriber(self):
+        self._subscriber = asyncio.ensure_future(self._subscribe())
+
+    async def _subscribe(self):
+        delay = 0.1
+        while True:
+            conn = None
+            try:
+                conn = await self._connect()
+                await conn.execute(('SUBSCRIBE', self.channel))
+                self._subscribed.set()
+                delay = 0.1
+                while True:
+                    message = await _resp_read(conn.reader)
+                    if isinstance(message, list) and len(message) == 3 and message[0] == b"message":
+                        await self._on_message(message[2])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Subscription to %s failed, reconnecting", self.channel, exc_info=True)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+            finally:
+                self._subscribed.clear()
+                if conn is not None:
+                    conn.close()
+
+    async def _on_message(self, data: bytes):
+        node_id, payload = data[:16], data[16:]
+        if node_id == self.node_id:
+            return
+        key = self.serializer.loads(payload[1:]) if payload[:1] == b"K" else None
+        for callback in self._listeners:
+            try:
+                await callback(key)
+            except Exception:
+                logger.warning("Invalidation listener failed", exc_info=True)
+
+    async def close(self) -> None:
+        if self._subscriber is not None:
+            self._subscriber.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._subscriber
+            self._subscriber = None
+        while self._idle:
+            self._idle.pop().close()
+
+
+class RespStandInServer:
+    """
+    In-process asyncio stand-in for Redis server, so `RespCacheTier` can be tested without external services.
+
+    It speaks RESP and supports the subset of commands used by `RespCacheTier`: PING, GET, SET (with EX/PX),
+    DEL, PTTL, SCAN (with MATCH), FLUSHDB, PUBLISH and SUBSCRIBE. Data is kept in memory of the process.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        """
+        Args:
+            host (str): Host to listen on. Defaults to '127.0.0.1'.
+            port (int): Port to listen on, 0 means free port. The actual port is `port` after `start()`.
+        """
+        self.host = host
+        self.port = port
+        self.data = {}  # key -> (value, expires_at of time.monotonic() or None)
+        self.subscribers = {}  # channel -> set of StreamWriter
+        self.commands = 0
+        self._server = None
+        self._writers = set()
+
+    async def start(self) -> 'RespStandInServer':
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        try:
+            while True:
+                try:
+                    command = await _resp_read(reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    return
+                self.commands += 1
+                try:
+                    reply = self._dispatch(command, writer)
+                except Exception as e:
+                    reply = RespError(str(e))
+                writer.write(_resp_encode_reply(reply))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            for writers in self.subscribers.values():
+                writers.discard(writer)
+            writer.close()
+
+    def _get(self, key: bytes):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry
+
+    def _dispatch(self, command, writer):
+        if not isinstance(command, list) or not command:
+            raise ValueError("Command should be non-empty array.")
+        name, args = command[0].upper(), command[1:]
+        if name == b"PING":
+            return "PONG"
+        if name == b"GET":
+            entry = self._get(args[0])
+            return entry[0] if entry is not None else None
+        if name == b"SET":
+            expires_at = None
+            options = [a.upper() for a in args[2:]]
+            if b"PX" in options:
+                expires_at = time.monotonic() + int(args[2 + options.index(b"PX") + 1]) / 1000
+            elif b"EX" in options:
+                expires_at = time.monotonic() + int(args[2 + options.index(b"EX") + 1])
+            self.data[args[0]] = (args[1], expires_at)
+            return "OK"
+        if name == b"DEL":
+            return sum(1 for key in args if self._get(key) is not None and self.data.pop(key, None) is not None)
+        if name == b"PTTL":
+            entry = self._get(args[0])
+            if entry is None:
+                return -2
+            return -1 if entry[1] is None else max(0, int((entry[1] - time.monotonic()) * 1000))
+        if name == b"SCAN":
+            # the whole keyspace is returned at once, so the cursor is always 0
+            pattern = b"*"
+            options = [a.upper() for a in args[1:]]
+            if b"MATCH" in options:
+                pattern = args[1 + options.index(b"MATCH") + 1]
+            pattern = pattern.decode('latin-1')
+            keys = [key for key in list(self.data) if self._get(key) is not None and
+                    fnmatch.fnmatchcase(key.decode('latin-1'), pattern)]
+            return [b"0", keys]
+        if name == b"FLUSHDB":
+            self.data.clear()
+            return "OK"
+        if name == b"PUBLISH":
+            receivers = self.subscribers.get(args[0], set())
+            message = _resp_encode_reply([b"message", args[0], args[1]])
+            for receiver in list(receivers):
+                receiver.write(message)
+            return len(receivers)
+        if name == b"SUBSCRIBE":
+            self.subscribers.setdefault(args[0], set()).add(writer)
+            return [b"subscribe", args[0], 1]
+        raise ValueError(f"Unknown command '{name.decode()}'.")
@@ -101,6 +101,11 @@ class RLock:
     The `RLock` class provides mechanisms to acquire and release locks in both synchronous
     and asynchronous contexts, ensuring proper synchronization and reentrancy.
 
+    Uncontended and reentrant acquires take the fast path: single non-blocking acquire of the underlying
+    `threading.Lock` (the gate), no waiting queue is involved. Under contention the caller enters the fair FIFO queue
+    with its own `threading.Event` (`asyncio.Future` for the task), release hands the lock over directly
+    to the next waiter and wakes only it.
+
     See https://alex-ber.medium.com/a6b9a9021be8 for more details.
     """
 
@@ -108,8 +113,8 @@ class RLock:
         """
         Initializes the RLock instance with both synchronous and asynchronous locks.
         """
-        self._sync_lock = threading.RLock()  # Synchronous reentrant lock
-        self._async_lock = asyncio.Lock()  # Asynchronous lock
+        self._sync_gate = threading.Lock()  # Is held while the synchronous lock is owned
+        self._async_gate = threading.Lock()  # Is held while the asynchronous lock is owned
 
         self._sync_owner = None  # Owner of the synchronous lock
         self._async_owner = None  # Owner of the asynchronous lock
@@ -117,11 +122,19 @@ class RLock:
         self._sync_count = 0  # Reentrancy count for synchronous lock
         self._async_count = 0  # Reentrancy count for asynchronous lock
 
-        self._sync_condition = threading.Condition(self._sync_lock)  # Condition variable for synchronization
-        self._async_condition = asyncio.Condition()  # Asynchronous condition variable
+        self._sync_mutex = threading.Lock()  # Guards the queue of waiting threads
+        self._async_mutex = threading.Lock()  # Guards the queue of waiting tasks, is never held across await
+
+        self._sync_waiting = deque()  # Queue of (thread, Event) of waiting synchronous threads
+        self._async_waiting = deque()  # Queue of (task, Future) of waiting asynchronous tasks
 
-        self._sync_waiting = deque()  # Queue for waiting synchronous threads
-        self._async_waiting = deque()  # Queue for waiting asynchronous tasks
+    def _sync_handoff(self):
+        # should be called with self._sync_mutex held
+        if self._sync_waiting and self._sync_gate.acquire(blocking=False):
+            thread, event = self._sync_waiting.popleft()
+            self._sync_owner = thread
+            self._sync_count = 1
+            event.set()  # Wake only the new owner
 
     def acquire(self):
         """
@@ -129,20 +142,29 @@ class RLock:
         Returns:
             bool: True if the lock was successfully acquired.
         """
-        with self._sync_condition:
-            current_thread = threading.current_thread()
-            if self._sync_owner is current_thread:
-                self._sync_count += 1
-                return True  # Already acquired, no need to acquire again
-
-            self._sync_waiting.append(current_thread)
-            while self._sync_owner is not None or self._sync_waiting[0] != current_thread:
-                self._sync_condition.wait()  # Wait until the lock is available
+        current_thread = threading.current_thread()
+        if self._sync_owner is current_thread:
+            self._sync_count += 1
+            return True  # Already acquired, no need to acquire again
 
-            self._sync_waiting.popleft()
+        # Fast path, nobody waits and the gate is free
+        if not self._sync_waiting and self._sync_gate.acquire(blocking=False):
             self._sync_owner = current_thread
             self._sync_count = 1
-            return True  # Successfully acquired
+            return True
+
+        with self._sync_mutex:
+            waiter = (current_thread, threading.Event())
+            self._sync_waiting.append(waiter)
+            # the releaser frees the gate before it checks the queue, so either we get the gate here
+            # or the releaser sees us in the queue
+            if self._sync_waiting[0] is waiter and self._sync_gate.acquire(blocking=False):
+                self._sync_waiting.popleft()
+                self._sync_owner = current_thread
+                self._sync_count = 1
+                return True
+        waiter[1].wait()  # The releaser sets us as the owner before waking us up
+        return True  # Successfully acquired
 
     def release(self):
         """
@@ -152,16 +174,29 @@ class RLock:
         Raises:
             RuntimeError: If the current thread does not own the lock.
         """
-        with self._sync_condition:
-            current_thread = threading.current_thread()
-            if self._sync_owner is current_thread:
-                self._sync_count -= 1
-                if self._sync_count == 0:
-                    self._sync_owner = None
-                    self._sync_condition.notify_all()  # Notify all waiting threads
-                return True  # Successfully released
-            else:
-                raise RuntimeError("Cannot release a lock that's not owned by the current thread")
+        if self._sync_owner is not threading.current_thread():
+            raise RuntimeError("Cannot release a lock that's not owned by the current thread")
+        self._sync_count -= 1
+        if self._sync_count == 0:
+            self._sync_owner = None
+            self._sync_gate.release()
+            if self._sync_waiting:
+                with self._sync_mutex:
+                    self._sync_handoff()
+        return True  # Successfully released
+
+    def _async_handoff(self):
+        # should be called with self._async_mutex held
+        while self._async_waiting and self._async_gate.acquire(blocking=False):
+            task, future = self._async_waiting.popleft()
+            if future.done():
+                # the waiter was cancelled, it will not take the lock
+                self._async_gate.release()
+                continue
+            self._async_owner = task
+            self._async_count = 1
+            future.set_result(True)  # Wake only the new owner
+            break
 
     async def async_acquire(self):
         """
@@ -169,21 +204,39 @@ class RLock:
         Returns:
             bool: True if the lock was successfully acquired.
         """
-        async with self._async_condition:
-            current_task = asyncio.current_task()
-            if self._async_owner is current_task:
-                self._async_count += 1
-                return True  # Already acquired, no need to acquire again
-
-            self._async_waiting.append(current_task)
+        current_task = asyncio.current_task()
+        if self._async_owner is current_task:
+            self._async_count += 1
+            return True  # Already acquired, no need to acquire again
 
-            while self._async_owner is not None or self._async_waiting[0] != current_task:
-                await self._async_condition.wait()  # Wait until the lock is available
-
-            self._async_waiting.popleft()  # Remove the task from waiting queue once it acquires the lock
+        # Fast path, nobody waits and the gate is free
+        if not self._async_waiting and self._async_gate.acquire(blocking=False):
             self._async_owner = current_task
             self._async_count = 1
-            return True  # Successfully acquired
+            return True
+
+        with self._async_mutex:
+            waiter = (current_task, asyncio.get_running_loop().create_future())
+            self._async_waiting.append(waiter)
+            if self._async_waiting[0] is waiter and self._async_gate.acquire(blocking=False):
+                self._async_waiting.popleft()
+                self._async_owner = current_task
+                self._async_count = 1
+                return True
+        try:
+            await waiter[1]  # The releaser sets us as the owner before waking us up
+        except BaseException:
+            with self._async_mutex:
+                if self._async_owner is current_task:
+                    # the lock was handed over to us before the cancellation, pass it on
+                    self._async_owner = None
+                    self._async_count = 0
+                    self._async_gate.release()
+                    self._async_handoff()
+                elif waiter in self._async_waiting:
+                    self._async_waiting.remove(waiter)
+            raise
+        return True  # Successfully acquired
 
     async def async_release(self):
         """
@@ -193,16 +246,16 @@ class RLock:
         Raises:
             RuntimeError: If the current task does not own the lock.
         """
-        async with self._async_condition:
-            current_task = asyncio.current_task()
-            if self._async_owner is current_task:
-                self._async_count -= 1
-                if self._async_count == 0:
-                    self._async_owner = None
-                    self._async_condition.notify_all()  # Notify all waiting tasks
-                return True  # Successfully released
-            else:
-                raise RuntimeError("Cannot release a lock that's not owned by the current task")
+        if self._async_owner is not asyncio.current_task():
+            raise RuntimeError("Cannot release a lock that's not owned by the current task")
+        self._async_count -= 1
+        if self._async_count == 0:
+            self._async_owner = None
+            self._async_gate.release()
+            if self._async_waiting:
+                with self._async_mutex:
+                    self._async_handoff()
+        return True  # Successfully released
 
     def __enter__(self):
         """
@@ -230,6 +283,445 @@ class RLock:
         """
         await self.async_release()
 
+class _RWLockSide:
+    """
+    State of one (synchronous or asynchronous) side of `RWLock`.
+
+    Owners are threads or tasks. Waiters are queued in FIFO order, every waiter has its own signal
+    (`threading.Event` or `asyncio.Future`), the lock is handed over directly to the waiters that can take it.
+    """
+
+    def __init__(self, wake):
+        self._wake = wake  # wakes the waiter, returns False if the waiter is gone (cancelled)
+        self._mutex = threading.Lock()  # Guards the state below, is never held across blocking call or await
+        self._writer = None  # Owner of the write lock
+        self._write_count = 0  # Reentrancy count of the write lock
+        self._readers = {}  # Owner of the read lock -> reentrancy count
+        self._waiting = deque()  # Queue of (owner, is_writer, signal)
+
+    def enter(self, owner, is_writer, new_signal):
+        """
+        Takes the lock if possible, otherwise enqueues the owner.
+        Returns None if the lock was taken, or the signal to wait on.
+        """
+        with self._mutex:
+            if is_writer:
+                if self._writer is owner:
+                    self._write_count += 1
+                    return None
+                if owner in self._readers:
+                    raise RuntimeError("Cannot upgrade read lock to write lock, release the read lock first")
+                if not self._waiting and self._writer is None and not self._readers:
+                    self._writer = owner
+                    self._write_count = 1
+                    return None
+            else:
+                if self._writer is owner or owner in self._readers:
+                    # reentrant read (or read under own write) doesn't wait, otherwise it deadlocks with queued writer
+                    self._readers[owner] = self._readers.get(owner, 0) + 1
+                    return None
+                if not self._waiting and self._writer is None:
+                    self._readers[owner] = 1
+                    return None
+            signal = new_signal()
+            self._waiting.append((owner, is_writer, signal))
+            return signal
+
+    def exit(self, owner, is_writer):
+        with self._mutex:
+            self._exit(owner, is_writer)
+
+    def _exit(self, owner, is_writer):
+        # should be called with self._mutex held
+        if is_writer:
+            if self._writer is not owner:
+                raise RuntimeError("Cannot release a write lock that's not owned by the caller")
+            self._write_count -= 1
+            if self._write_count == 0:
+                self._writer = None
+                self._grant()
+        else:
+            count = self._readers.get(owner)
+            if count is None:
+                raise RuntimeError("Cannot release a read lock that's not owned by the caller")
+            if count == 1:
+                del self._readers[owner]
+                self._grant()
+            else:
+                self._readers[owner] = count - 1
+
+    def _grant(self):
+        # should be called with self._mutex held
+        while self._waiting:
+            owner, is_writer, signal = self._waiting[0]
+            if is_writer:
+                if self._writer is not None or self._readers:
+                    break
+                self._waiting.popleft()
+                self._writer = owner
+                self._write_count = 1
+                if self._wake(signal):
+                    break
+                # the waiter is gone, take the lock back
+                self._writer = None
+                self._write_count = 0
+            else:
+                if self._writer is not None:
+                    break
+                self._waiting.popleft()
+                self._readers[owner] = 1
+                if not self._wake(signal):
+                    del self._readers[owner]
+
+    def abandon(self, owner, is_writer, signal):
+        """
+        Called by the waiter that was interrupted (cancelled). If the lock was already handed over, passes it on.
+        """
+        with self._mutex:
+            if (self._writer is owner) if is_writer else (owner in self._readers):
+                self._exit(owner, is_writer)
+            else:
+                try:
+                    self._waiting.remove((owner, is_writer, signal))
+                except ValueError:
+                    pass
+                self._grant()  # the readers behind the removed writer may proceed now
+
+
+def _set_event(event):
+    event.set()
+    return True
+
+
+def _set_future(future):
+    if future.done():
+        return False
+    future.set_result(True)
+    return True
+
+
+class RWLock:
+    """
+    A reentrant reader-writer lock that supports both synchronous and asynchronous operations.
+
+    It has the same API as `RLock`: `acquire()`/`release()`, `async_acquire()`/`async_release()` and
+    (async) context manager, all of them take the exclusive write lock, so `RWLock` can be used everywhere
+    `RLock` is used. The shared read lock is available through `read_lock`, it has the same dual API.
+    Many readers hold the read lock in parallel, writer holds the lock exclusively.
+
+    As in `RLock`, synchronous and asynchronous sides are independent. Both locks are reentrant,
+    owner of the write lock may also take the read lock, upgrade of read lock to write lock raises `RuntimeError`.
+    Waiters are served in FIFO order, so the writers are not starved by the stream of new readers.
+    """
+
+    def __init__(self):
+        """
+        Initializes the RWLock instance with both synchronous and asynchronous sides.
+        """
+        self._sync = _RWLockSide(_set_event)
+        self._async = _RWLockSide(_set_future)
+        self._read_lock = _ReadLock(self)
+
+    @property
+    def read_lock(self):
+        """
+        Shared side of the lock, it has the same API as `RLock`.
+        """
+        return self._read_lock
+
+    def _sync_acquire(self, is_writer):
+        event = self._sync.enter(threading.current_thread(), is_writer, threading.Event)
+        if event is not None:
+            event.wait()  # The releaser makes us an owner before waking us up
+        return True
+
+    async def _async_acquire(self, is_writer):
+        current_task = asyncio.current_task()
+        future = self._async.enter(current_task, is_writer, asyncio.get_running_loop().create_future)
+        if future is not None:
+            try:
+                await future  # The releaser makes us an owner before waking us up
+            except BaseException:
+                self._async.abandon(current_task, is_writer, future)
+                raise
+        return True
+
+    def acquire(self):
+        """
+        Acquires the synchronous write lock, blocking until it is available.
+        Returns:
+            bool: True if the lock was successfully acquired.
+        """
+        return self._sync_acquire(True)
+
+    def release(self):
+        """
+        Releases the synchronous write lock.
+        Returns:
+            bool: True if the lock was successfully released.
+        Raises:
+            RuntimeError: If the current thread does not own the lock.
+        """
+        self._sync.exit(threading.current_thread(), True)
+        return True
+
+    async def async_acquire(self):
+        """
+        Acquires the asynchronous write lock, blocking until it is available.
+        Returns:
+            bool: True if the lock was successfully acquired.
+        """
+        return await self._async_acquire(True)
+
+    async def async_release(self):
+        """
+        Releases the asynchronous write lock.
+        Returns:
+            bool: True if the lock was successfully released.
+        Raises:
+            RuntimeError: If the current task does not own the lock.
+        """
+        self._async.exit(asyncio.current_task(), True)
+        return True
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    async def __aenter__(self):
+        await self.async_acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.async_release()
+
+
+class _ReadLock:
+    """
+    Shared side of `RWLock`, it has the same API as `RLock`.
+    """
+
+    def __init__(self, rwlock):
+        self._rwlock = rwlock
+
+    def acquire(self):
+        return self._rwlock._sync_acquire(False)
+
+    def release(self):
+        self._rwlock._sync.exit(threading.current_thread(), False)
+        return True
+
+    async def async_acquire(self):
+        return await self._rwlock._async_acquire(False)
+
+    async def async_release(self):
+        self._rwlock._async.exit(asyncio.current_task(), False)
+        return True
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    async def __aenter__(self):
+        await self.async_acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.async_release()
+
+
+def reader_method(func):
+    """
+    Marks the method of the object wrapped by `LockingProxy` as reader, it is called under the read lock,
+    if the lock of the proxy is `RWLock`.
+    """
+    func._locking_mode = 'read'
+    return func
+
+
+def writer_method(func):
+    """
+    Marks the method of the object wrapped by `LockingProxy` as writer, it is called under the exclusive lock
+    even if it is listed in `readers` of the proxy. This is the default for unmarked methods.
+    """
+    func._locking_mode = 'write'
+    return func
+
+
+class Semaphore:
+    """
+    A semaphore that supports both synchronous and asynchronous operations.
+
+    At most `value` owners hold it at the same time. The permits are shared by synchronous (threads)
+    and asynchronous (tasks) sides, so the limit holds for all the callers together. As `RLock`, it is reentrant:
+    the owner that already holds a permit re-enters without taking another one. Synchronous acquire that is called
+    from the coroutine is owned by its task, so the task that holds the permit may call the synchronous side too.
+
+    Callers beyond the limit wait in single FIFO queue, release hands the permit over directly to the next waiter
+    and wakes only it. Synchronous acquire on the thread of the running event loop never waits: the holder
+    may be a task of this very loop, so it raises `RuntimeError` instead of blocking the loop forever.
+    """
+
+    def __init__(self, value=1):
+        """
+        Initializes the Semaphore with `value` permits.
+        """
+        if value is None or value < 1:
+            raise ValueError(f"Semaphore value should be at least 1, got {value}")
+        self._value = value  # Free permits
+        self._owners = {}  # Owner (thread or task) -> reentrancy count
+        self._mutex = threading.Lock()  # Guards the state, is never held across blocking call or await
+        self._waiting = deque()  # Queue of (owner, threading.Event) of threads and (owner, asyncio.Future) of tasks
+
+    @staticmethod
+    def _sync_owner():
+        """
+        Returns the owner of the synchronous call and whether it is done on the thread of the running event loop.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return threading.current_thread(), False
+        task = asyncio.current_task()
+        return (task if task is not None else threading.current_thread()), True
+
+    def _enter(self, owner):
+        # should be called with self._mutex held, returns True if the permit is held now
+        count = self._owners.get(owner)
+        if count is not None:
+            self._owners[owner] = count + 1
+            return True
+        if not self._waiting and self._value > 0:
+            self._value -= 1
+            self._owners[owner] = 1
+            return True
+        return False
+
+    def _exit(self, owner):
+        # should be called with self._mutex held
+        count = self._owners.get(owner)
+        if count is None:
+            raise RuntimeError("Cannot release a semaphore that's not held by the current thread (task)")
+        if count > 1:
+            self._owners[owner] = count - 1
+            return
+        del self._owners[owner]
+        self._release()
+
+    def _release(self):
+        # should be called with self._mutex held, the permit is handed over to the next waiter, if any
+        if self._waiting:
+            owner, signal = self._waiting.popleft()
+            self._owners[owner] = 1
+            if isinstance(signal, threading.Event):
+                signal.set()
+            else:
+                # the future may belong to the event loop of another thread
+                signal.get_loop().call_soon_threadsafe(self._wake_future, owner, signal)
+            return
+        self._value += 1
+
+    def _wake_future(self, owner, future):
+        # runs in the event loop of the future
+        if future.done():
+            # the task was cancelled before it received the permit, pass it on
+            with self._mutex:
+                self._exit(owner)
+        else:
+            future.set_result(True)
+
+    def acquire(self):
+        """
+        Acquires the permit, blocking until it is available.
+        Returns:
+            bool: True if the permit was successfully acquired.
+        Raises:
+            RuntimeError: If it is called on the thread of the running event loop and the permit is not available.
+        """
+        owner, in_event_loop = self._sync_owner()
+        with self._mutex:
+            if self._enter(owner):
+                return True
+            if in_event_loop:
+                raise RuntimeError("Semaphore is not available, waiting for it would block the running event loop, "
+                                   "use async_acquire() instead")
+            event = threading.Event()
+            self._waiting.append((owner, event))
+        event.wait()  # The releaser hands the permit over before waking us up
+        return True
+
+    def release(self):
+        """
+        Releases the permit.
+        Returns:
+            bool: True if the permit was successfully released.
+        Raises:
+            RuntimeError: If the current thread (task) doesn't hold the permit.
+        """
+        owner, _ = self._sync_owner()
+        with self._mutex:
+            self._exit(owner)
+        return True
+
+    async def async_acquire(self):
+        """
+        Acquires the permit, awaiting until it is available.
+        Returns:
+            bool: True if the permit was successfully acquired.
+        """
+        owner = asyncio.current_task()
+        with self._mutex:
+            if self._enter(owner):
+                return True
+            waiter = (owner, asyncio.get_running_loop().create_future())
+            self._waiting.append(waiter)
+        try:
+            await waiter[1]  # The releaser hands the permit over before waking us up
+        except BaseException:
+            future = waiter[1]
+            with self._mutex:
+                if waiter in self._waiting:
+                    self._waiting.remove(waiter)
+                elif future.done() and not future.cancelled():
+                    # the permit was handed over before the cancellation, pass it on
+                    self._exit(owner)
+                # otherwise the permit is on its way, _wake_future() will pass it on
+            raise
+        return True
+
+    async def async_release(self):
+        """
+        Releases the permit.
+        Returns:
+            bool: True if the permit was successfully released.
+        Raises:
+            RuntimeError: If the current task doesn't hold the permit.
+        """
+        with self._mutex:
+            self._exit(asyncio.current_task())
+        return True
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    async def __aenter__(self):
+        await self.async_acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.async_release()
+
+
 class LockingIterableMixin(RootMixin):
     """
     A mixin class that provides locking for iterable objects.
@@ -528,7 +1020,7 @@ class AsyncContextManagerMixin:
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        self._lock.async_release()
+        await self._lock.async_release()
 
 class LockingAccessMixin(LockingPedanticObjMixin):
     """
@@ -551,6 +1043,20 @@ class LockingAccessMixin(LockingPedanticObjMixin):
         validate_param(self._obj, 'obj')
         self._lock = kwargs.get('lock')
         validate_param(self._lock, 'lock')
+        self._readers = frozenset(kwargs.get('readers') or ())
+        self._wrappers = {}  # name -> (routine, its synchronized wrapper)
+
+    def _lock_for(self, name, attr):
+        """
+        Returns the lock to call the method with: the read lock of `RWLock` for reader methods
+        (see `reader_method()` and `readers`), otherwise the lock itself.
+        """
+        if getattr(type(self._lock), 'read_lock', None) is None:
+            return self._lock
+        mode = getattr(attr, '_locking_mode', None)
+        if mode == 'read' or (mode is None and name in self._readers):
+            return self._lock.read_lock
+        return self._lock
 
     def __getattr__(self, name):
         """
@@ -563,27 +1069,17 @@ class LockingAccessMixin(LockingPedanticObjMixin):
         any: The attribute value.
         """
         attr = getattr(self._obj, name)
+        cached = self._wrappers.get(name)
+        if cached is not None:
+            cached_attr, wrapper = cached
+            # bound methods are created on every access, they are equal if __self__ and __func__ are the same,
+            # so the wrapper is reused until the attribute is rebound on the instance or on its class
+            if cached_attr is attr or (type(cached_attr) is type(attr) and cached_attr == attr):
+                return wrapper
         if inspect.isroutine(attr):
-            if self._is_pedantic_obj and name == '_copy_and_set_values':
-                # special case for Pydantic
-                @functools.wraps(attr)
-                def synchronized_method(*args, **kwargs):
-                    with self._lock:
-                        attr(*args, **kwargs)
-                    return self
-                return synchronized_method
-            elif inspect.iscoroutinefunction(attr):
-                @functools.wraps(attr)
-                async def asynchronized_method(*args, **kwargs):
-                    async with self._lock:
-                        return await attr(*args, **kwargs)
-                return asynchronized_method
-            else:
-                @functools.wraps(attr)
-                def synchronized_method(*args, **kwargs):
-                    with self._lock:
-                        return attr(*args, **kwargs)
-                return synchronized_method
+            wrapper = self._make_wrapper(name, attr)
+            self._wrappers[name] = (attr, wrapper)
+            return wrapper
         elif hasattr(attr, '__get__') or hasattr(attr, '__set__') or hasattr(attr, '__delete__'):
             # Handle property or descriptor
             if hasattr(attr, '__get__'):
@@ -592,6 +1088,32 @@ class LockingAccessMixin(LockingPedanticObjMixin):
         else:
             return attr
 
+    def _make_wrapper(self, name, attr):
+        """
+        Returns synchronized (or asynchronized) wrapper of the method `attr`.
+        """
+        if self._is_pedantic_obj and name == '_copy_and_set_values':
+            # special case for Pydantic
+            @functools.wraps(attr)
+            def synchronized_method(*args, **kwargs):
+                with self._lock:
+                    attr(*args, **kwargs)
+                return self
+            return synchronized_method
+        lock = self._lock_for(name, attr)
+        if inspect.iscoroutinefunction(attr):
+            @functools.wraps(attr)
+            async def asynchronized_method(*args, **kwargs):
+                async with lock:
+                    return await attr(*args, **kwargs)
+            return asynchronized_method
+        else:
+            @functools.wraps(attr)
+            def synchronized_method(*args, **kwargs):
+                with lock:
+                    return attr(*args, **kwargs)
+            return synchronized_method
+
 class LockingCallableMixin(RootMixin):
     """
     A mixin class that provides locking for callable objects.
@@ -641,7 +1163,8 @@ class LockingDefaultLockMixin(RootMixin):
     A mixin class that provides a default lock if none is provided.
 
     The `LockingDefaultLockMixin` class ensures that a default lock is used
-    if no lock is provided during initialization.
+    if no lock is provided during initialization. If 'max_concurrency' is provided,
+    `Semaphore` with that many permits is used instead of the lock.
 
     """
     def __init__(self, **kwargs):
@@ -650,9 +1173,14 @@ class LockingDefaultLockMixin(RootMixin):
 
         Parameters:
         **kwargs: Arbitrary keyword arguments, including 'obj' for the object
-                  and 'lock' for the lock.
+                  and 'lock' for the lock, or 'max_concurrency' for the number of concurrent calls.
         """
         lock = kwargs.get("lock", None)
+        max_concurrency = kwargs.get("max_concurrency", None)
+        if max_concurrency is not None:
+            if lock:
+                raise ValueError("Expected either lock or max_concurrency param, not both")
+            lock = Semaphore(max_concurrency)
         if not lock:
             lock = RLock()
         kwargs['lock'] = lock
@@ -829,6 +1357,9 @@ class LockingProxy(LockingDefaultAndBaseLanguageModelMixin,
     and callable objects, and thread-safe item access and modification
     and context management, async context management.
 
+    With `max_concurrency=N` instead of the lock, up to N calls run concurrently,
+    the callers beyond N wait in FIFO order (see `Semaphore`).
+
     See https://alex-ber.medium.com/7a7a14021427 for more details.
 
     """
@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+"""
+Micro-benchmarks for the policy engines of `alexber.utils.cache`.
+
+These are not collected by pytest, run them explicitly:
+
+    python -m tests.benchmarks.cache_bench
+"""
+import itertools
+import random
+import time
+
+from alexber.utils.cache import _LRUCache, _LFUCache, _WTinyLFUCache, _SIEVECache, _make_key_builder
+from alexber.utils.mains import make_hashable
+
+
+def _measure_hits_ns(cache, keys, rounds):
+    """Returns average latency (in ns) of a cache hit for the given keys."""
+    start_ns = time.perf_counter_ns()
+    for _ in range(rounds):
+        for key in keys:
+            cache[key]
+    elapsed_ns = time.perf_counter_ns() - start_ns
+    return elapsed_ns / (rounds * len(keys))
+
+
+def bench_lru_hit_latency(sizes=(1_000, 10_000, 100_000, 1_000_000), sample=10_000, rounds=10, seed=42):
+    """
+    Fills `_LRUCache` up to its `maxsize` and measures the latency of hits on random keys.
+    With O(1) engine the latency should stay flat while the cache grows.
+    """
+    rnd = random.Random(seed)
+    results = {}
+    for size in sizes:
+        cache = _LRUCache(maxsize=size)
+        for i in range(size):
+            cache[i] = i
+        keys = [rnd.randrange(size) for _ in range(sample)]
+        results[size] = _measure_hits_ns(cache, keys, rounds)
+    return results
+
+
+def zipf_keys(n, keyspace, s=1.1, seed=42):
+    """Returns `n` keys from `range(keyspace)` drawn from Zipf distribution with exponent `s`."""
+    rnd = random.Random(seed)
+    cum_weights = list(itertools.accumulate(1.0 / (rank ** s) for rank in range(1, keyspace + 1)))
+    return rnd.choices(range(keyspace), cum_weights=cum_weights, k=n)
+
+
+def bench_lfu_zipf(sizes=(1_000, 10_000, 100_000), keyspace=1_000_000, n=500_000, s=1.1, seed=42):
+    """
+    Replays Zipf-distributed keys through `_LFUCache` (get, on miss set).
+    Under such skewed workload most keys share few frequency buckets,
+    so the latency of an operation should not depend on the cache size.
+
+    Returns dict size -> (ns per operation, hit ratio).
+    """
+    keys = zipf_keys(n, keyspace, s=s, seed=seed)
+    results = {}
+    for size in sizes:
+        cache = _LFUCache(maxsize=size)
+        hits = 0
+        start_ns = time.perf_counter_ns()
+        for key in keys:
+            if key in cache:
+                cache[key]
+                hits += 1
+            else:
+                cache[key] = key
+        elapsed_ns = time.perf_counter_ns() - start_ns
+        results[size] = (elapsed_ns / n, hits / n)
+    return results
+
+
+def zipf_with_scans_keys(n, keyspace, scan_every=20_000, scan_len=5_000, s=0.9, seed=42):
+    """Zipf-distributed keys interleaved with one-off sequential scans of never repeated keys."""
+    keys = zipf_keys(n, keyspace, s=s, seed=seed)
+    trace = []
+    scan_key = keyspace
+    for i, key in enumerate(keys, 1):
+        trace.append(key)
+        if i % scan_every == 0:
+            trace.extend(range(scan_key, scan_key + scan_len))
+            scan_key += scan_len
+    return trace
+
+
+def loop_keys(n, loop_len):
+    """Cyclic access to `loop_len` keys, worst case of LRU when the loop is larger than the cache."""
+    return [i % loop_len for i in range(n)]
+
+
+def hit_ratio(cache, keys):
+    """Replays the trace through the cache (get, on miss set) and returns the hit ratio."""
+    hits = 0
+    for key in keys:
+        if key in cache:
+            cache[key]
+            hits += 1
+        else:
+            cache[key] = key
+    return hits / len(keys)
+
+
+_ENGINES = {
+    "LRU": _LRUCache,
+    "LFU": _LFUCache,
+    "W-TinyLFU": _WTinyLFUCache,
+    "SIEVE": _SIEVECache,
+}
+
+
+def bench_policies_hit_ratio(size=10_000, n=500_000, keyspace=200_000):
+    """
+    Compares the hit ratio of the policy engines on synthetic traces.
+
+    Returns dict trace name -> dict policy name -> hit ratio.
+    """
+    traces = {
+        "zipf": zipf_keys(n, keyspace, s=0.9),
+        "zipf+scans": zipf_with_scans_keys(n, keyspace),
+        "loop": loop_keys(n, int(size * 1.2)),
+    }
+    return {trace_name: {name: hit_ratio(engine_cls(maxsize=size), trace)
+                         for name, engine_cls in _ENGINES.items()}
+            for trace_name, trace in traces.items()}
+
+
+def bench_key_builder(n=100_000):
+    """
+    Measures the cost (in ns) of building the cache key of the call `f(1, 'a', c=2.0)`
+    by the precompiled key builder of `async_cache()` and by walking all arguments with `make_hashable()`.
+    """
+    async def f(a, b, c=None):
+        pass
+
+    build_key = _make_key_builder(f)
+    args, kwargs = (1, 'a'), {'c': 2.0}
+    results = {}
+    start_ns = time.perf_counter_ns()
+    for _ in range(n):
+        build_key(args, kwargs)
+    results['key builder'] = (time.perf_counter_ns() - start_ns) / n
+    start_ns = time.perf_counter_ns()
+    for _ in range(n):
+        make_hashable((args, frozenset(kwargs.items())))
+    results['make_hashable'] = (time.perf_counter_ns() - start_ns) / n
+    return results
+
+
+def main():
+    print("LRU hit latency:")
+    for size, latency_ns in bench_lru_hit_latency().items():
+        print(f"  {size:>9,} entries: {latency_ns:8.1f} ns/hit")
+
+    print("LFU on Zipf-distributed keys:")
+    for size, (latency_ns, ratio) in bench_lfu_zipf().items():
+        print(f"  {size:>9,} entries: {latency_ns:8.1f} ns/op, hit ratio {ratio:.4f}")
+
+    print("Cache key of f(1, 'a', c=2.0):")
+    for name, latency_ns in bench_key_builder().items():
+        print(f"  {name:>13}: {latency_ns:8.1f} ns/key")
+
+    print("Hit ratio of the policies:")
+    for trace_name, ratios in bench_policies_hit_ratio().items():
+        line = ", ".join(f"{name} {ratio:.4f}" for name, ratio in ratios.items())
+        print(f"  {trace_name:>10}: {line}")
+
+
+if __name__ == "__main__":
+    main()
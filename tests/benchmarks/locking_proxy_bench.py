@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+"""
+Micro-benchmarks for the call overhead of `alexber.utils.thread_locals.LockingProxy`.
+
+These are not collected by pytest, run them explicitly:
+
+    python -m tests.benchmarks.locking_proxy_bench
+"""
+import asyncio
+import time
+
+from alexber.utils.thread_locals import RLock, LockingProxy
+
+
+class _Client:
+    def method(self, x):
+        return x
+
+    async def amethod(self, x):
+        return x
+
+
+def bench_sync_call(n=300_000):
+    """
+    Measures the cost (in ns) of the call `proxy.method(1)` and of the same call done by hand
+    under the same `RLock`: `with lock: obj.method(1)`.
+    """
+    obj = _Client()
+    lock = RLock()
+    proxy = LockingProxy(obj=obj, lock=lock)
+
+    results = {}
+    start_ns = time.perf_counter_ns()
+    for _ in range(n):
+        with lock:
+            obj.method(1)
+    results['plain locked call'] = (time.perf_counter_ns() - start_ns) / n
+
+    start_ns = time.perf_counter_ns()
+    for _ in range(n):
+        proxy.method(1)
+    results['LockingProxy call'] = (time.perf_counter_ns() - start_ns) / n
+    return results
+
+
+def bench_async_call(n=100_000):
+    """
+    Measures the cost (in ns) of the call `await proxy.amethod(1)` and of the same call done by hand
+    under the same `RLock`: `async with lock: await obj.amethod(1)`.
+    """
+    async def run():
+        obj = _Client()
+        lock = RLock()
+        proxy = LockingProxy(obj=obj, lock=lock)
+
+        results = {}
+        start_ns = time.perf_counter_ns()
+        for _ in range(n):
+            async with lock:
+                await obj.amethod(1)
+        results['plain locked call'] = (time.perf_counter_ns() - start_ns) / n
+
+        start_ns = time.perf_counter_ns()
+        for _ in range(n):
+            await proxy.amethod(1)
+        results['LockingProxy call'] = (time.perf_counter_ns() - start_ns) / n
+        return results
+
+    return asyncio.run(run())
+
+
+def main():
+    print("Synchronous method call:")
+    for name, latency_ns in bench_sync_call().items():
+        print(f"  {name:>18}: {latency_ns:8.1f} ns/call")
+
+    print("Asynchronous method call:")
+    for name, latency_ns in bench_async_call().items():
+        print(f"  {name:>18}: {latency_ns:8.1f} ns/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+"""
+Micro-benchmarks for `alexber.utils.thread_locals.RLock`.
+
+These are not collected by pytest, run them explicitly:
+
+    python -m tests.benchmarks.rlock_bench
+"""
+import asyncio
+import threading
+import time
+
+from alexber.utils.thread_locals import RLock
+
+
+def _measure_sync_ns(acquire, release, n, depth=1):
+    """Returns average latency (in ns) of `depth` nested acquire/release pairs."""
+    start_ns = time.perf_counter_ns()
+    for _ in range(n):
+        for _ in range(depth):
+            acquire()
+        for _ in range(depth):
+            release()
+    return (time.perf_counter_ns() - start_ns) / n
+
+
+async def _measure_async_ns(acquire, release, n, depth=1):
+    """Returns average latency (in ns) of `depth` nested awaited acquire/release pairs."""
+    start_ns = time.perf_counter_ns()
+    for _ in range(n):
+        for _ in range(depth):
+            await acquire()
+        for _ in range(depth):
+            release_result = release()
+            if asyncio.iscoroutine(release_result):
+                await release_result
+    return (time.perf_counter_ns() - start_ns) / n
+
+
+def bench_sync_uncontended(n=500_000):
+    """
+    Measures the cost (in ns) of uncontended acquire/release of `RLock` and of `threading.RLock`,
+    both as a single pair and as reentrant (3 levels deep) acquire.
+    """
+    results = {}
+    for name, lock in (('RLock', RLock()), ('threading.RLock', threading.RLock())):
+        results[name] = _measure_sync_ns(lock.acquire, lock.release, n)
+        results[f'{name} reentrant x3'] = _measure_sync_ns(lock.acquire, lock.release, n, depth=3)
+    return results
+
+
+def bench_async_uncontended(n=200_000):
+    """
+    Measures the cost (in ns) of uncontended async acquire/release of `RLock` and of `asyncio.Lock`.
+    `asyncio.Lock` is not reentrant, so it is measured with single pair only.
+    """
+    async def run():
+        lock = RLock()
+        asyncio_lock = asyncio.Lock()
+        return {
+            'RLock': await _measure_async_ns(lock.async_acquire, lock.async_release, n),
+            'RLock reentrant x3': await _measure_async_ns(lock.async_acquire, lock.async_release, n, depth=3),
+            'asyncio.Lock': await _measure_async_ns(asyncio_lock.acquire, asyncio_lock.release, n),
+        }
+
+    return asyncio.run(run())
+
+
+def bench_sync_contended(workers=(64, 256), rounds=20):
+    """
+    Starts `workers` threads that acquire the lock, yield the GIL while holding it and release it
+    `rounds` times each. Measures the wall time (in ms) until all of them are done.
+    """
+    results = {}
+    for n in workers:
+        for name, lock in (('RLock', RLock()), ('threading.RLock', threading.RLock())):
+            start_event = threading.Event()
+
+            def worker():
+                start_event.wait()
+                for _ in range(rounds):
+                    with lock:
+                        time.sleep(0)  # let other threads pile up in the queue
+
+            threads = [threading.Thread(target=worker) for _ in range(n)]
+            for t in threads:
+                t.start()
+            start_ns = time.perf_counter_ns()
+            start_event.set()
+            for t in threads:
+                t.join()
+            results[f'{name}, {n} threads'] = (time.perf_counter_ns() - start_ns) / 1_000_000
+    return results
+
+
+def bench_async_contended(workers=(64, 256), rounds=20):
+    """
+    Starts `workers` tasks that acquire the lock, yield to the event loop while holding it and release it
+    `rounds` times each. Measures the wall time (in ms) until all of them are done.
+    """
+    async def run(lock_factory, n):
+        lock = lock_factory()
+
+        async def worker():
+            for _ in range(rounds):
+                async with lock:
+                    await asyncio.sleep(0)
+
+        start_ns = time.perf_counter_ns()
+        await asyncio.gather(*(worker() for _ in range(n)))
+        return (time.perf_counter_ns() - start_ns) / 1_000_000
+
+    results = {}
+    for n in workers:
+        for name, lock_factory in (('RLock', RLock), ('asyncio.Lock', asyncio.Lock)):
+            results[f'{name}, {n} tasks'] = asyncio.run(run(lock_factory, n))
+    return results
+
+
+def main():
+    print("Uncontended synchronous acquire/release:")
+    for name, latency_ns in bench_sync_uncontended().items():
+        print(f"  {name:>28}: {latency_ns:8.1f} ns/op")
+
+    print("Uncontended asynchronous acquire/release:")
+    for name, latency_ns in bench_async_uncontended().items():
+        print(f"  {name:>28}: {latency_ns:8.1f} ns/op")
+
+    print("Contended threads:")
+    for name, elapsed_ms in bench_sync_contended().items():
+        print(f"  {name:>28}: {elapsed_ms:8.1f} ms")
+
+    print("Contended tasks:")
+    for name, elapsed_ms in bench_async_contended().items():
+        print(f"  {name:>28}: {elapsed_ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+"""
+Compares per-process `AsyncCache` with `AsyncCache` on top of `SharedMemoryCacheTier`
+in pre-fork deployment: W worker processes replay the same Zipf-distributed workload.
+
+These are not collected by pytest, run them explicitly (POSIX only):
+
+    python -m tests.benchmarks.shared_cache_bench
+"""
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+from alexber.utils.cache import async_cache
+from alexber.utils.cache_tiers import SharedMemoryCacheTier
+from tests.benchmarks.cache_bench import zipf_keys
+
+
+def _worker(path, worker_id, n, keyspace, maxsize, compute_cost_s):
+    l2 = SharedMemoryCacheTier(path, namespace='bench') if path is not None else None
+    computations = 0
+
+    @async_cache(maxsize=maxsize, l2=l2)
+    async def compute(key):
+        nonlocal computations
+        computations += 1
+        await asyncio.sleep(compute_cost_s)
+        return str(key) * 8
+
+    async def run():
+        for key in zipf_keys(n, keyspace, seed=worker_id):
+            await compute(key)
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    return computations, time.perf_counter() - start
+
+
+def bench_workers(workers=4, n=5_000, keyspace=50_000, maxsize=1_000, compute_cost_s=0.0001):
+    """
+    Returns dict mode -> (total computations of all workers, average wall time of the worker).
+    """
+    ctx = multiprocessing.get_context('fork')
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'shared.cache')
+        # the file is created by the parent before the fork
+        SharedMemoryCacheTier(path, slots=16_384, slot_size=256)
+        for mode, mode_path in (('per-process', None), ('shared', path)):
+            args = [(mode_path, i, n, keyspace, maxsize, compute_cost_s) for i in range(workers)]
+            with ctx.Pool(workers) as pool:
+                outcomes = pool.starmap(_worker, args)
+            computations = sum(c for c, _ in outcomes)
+            wall_time = sum(t for _, t in outcomes) / workers
+            results[mode] = (computations, wall_time)
+    return results
+
+
+def main():
+    workers = 4
+    n = 5_000
+    print(f"{workers} workers, {n} Zipf-distributed calls each:")
+    for mode, (computations, wall_time) in bench_workers(workers=workers, n=n).items():
+        hit_ratio = 1 - computations / (workers * n)
+        print(f"  {mode:>11}: {computations:6} computations, hit ratio {hit_ratio:.4f}, {wall_time:.2f} s/worker")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1498 @@
+import asyncio
+import gc
+import logging
+import threading
+import traceback
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+import alexber.utils.cache as cache_module
+from alexber.utils.mains import HashableWrapper
+from alexber.utils.cache import _LRUCache, _LFUCache, _WTinyLFUCache, _SIEVECache, AsyncCache, ShardedAsyncCache, \
+    async_cache, register_policy, deep_sizeof, SyncCache, cache, async_batch_cache, LatencyHistogram, \
+    export_latency_periodically
+
+
+logger = logging.getLogger(__name__)
+
+
+def test_lru_cache_get_set(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = _LRUCache(maxsize=2)
+    cache['a'] = 1
+    cache['b'] = 2
+
+    assert cache['a'] == 1
+    assert cache['b'] == 2
+    assert 'a' in cache
+    assert 'c' not in cache
+    assert len(cache) == 2
+
+    with pytest.raises(KeyError):
+        cache['c']
+
+
+def test_lru_cache_evicts_least_recently_used(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = _LRUCache(maxsize=3)
+    cache['a'] = 1
+    cache['b'] = 2
+    cache['c'] = 3
+
+    # 'a' becomes the most recently used, 'b' is the eviction candidate now
+    _ = cache['a']
+    cache['d'] = 4
+
+    assert 'b' not in cache
+    assert list(cache.cache) == ['c', 'a', 'd']
+
+
+def test_lru_cache_update_refreshes_recency(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = _LRUCache(maxsize=2)
+    cache['a'] = 1
+    cache['b'] = 2
+    cache['a'] = 10
+    cache['c'] = 3
+
+    assert 'b' not in cache
+    assert cache['a'] == 10
+    assert len(cache) == 2
+
+
+def test_lru_cache_evict_and_clear(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = _LRUCache(maxsize=2)
+    cache['a'] = 1
+    cache['b'] = 2
+
+    assert cache._evict() == 'a'
+    assert len(cache) == 1
+
+    cache.clear()
+    assert len(cache) == 0
+    assert 'b' not in cache
+
+
+def test_lfu_cache_get_set(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = _LFUCache(maxsize=2)
+    cache['a'] = 1
+    cache['b'] = 2
+
+    assert cache['a'] == 1
+    assert cache.frequency('a') == 2
+    assert cache.frequency('b') == 1
+    assert cache.min_freq == 1
+    assert 'a' in cache
+    assert len(cache) == 2
+
+    with pytest.raises(KeyError):
+        cache['c']
+
+
+def test_lfu_cache_evicts_least_frequently_used(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = _LFUCache(maxsize=3)
+    cache['a'] = 1
+    cache['b'] = 2
+    cache['c'] = 3
+    _ = cache['a']
+    _ = cache['a']
+    _ = cache['c']
+
+    cache['d'] = 4
+
+    assert 'b' not in cache
+    assert cache.frequency('a') == 3
+    assert cache.frequency('c') == 2
+    assert cache.min_freq == 1
+
+
+def test_lfu_cache_evicts_oldest_on_same_frequency(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = _LFUCache(maxsize=3)
+    cache['a'] = 1
+    cache['b'] = 2
+    cache['c'] = 3
+    _ = cache['b']
+    _ = cache['a']
+
+    # 'a' and 'b' have frequency 2, 'c' has 1
+    assert cache._evict() == 'c'
+    assert cache.min_freq == 2
+    # 'b' got frequency 2 before 'a'
+    assert cache._evict() == 'b'
+    assert cache._evict() == 'a'
+    assert len(cache) == 0
+    assert cache.min_freq == 0
+
+
+def test_lfu_cache_update_increases_frequency(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = _LFUCache(maxsize=2)
+    cache['a'] = 1
+    cache['b'] = 2
+    cache['a'] = 10
+    cache['c'] = 3
+
+    assert 'b' not in cache
+    assert cache['a'] == 10
+    assert cache.frequency('c') == 1
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.min_freq == 0
+
+
+@pytest.mark.parametrize("engine_cls", [_LRUCache, _LFUCache])
+def test_cache_engine_pop_and_on_evict(request, mocker, engine_cls):
+    logger.info(f'{request._pyfuncitem.name}()')
+    on_evict = mocker.Mock()
+    cache = engine_cls(maxsize=2, on_evict=on_evict)
+    cache['a'] = 1
+    cache['b'] = 2
+
+    assert cache.pop('b') == 2
+    assert 'b' not in cache
+    on_evict.assert_not_called()
+    with pytest.raises(KeyError):
+        cache.pop('b')
+
+    cache['c'] = 3
+    cache['d'] = 4
+    on_evict.assert_called_once_with('a')
+    assert len(cache) == 2
+
+
+@pytest.mark.parametrize("engine_cls", [_LRUCache, _LFUCache, _WTinyLFUCache, _SIEVECache])
+def test_cache_engine_contract(request, mocker, engine_cls):
+    logger.info(f'{request._pyfuncitem.name}()')
+    on_evict = mocker.Mock()
+    cache = engine_cls(maxsize=10, on_evict=on_evict)
+    for i in range(10):
+        cache[i] = i
+    assert len(cache) == 10
+    assert cache[3] == 3
+    cache[3] = 33
+    assert cache[3] == 33
+    on_evict.assert_not_called()
+
+    for i in range(10, 30):
+        cache[i] = i
+    assert len(cache) == 10
+    evicted = [c.args[0] for c in on_evict.call_args_list]
+    assert len(evicted) == 20
+    assert len(set(evicted)) == 20
+    assert all(key not in cache for key in evicted)
+    assert set(evicted) | {key for key in range(30) if key in cache} == set(range(30))
+
+    key = next(key for key in range(30) if key in cache)
+    assert cache.pop(key) == (33 if key == 3 else key)
+    assert key not in cache
+    with pytest.raises(KeyError):
+        cache.pop(key)
+    with pytest.raises(KeyError):
+        cache[key]
+
+    evict_key = cache._evict()
+    assert evict_key not in cache
+    assert len(cache) == 8
+
+    cache.clear()
+    assert len(cache) == 0
+    cache['a'] = 1
+    assert cache['a'] == 1
+
+
+@pytest.mark.parametrize("engine_cls", [_WTinyLFUCache, _SIEVECache])
+def test_cache_engine_scan_resistance(request, engine_cls):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = engine_cls(maxsize=100)
+    hot = list(range(50))
+    for _ in range(5):
+        for key in hot:
+            try:
+                cache[key]
+            except KeyError:
+                cache[key] = key
+
+    # one-off scan that is much larger than the cache
+    for key in range(1_000, 2_000):
+        cache[key] = key
+
+    assert sum(key in cache for key in hot) >= 45
+
+    lru = _LRUCache(maxsize=100)
+    for key in hot:
+        lru[key] = key
+    for key in range(1_000, 2_000):
+        lru[key] = key
+    assert not any(key in lru for key in hot)
+
+
+@pytest.mark.asyncio
+async def test_async_cache_custom_policy(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    factory = mocker.Mock(side_effect=_LRUCache)
+    cache = AsyncCache(maxsize=2, policy=factory)
+    factory.assert_called_once_with(maxsize=2, on_evict=cache._forget)
+    await cache.__setitem__('a', 1)
+    assert await cache.__getitem__('a') == 1
+
+    register_policy("test-FIFO", _SIEVECache)
+    try:
+        cache = AsyncCache(maxsize=2, policy="test-FIFO")
+        assert isinstance(cache.cache, _SIEVECache)
+
+        @async_cache(maxsize=2, policy="W-TinyLFU")
+        async def add_one(x):
+            return x + 1
+
+        assert await add_one(1) == 2
+        assert isinstance(add_one.cache_instance.cache, _WTinyLFUCache)
+    finally:
+        cache_module._POLICIES.pop("test-FIFO")
+
+    with pytest.raises(ValueError):
+        AsyncCache(maxsize=2, policy="MRU")
+
+
+def test_deep_sizeof(request):
+    logger.info(f'{request._pyfuncitem.name}()')
+    payload = b'x' * 10_000
+    assert deep_sizeof(payload) >= 10_000
+    assert deep_sizeof([payload, payload]) < 2 * 10_000  # shared object is counted once
+    assert deep_sizeof({'a': [payload]}) > deep_sizeof(payload)
+
+    class Holder:
+        __slots__ = ('value',)
+
+        def __init__(self, value):
+            self.value = value
+
+    assert deep_sizeof(Holder(payload)) > 10_000
+
+
+def test_deep_sizeof_numpy(request):
+    logger.info(f'{request._pyfuncitem.name}()')
+    np = pytest.importorskip("numpy")
+    matrix = np.zeros((100, 100), dtype=np.float64)
+    assert deep_sizeof(matrix) >= matrix.nbytes
+    view = matrix[:10]
+    assert deep_sizeof(view) >= view.nbytes
+
+
+@pytest.mark.parametrize("policy", ["LFU", "LRU", "W-TinyLFU", "SIEVE"])
+@pytest.mark.asyncio
+async def test_async_cache_max_bytes(request, policy):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = AsyncCache(policy=policy, max_bytes=100, weigher=len)
+    await cache.__setitem__('a', 'x' * 40)
+    await cache.__setitem__('b', 'x' * 40)
+    assert cache.current_bytes == 80
+
+    await cache.__setitem__('c', 'x' * 50)
+    assert cache.current_bytes <= 100
+    assert cache.current_bytes == sum(len(cache.cache[key]) for key in ('a', 'b', 'c') if key in cache.cache)
+    assert len(cache.cache) == 2
+
+    # heavier than the whole budget, it is not stored and the previous value is dropped
+    await cache.__setitem__('b', 'x' * 101)
+    assert 'b' not in cache.cache
+    with pytest.raises(KeyError):
+        await cache.__getitem__('b')
+
+    stats = await cache.get_stats()
+    assert stats['current_bytes'] == cache.current_bytes
+    assert stats['max_bytes'] == 100
+    assert stats['max_size'] is None
+
+    await cache.clear()
+    assert cache.current_bytes == 0
+
+
+@pytest.mark.parametrize("policy", ["W-TinyLFU", "LRU"])
+@pytest.mark.asyncio
+async def test_async_cache_max_bytes_only_scan_resistance(request, policy):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = AsyncCache(policy=policy, max_bytes=100, weigher=lambda value: 1)
+    hot = list(range(50))
+    for key in hot:
+        await cache.__setitem__(key, key)
+    for _ in range(5):
+        for key in hot:
+            await cache.__getitem__(key)
+
+    # one-off scan that is much larger than the byte budget
+    for key in range(1_000, 2_000):
+        await cache.__setitem__(key, key)
+
+    assert cache.current_bytes <= 100
+    survived = sum(key in cache.cache for key in hot)
+    if policy == "W-TinyLFU":
+        assert survived >= 45
+        # the sketch is sized from the live entries, not from the unbounded maxsize
+        assert cache.cache.sketch.width <= 1024
+    else:
+        assert survived == 0
+
+
+@pytest.mark.asyncio
+async def test_async_cache_max_bytes_with_ttl_and_shards(request, fake_clock):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = AsyncCache(maxsize=10, ttl=10, max_bytes=100, weigher=len)
+    await cache.__setitem__('a', 'x' * 60)
+    fake_clock.now_ns = 11 * 10**9
+    # expired 'a' is purged, so nothing live is evicted
+    await cache.__setitem__('b', 'x' * 60)
+    assert cache.current_bytes == 60
+    assert await cache.__getitem__('b') == 'x' * 60
+
+    @async_cache(max_bytes=400, weigher=len, shards=4)
+    async def repeat(n):
+        return 'x' * n
+
+    for n in range(1, 50):
+        await repeat(n)
+    stats = await repeat.cache_instance.get_stats()
+    assert 0 < stats['current_bytes'] <= 400
+    assert stats['max_bytes'] == 400
+
+    with pytest.raises(ValueError):
+        AsyncCache(ttl=10)
+
+
+@pytest.fixture
+def fake_clock(mocker):
+    clock = mocker.Mock()
+    clock.now_ns = 0
+    mocker.patch.object(cache_module.time, 'perf_counter_ns', side_effect=lambda: clock.now_ns)
+    return clock
+
+
+@pytest.mark.asyncio
+async def test_async_cache_ttl_removes_exactly_expired_key(request, fake_clock):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = AsyncCache(maxsize=3, ttl=10, policy="LFU")
+    await cache.__setitem__('a', 1)
+    fake_clock.now_ns = 5 * 10**9
+    await cache.__setitem__('b', 2)
+    await cache.__setitem__('c', 3)
+
+    fake_clock.now_ns = 11 * 10**9
+    with pytest.raises(KeyError):
+        await cache.__getitem__('a')
+
+    assert 'a' not in cache.cache
+    assert 'a' not in cache.expiry_times
+    assert await cache.__getitem__('b') == 2
+    assert await cache.__getitem__('c') == 3
+
+
+@pytest.mark.asyncio
+async def test_async_cache_rejected_key_is_not_tagged_nor_expired(request, fake_clock):
+    logger.info(f'{request._pyfuncitem.name}()')
+
+    class _RejectingLRUCache(_LRUCache):
+        """Evicts the inserted key right away, like the admission that rejects it."""
+
+        def __setitem__(self, key, value):
+            super().__setitem__(key, value)
+            if key == 'rejected':
+                del self.cache[key]
+                self.on_evict(key)
+
+    cache = AsyncCache(maxsize=3, ttl=10, policy=_RejectingLRUCache)
+    await cache.__setitem__('a', 1, tags=['t'])
+    await cache.__setitem__('rejected', 2, tags=['t'])
+    assert 'rejected' not in cache.cache
+    assert 'rejected' not in cache.expiry_times
+    assert 'rejected' not in cache.key_tags
+    assert cache.tag_index['t'] == {'a'}
+
+    fake_clock.now_ns = 11 * 10**9
+    # purges the expired entries, the rejected key has no heap entry
+    await cache.__setitem__('b', 3)
+    assert 'a' not in cache.cache
+    assert await cache.__getitem__('b') == 3
+
+
+@pytest.mark.parametrize("policy", ["LFU", "LRU", "W-TinyLFU", "SIEVE"])
+@pytest.mark.asyncio
+async def test_async_cache_write_purges_expired_before_eviction(request, fake_clock, policy):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = AsyncCache(maxsize=2, ttl=10, policy=policy)
+    await cache.__setitem__('a', 1)
+    fake_clock.now_ns = 1 * 10**9
+    assert await cache.__getitem__('a') == 1  # 'a' is hot now
+    fake_clock.now_ns = 8 * 10**9
+    await cache.__setitem__('b', 2)
+
+    fake_clock.now_ns = 12 * 10**9
+    await cache.__setitem__('c', 3)
+
+    # expired 'a' was purged, live 'b' wasn't evicted by the policy
+    assert 'a' not in cache.cache
+    assert await cache.__getitem__('b') == 2
+    assert await cache.__getitem__('c') == 3
+    stats = await cache.get_stats()
+    assert stats['expired'] == 1
+
+
+@pytest.mark.asyncio
+async def test_async_cache_purge_expired(request, fake_clock):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = AsyncCache(maxsize=100, ttl=10, policy="LRU")
+    for i in range(10):
+        fake_clock.now_ns = i * 10**9
+        await cache.__setitem__(i, i)
+    # overwritten key gets new expiry time, its old heap entry is stale
+    await cache.__setitem__(0, 0)
+
+    fake_clock.now_ns = 15 * 10**9
+    assert await cache.purge_expired() == 5
+    assert sorted(cache.expiry_times) == [0, 6, 7, 8, 9]
+    assert len(cache.cache) == 5
+
+    await cache.clear()
+    assert cache._expiry_heap == []
+
+
+@pytest.mark.asyncio
+async def test_async_cache_caches_result(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    calls = []
+
+    @async_cache(maxsize=10)
+    async def compute(x, y=1):
+        calls.append((x, y))
+        return x + y
+
+    assert await compute(1, y=2) == 3
+    assert await compute(1, y=2) == 3
+    assert calls == [(1, 2)]
+
+    stats = await compute.cache_instance.get_stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+
+@pytest.mark.asyncio
+async def test_async_cache_coalesce_single_flight(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    calls = []
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    @async_cache(maxsize=10, coalesce=True)
+    async def compute(x):
+        calls.append(x)
+        started.set()
+        await release.wait()
+        return x * 2
+
+    tasks = [asyncio.create_task(compute(21)) for _ in range(10)]
+    await started.wait()
+    release.set()
+    results = await asyncio.gather(*tasks)
+
+    assert results == [42] * 10
+    assert calls == [21]
+    assert await compute(21) == 42
+    assert calls == [21]
+
+
+@pytest.mark.asyncio
+async def test_async_cache_coalesce_exception_fans_out_and_is_not_cached(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    calls = []
+    release = asyncio.Event()
+
+    @async_cache(maxsize=10, coalesce=True)
+    async def compute(x):
+        calls.append(x)
+        await release.wait()
+        raise ValueError(f"failed {x}")
+
+    tasks = [asyncio.create_task(compute(1)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+
+    with pytest.raises(ValueError):
+        await compute(1)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_async_cache_coalesce_waiter_cancellation(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    release = asyncio.Event()
+
+    @async_cache(maxsize=10, coalesce=True)
+    async def compute(x):
+        await release.wait()
+        return x
+
+    owner = asyncio.create_task(compute(7))
+    waiter = asyncio.create_task(compute(7))
+    await asyncio.sleep(0)
+    owner.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await waiter == 7
+    with pytest.raises(asyncio.CancelledError):
+        await owner
+
+
+@pytest.mark.asyncio
+async def test_async_cache_key_binds_signature(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    calls = mocker.Mock()
+
+    @async_cache(maxsize=10)
+    async def add(a, b=2):
+        calls(a, b)
+        return a + b
+
+    assert await add(1, b=2) == 3
+    assert await add(1, 2) == 3
+    assert await add(1) == 3
+    assert await add(a=1, b=2) == 3
+    assert calls.call_count == 1
+
+    # equal, but not identical arguments share the key
+    assert await add(''.join(['x', 'y']), ''.join(['z'])) == 'xyz'
+    assert await add('xy', 'z') == 'xyz'
+    assert calls.call_count == 2
+
+    # unhashable arguments
+    assert await add([1], [2]) == [1, 2]
+    assert await add([1], b=[2]) == [1, 2]
+    assert calls.call_count == 3
+
+    with pytest.raises(TypeError):
+        await add(1, 2, 3)
+    with pytest.raises(TypeError):
+        await add(1, a=1)
+    with pytest.raises(TypeError):
+        await add(c=1)
+
+
+@pytest.mark.asyncio
+async def test_async_cache_key_and_typed(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    calls = mocker.Mock()
+
+    @async_cache(maxsize=10, typed=True)
+    async def identity(x, *args, **kwargs):
+        calls(x)
+        return x
+
+    assert await identity(1) == 1
+    assert await identity(1.0) == 1.0
+    assert calls.call_count == 2
+    assert await identity(1, 2, y=3, z=4) == 1
+    assert await identity(1, 2, z=4, y=3) == 1
+    assert calls.call_count == 3
+
+    @async_cache(maxsize=10, key=lambda user, request_id: user['id'])
+    async def load(user, request_id):
+        calls(user)
+        return user['name']
+
+    assert await load({'id': 1, 'name': 'a'}, request_id=1) == 'a'
+    assert await load({'id': 1, 'name': 'a'}, request_id=2) == 'a'
+    assert calls.call_count == 4
+
+    class Service:
+        def __init__(self, base):
+            self.base = base
+
+        @async_cache(maxsize=10)
+        async def add(self, x):
+            calls(x)
+            return self.base + x
+
+    s1, s2 = Service(10), Service(20)
+    assert await s1.add(1) == 11
+    assert await s2.add(1) == 21
+    assert await s1.add(x=1) == 11
+    assert calls.call_count == 6
+
+
+@pytest.mark.asyncio
+async def test_async_cache_key_doesnt_walk_self(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    calls = mocker.Mock()
+    walks = mocker.Mock()
+
+    class Collection:
+        def __iter__(self):
+            walks()
+            return iter(range(1_000))
+
+        @async_cache(maxsize=10)
+        async def size(self, extra):
+            calls(extra)
+            return extra
+
+        @async_cache(maxsize=10)
+        async def total(self, *extra):
+            calls(extra)
+            return sum(extra)
+
+    collection = Collection()
+    for _ in range(3):
+        assert await collection.size(1) == 1
+        assert await collection.total(1, 2) == 3
+    assert calls.call_count == 2
+    walks.assert_not_called()
+
+    class Numbers:
+        def __init__(self):
+            self.it = iter([1, 2, 3])
+
+        def __iter__(self):
+            return self
+
+        def __next__(self):
+            return next(self.it)
+
+        @async_cache(maxsize=10)
+        async def first(self, default):
+            return default
+
+    numbers = Numbers()
+    assert await numbers.first(0) == 0
+    assert list(numbers) == [1, 2, 3]  # the iterator wasn't drained by the key builder
+
+
+@pytest.mark.asyncio
+async def test_async_cache_per_instance(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    calls = mocker.Mock()
+
+    class Service:
+        def __init__(self, base):
+            self.base = base
+
+        @async_cache(maxsize=10, per_instance=True)
+        async def add(self, x):
+            calls(self.base, x)
+            return self.base + x
+
+    s1 = Service(10)
+    assert await s1.add(1) == 11
+    assert await s1.add(1) == 11
+    assert await Service.add(self=s1, x=1) == 11
+    assert calls.call_count == 1
+    assert Service.add.cache_instance is None
+    assert (await Service.add.cache_for(s1).get_stats())['hits'] == 2
+
+    s1_cache = Service.add.cache_for(s1)
+    assert len(s1_cache.cache) == 1
+    del s1
+    # the entries of collected instance are freed at once
+    assert len(s1_cache.cache) == 0
+
+    s2 = Service(20)
+    assert await s2.add(1) == 21
+    assert calls.call_count == 2
+
+
+def test_per_instance_caches_id_reuse(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    factory = mocker.Mock(side_effect=lambda: mocker.Mock())
+
+    class Instance:
+        def method(self):
+            pass
+
+    registry = cache_module._PerInstanceCaches(Instance.method, factory)
+
+    instance = Instance()
+    dead = Instance()
+    dead_ref = weakref.ref(dead)
+    stale_cache = mocker.Mock()
+    del dead
+    # simulates the entry of the dead instance whose id was reused by the live instance
+    registry.caches[id(instance)] = (dead_ref, stale_cache)
+
+    cache = registry.get(instance)
+    assert cache is not stale_cache
+    assert registry.get(instance) is cache
+    assert factory.call_count == 1
+    del instance
+    assert len(registry) == 0
+    cache._release.assert_called_once_with()
+    stale_cache._release.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_async_cache_per_instance_requires_method(request):
+    logger.info(f'{request._pyfuncitem.name}()')
+    with pytest.raises(ValueError):
+        @async_cache(maxsize=10, per_instance=True)
+        async def add(x):
+            return x
+
+    class Slotted:
+        __slots__ = ()
+
+        @async_cache(maxsize=10, per_instance=True)
+        async def value(self):
+            return 1
+
+    with pytest.raises(TypeError):
+        await Slotted().value()
+
+
+@pytest.mark.asyncio
+async def test_sharded_async_cache(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = ShardedAsyncCache(maxsize=100, policy="LRU", shards=4)
+    assert len(cache.shards) == 4
+    assert all(shard.cache.maxsize == 25 for shard in cache.shards)
+
+    for i in range(40):
+        await cache.__setitem__(i, i * i)
+    # unhashable keys are supported too
+    await cache.__setitem__([1, 2], 'list')
+
+    for i in range(40):
+        assert await cache.__getitem__(i) == i * i
+    assert await cache.__getitem__([1, 2]) == 'list'
+    with pytest.raises(KeyError):
+        await cache.__getitem__('absent')
+
+    assert sum(len(shard.cache) for shard in cache.shards) == 41
+    assert sum(1 for shard in cache.shards if len(shard.cache) > 0) > 1
+
+    await cache.update_profiling(10)
+    await cache.update_profiling(30)
+
+    stats = await cache.get_stats()
+    assert stats['hits'] == 41
+    assert stats['misses'] == 1
+    assert stats['current_size'] == 41
+    assert stats['max_size'] == 100
+    assert stats['total_calls'] == 2
+    assert stats['shards'] == 4
+
+    await cache.clear()
+    stats = await cache.get_stats()
+    assert stats['current_size'] == 0
+    assert stats['hits'] == 0
+
+
+@pytest.mark.asyncio
+async def test_sharded_async_cache_split_is_exact(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = ShardedAsyncCache(maxsize=10, shards=8, max_bytes=1_003, weigher=lambda value: 1)
+    assert [shard.cache.maxsize for shard in cache.shards] == [2, 2, 1, 1, 1, 1, 1, 1]
+    assert sum(shard.max_bytes for shard in cache.shards) == 1_003
+
+    for i in range(100):
+        await cache.__setitem__(i, i)
+    stats = await cache.get_stats()
+    assert stats['current_size'] == 10
+    assert stats['max_size'] == 10
+    assert stats['max_bytes'] == 1_003
+
+    with pytest.raises(ValueError):
+        ShardedAsyncCache(maxsize=4, shards=8)
+    with pytest.raises(ValueError):
+        ShardedAsyncCache(max_bytes=4, shards=8)
+
+
+@pytest.mark.asyncio
+async def test_async_cache_with_shards(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    calls = []
+
+    @async_cache(maxsize=64, shards=8)
+    async def compute(x):
+        calls.append(x)
+        return -x
+
+    for _ in range(2):
+        results = await asyncio.gather(*(compute(i) for i in range(20)))
+        assert results == [-i for i in range(20)]
+
+    assert sorted(calls) == list(range(20))
+    assert isinstance(compute.cache_instance, ShardedAsyncCache)
+    stats = await compute.cache_instance.get_stats()
+    assert stats['hits'] == 20
+    assert stats['misses'] == 20
+
+
+@pytest.mark.asyncio
+async def test_async_cache_stale_ttl_lookup(request, fake_clock):
+    logger.info(f'{request._pyfuncitem.name}()')
+    with pytest.raises(ValueError):
+        AsyncCache(maxsize=10, stale_ttl=5)
+
+    cache = AsyncCache(maxsize=10, ttl=10, stale_ttl=5)
+    await cache.__setitem__('a', 1)
+
+    fake_clock.now_ns = 5 * 10**9
+    assert await cache.lookup('a') == (1, False)
+
+    fake_clock.now_ns = 12 * 10**9
+    assert await cache.lookup('a') == (1, True)
+    # __getitem__ returns only fresh values, but it doesn't drop the entry within grace window
+    with pytest.raises(KeyError):
+        await cache.__getitem__('a')
+    assert await cache.purge_expired() == 0
+    assert 'a' in cache.cache
+
+    fake_clock.now_ns = 15 * 10**9
+    with pytest.raises(KeyError):
+        await cache.lookup('a')
+    assert 'a' not in cache.cache
+
+    stats = await cache.get_stats()
+    assert stats['stale_hits'] == 1
+    assert stats['expired'] == 1
+    assert stats['stale_ttl_sec'] == "5.0000"
+
+
+@pytest.mark.asyncio
+async def test_async_cache_stale_while_revalidate(request, fake_clock):
+    logger.info(f'{request._pyfuncitem.name}()')
+    calls = []
+    release = asyncio.Event()
+
+    @async_cache(maxsize=10, ttl=10, stale_ttl=5)
+    async def compute(x):
+        calls.append(x)
+        if len(calls) > 1:
+            await release.wait()
+        return x * len(calls)
+
+    assert await compute(3) == 3
+
+    fake_clock.now_ns = 12 * 10**9
+    # stale value is served at once, only one refresh is scheduled
+    results = await asyncio.gather(*(compute(3) for _ in range(5)))
+    assert results == [3] * 5
+    release.set()
+    await asyncio.sleep(0.01)
+
+    assert calls == [3, 3]
+    assert await compute(3) == 6
+
+    stats = await compute.cache_instance.get_stats()
+    assert stats['stale_hits'] == 5
+    assert stats['refreshes'] == 1
+    assert stats['failed_refreshes'] == 0
+
+
+@pytest.mark.asyncio
+async def test_async_cache_stale_while_revalidate_failed_refresh(request, fake_clock):
+    logger.info(f'{request._pyfuncitem.name}()')
+    calls = []
+
+    @async_cache(maxsize=10, ttl=10, stale_ttl=5, shards=2)
+    async def compute(x):
+        calls.append(x)
+        if len(calls) > 1:
+            raise ValueError("upstream is down")
+        return x
+
+    assert await compute(1) == 1
+    fake_clock.now_ns = 12 * 10**9
+    assert await compute(1) == 1
+    await asyncio.sleep(0.01)
+
+    stats = await compute.cache_instance.get_stats()
+    assert stats['refreshes'] == 1
+    assert stats['failed_refreshes'] == 1
+    # stale value is still served within grace window
+    assert await compute(1) == 1
+
+
+def test_sync_cache_ttl_and_stats(request, fake_clock):
+    logger.info(f'{request._pyfuncitem.name}()')
+    sync_cache = SyncCache(maxsize=2, ttl=10, policy="LRU")
+    sync_cache['a'] = 1
+    assert sync_cache['a'] == 1
+    fake_clock.now_ns = 11 * 10**9
+    with pytest.raises(KeyError):
+        sync_cache['a']
+    sync_cache['b'] = 2
+    sync_cache['c'] = 3
+    sync_cache['d'] = 4
+    assert 'b' not in sync_cache.cache
+
+    stats = sync_cache.get_stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['expired'] == 1
+    assert stats['current_size'] == 2
+
+    sync_cache.clear()
+    assert sync_cache.get_stats()['current_size'] == 0
+
+
+def test_cache_decorator(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    calls = mocker.Mock()
+
+    @cache(maxsize=10)
+    def add(a, b=2):
+        calls(a, b)
+        return a + b
+
+    assert add(1) == 3
+    assert add(1, b=2) == 3
+    assert calls.call_count == 1
+    stats = add.cache_instance.get_stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['total_calls'] == 1
+
+    class Service:
+        def __init__(self, base):
+            self.base = base
+
+        @cache(maxsize=10, per_instance=True)
+        def add(self, x):
+            calls(self.base, x)
+            return self.base + x
+
+    service = Service(10)
+    assert service.add(1) == 11
+    assert service.add(1) == 11
+    assert calls.call_count == 2
+    service_cache = Service.add.cache_for(service)
+    del service
+    assert len(service_cache.cache) == 0
+
+
+def test_cache_coalesce_threads(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    calls = mocker.Mock()
+    started = threading.Event()
+    release = threading.Event()
+
+    @cache(maxsize=10, coalesce=True)
+    def compute(x):
+        calls(x)
+        started.set()
+        release.wait(5)
+        return x * 2
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        first = executor.submit(compute, 21)
+        assert started.wait(5)
+        others = [executor.submit(compute, 21) for _ in range(7)]
+        release.set()
+        assert first.result(5) == 42
+        assert [f.result(5) for f in others] == [42] * 7
+    assert calls.call_count == 1
+
+
+def test_cache_coalesce_threads_exception_and_recursion(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    started = threading.Event()
+    release = threading.Event()
+
+    @cache(maxsize=10, coalesce=True)
+    def fail(x):
+        started.set()
+        release.wait(5)
+        raise ValueError("upstream is down")
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        first = executor.submit(fail, 1)
+        assert started.wait(5)
+        others = [executor.submit(fail, 1) for _ in range(3)]
+        release.set()
+        for f in [first] + others:
+            with pytest.raises(ValueError):
+                f.result(5)
+    assert len(fail.cache_instance.cache) == 0
+
+    @cache(maxsize=10, coalesce=True)
+    def factorial(n):
+        return 1 if n <= 1 else n * factorial(n - 1)
+
+    assert factorial(10) == 3628800
+
+
+@pytest.mark.parametrize("shards", [None, 4])
+@pytest.mark.asyncio
+async def test_async_cache_get_many_set_many(request, shards):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache_instance = AsyncCache(maxsize=100) if shards is None else ShardedAsyncCache(maxsize=100, shards=shards)
+    await cache_instance.set_many({i: i * 10 for i in range(5)})
+    await cache_instance.set_many([(5, 50), ([6], 60)])
+
+    found = await cache_instance.get_many([0, 3, 5, 7, [6]])
+    assert found == {0: 0, 3: 30, 5: 50, HashableWrapper([6]): 60}
+    stats = await cache_instance.get_stats()
+    assert stats['hits'] == 4
+    assert stats['misses'] == 1
+
+
+@pytest.mark.asyncio
+async def test_async_batch_cache(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    batches = []
+
+    @async_batch_cache(maxsize=100)
+    async def load_users(ids):
+        batches.append(sorted(ids))
+        return {i: f'user{i}' for i in ids if i != 13}
+
+    results = await asyncio.gather(*(load_users(i) for i in [1, 2, 3, 2, 1]))
+    assert results == ['user1', 'user2', 'user3', 'user2', 'user1']
+    assert batches == [[1, 2, 3]]
+
+    # hits are served from the cache, only misses go to the bulk loader
+    assert await load_users.load_many([1, 4, 5, 3]) == ['user1', 'user4', 'user5', 'user3']
+    assert batches == [[1, 2, 3], [4, 5]]
+
+    with pytest.raises(KeyError):
+        await load_users(13)
+    stats = await load_users.cache_instance.get_stats()
+    assert stats['total_calls'] == 3
+    assert load_users.__name__ == 'load_users'
+
+
+@pytest.mark.asyncio
+async def test_async_batch_cache_sequence_chunks_and_exception(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    batches = []
+
+    @async_batch_cache(maxsize=100, max_batch_size=2)
+    async def square(xs):
+        batches.append(list(xs))
+        if 0 in xs:
+            raise ValueError("upstream is down")
+        return [x * x for x in xs]
+
+    assert await square.load_many([1, 2, 3, 4, 5]) == [1, 4, 9, 16, 25]
+    assert batches == [[1, 2], [3, 4], [5]]
+
+    results = await asyncio.gather(square(0), square(6), square(7), return_exceptions=True)
+    assert isinstance(results[0], ValueError)
+    assert isinstance(results[1], ValueError)
+    assert results[2] == 49
+    assert 0 not in square.cache_instance.cache
+
+
+@pytest.mark.asyncio
+async def test_async_batch_cache_cancellation(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    started = asyncio.Event()
+
+    @async_batch_cache(maxsize=100)
+    async def load(keys):
+        if 'cancelled' in keys:
+            raise asyncio.CancelledError()
+        started.set()
+        await asyncio.sleep(10)
+        return {key: key for key in keys}
+
+    # CancelledError of the bulk loader reaches the callers instead of leaving them hanging
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(load('cancelled'), timeout=1)
+
+    # so does the cancellation of the batch task itself
+    caller = asyncio.ensure_future(asyncio.wait_for(load('slow'), timeout=1))
+    await started.wait()
+    for task in list(load._tasks):
+        task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+    assert not load._in_flight
+
+
+
+def test_latency_histogram_percentiles(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    histogram = LatencyHistogram()
+    for value in range(1, 1001):
+        histogram.record(value * 1000)
+
+    snapshot = histogram.snapshot()
+    assert snapshot.count == 1000
+    assert snapshot.min == 1000
+    assert snapshot.max == 1_000_000
+    # log-linear buckets, relative error is below 1/32
+    for percentile, expected in ((50, 500_000), (90, 900_000), (99, 990_000), (99.9, 999_000)):
+        assert expected <= snapshot.percentile(percentile) <= expected * (1 + 1 / 32)
+    assert snapshot.percentile(100) == 1_000_000
+
+    # every thread records to its own stripe, snapshot sums them
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda _: [histogram.record(5) for _ in range(1000)], range(4)))
+    assert histogram.snapshot().count == 5000
+
+    histogram.reset()
+    assert histogram.snapshot().count == 0
+    assert histogram.snapshot().percentile(99) == 0
+
+
+@pytest.mark.asyncio
+async def test_async_cache_latency_stats(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+
+    @async_cache(maxsize=10, shards=2)
+    async def compute(x):
+        await asyncio.sleep(0.01)
+        return x
+
+    for x in (1, 2, 1, 2, 1):
+        await compute(x)
+
+    latency = compute.cache_instance.latency_stats()
+    assert latency['misses']['count'] == 2
+    assert latency['hits']['count'] == 3
+    assert latency['misses']['p50_ns'] >= 10_000_000
+    assert latency['hits']['p999_ns'] < latency['misses']['p50_ns']
+    stats = await compute.cache_instance.get_stats()
+    assert stats['total_calls'] == 2
+    assert set(stats['miss_latency']) == {'p50', 'p90', 'p99', 'p999'}
+
+    exported = []
+    task = asyncio.create_task(export_latency_periodically(compute.cache_instance, exported.append,
+                                                           interval=0.01, reset=True))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    assert exported[0]['misses']['count'] == 2
+    assert exported[-1]['misses']['count'] == 0
+
+
+def test_lfu_cache_dump_order_and_restore(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = _LFUCache(maxsize=3)
+    cache['a'] = 1
+    cache['b'] = 2
+    cache['c'] = 3
+    _ = cache['a']
+    _ = cache['a']
+    _ = cache['c']
+
+    records = list(cache.dump_order())
+    assert records == [('b', 2, 1), ('c', 3, 2), ('a', 1, 3)]
+
+    restored = _LFUCache(maxsize=3)
+    for key, value, meta in records:
+        restored.restore(key, value, meta)
+    assert list(restored.dump_order()) == records
+    assert restored.frequency('a') == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('policy', ['LFU', 'LRU', 'W-TinyLFU', 'SIEVE'])
+async def test_async_cache_dump_load(request, mocker, tmp_path, policy):
+    logger.info(f'{request._pyfuncitem.name}()')
+    path = tmp_path / 'cache.bin'
+    cache = AsyncCache(maxsize=100, ttl=60, policy=policy)
+    for i in range(10):
+        await cache.__setitem__(i, {'value': i})
+    await cache.__setitem__([1, 2], 'list')
+    for _ in range(3):
+        await cache.__getitem__(7)
+
+    assert await cache.dump(path) == 11
+
+    loaded = AsyncCache(maxsize=100, ttl=60, policy=policy)
+    assert await loaded.load(path) == 11
+    if policy != 'W-TinyLFU':
+        # eviction order is restored (W-TinyLFU restores only the frequency estimates)
+        assert list(loaded.cache.dump_order()) == list(cache.cache.dump_order())
+    assert await loaded.__getitem__(5) == {'value': 5}
+    assert await loaded.__getitem__([1, 2]) == 'list'
+    # remaining TTL is kept, it is not extended to the full ttl
+    remaining = [(loaded.expiry_times[k] - cache.expiry_times[k]) / 1e9 for k in loaded.expiry_times]
+    assert all(r <= 1 for r in remaining)
+    if policy == 'LFU':
+        assert loaded.cache.frequency(7) == cache.cache.frequency(7)
+
+    sharded = ShardedAsyncCache(maxsize=100, ttl=60, shards=3)
+    assert await sharded.load(path) == 11
+    assert await sharded.__getitem__(9) == {'value': 9}
+    assert await sharded.dump(tmp_path / 'sharded.bin') == 11
+
+
+@pytest.mark.asyncio
+async def test_async_cache_load_skips_expired_and_rejects_other_files(request, mocker, tmp_path):
+    logger.info(f'{request._pyfuncitem.name}()')
+    path = tmp_path / 'cache.bin'
+    cache = AsyncCache(maxsize=10, ttl=0.05)
+    await cache.__setitem__('a', 1)
+    await cache.dump(path)
+    await asyncio.sleep(0.1)
+
+    loaded = AsyncCache(maxsize=10, ttl=0.05)
+    assert await loaded.load(path) == 0
+    assert len(loaded.cache) == 0
+
+    other = tmp_path / 'other.bin'
+    other.write_bytes(b'not a cache dump at all')
+    with pytest.raises(ValueError):
+        await loaded.load(other)
+
+
+def test_sync_cache_dump_load(request, mocker, tmp_path):
+    logger.info(f'{request._pyfuncitem.name}()')
+    path = tmp_path / 'cache.bin'
+    cache = SyncCache(maxsize=10, policy='LRU')
+    for i in range(5):
+        cache[i] = i * i
+    _ = cache[0]
+
+    assert cache.dump(path) == 5
+    loaded = SyncCache(maxsize=10, policy='LRU')
+    assert loaded.load(path) == 5
+    assert list(loaded.cache.cache) == [1, 2, 3, 4, 0]
+
+
+@pytest.mark.asyncio
+async def test_async_cache_warm_up(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    active = 0
+    max_active = 0
+
+    async def loader(key):
+        nonlocal active, max_active
+        active += 1
+        max_active = max(max_active, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if key == 13:
+            raise ValueError("upstream is down")
+        return key * 2
+
+    cache = AsyncCache(maxsize=100)
+    assert await cache.warm_up(range(20), loader, concurrency=4) == 19
+    assert max_active == 4
+    assert await cache.__getitem__(19) == 38
+    assert 13 not in cache.cache
+
+
+@pytest.mark.asyncio
+async def test_async_cache_invalidate_tag(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    calls = []
+
+    @async_cache(maxsize=100, tags=lambda tenant, item: tenant)
+    async def fetch(tenant, item):
+        calls.append((tenant, item))
+        return f'{tenant}/{item}'
+
+    for tenant in ('a', 'b'):
+        for item in range(3):
+            await fetch(tenant, item)
+    cache_instance = fetch.cache_instance
+    assert cache_instance.tag_index['a'] == {('a', 0), ('a', 1), ('a', 2)}
+
+    assert await cache_instance.invalidate_tag('a') == 3
+    assert 'a' not in cache_instance.tag_index
+    assert await cache_instance.invalidate_tag('absent') == 0
+
+    await fetch('b', 0)
+    await fetch('a', 0)
+    assert calls[-1] == ('a', 0)
+    assert len(calls) == 7
+    stats = await cache_instance.get_stats()
+    assert stats['invalidated'] == 3
+    assert stats['hits'] == 1
+
+    assert await cache_instance.invalidate_where(lambda key, value: value.endswith('/0')) == 2
+    assert len(cache_instance.cache) == 2
+
+
+@pytest.mark.asyncio
+async def test_async_cache_tags_follow_eviction(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = AsyncCache(maxsize=2, policy='LRU')
+    await cache.__setitem__('x', 1, tags=['t1', 't2'])
+    await cache.__setitem__('y', 2, tags=['t1'])
+    await cache.__setitem__('z', 3)
+    # 'x' is evicted, its tags are dropped from the index
+    assert cache.key_tags == {'y': frozenset({'t1'})}
+    assert cache.tag_index == {'t1': {'y'}}
+
+    # overwrite replaces the tags
+    await cache.__setitem__('y', 20, tags=['t3'])
+    assert cache.tag_index == {'t3': {'y'}}
+
+    sharded = ShardedAsyncCache(maxsize=100, shards=4)
+    for i in range(20):
+        await sharded.__setitem__(i, i, tags=['even' if i % 2 == 0 else 'odd'])
+    assert await sharded.invalidate_tag('even') == 10
+    assert (await sharded.get_stats())['current_size'] == 10
+
+
+def test_cache_decorator_invalidate_tag(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+
+    @cache(maxsize=10, tags=lambda x: ['all', x % 3])
+    def compute(x):
+        return x * 10
+
+    for x in range(6):
+        compute(x)
+    assert compute.cache_instance.invalidate_tag(0) == 2
+    assert compute.cache_instance.invalidate_tag('all') == 4
+    assert len(compute.cache_instance.cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_async_cache_early_refresh(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    eager = AsyncCache(maxsize=10, ttl=10, early_refresh_beta=1e6)
+    await eager.__setitem__('a', 1, compute_time_ns=1_000_000_000)
+    assert await eager.lookup('a') == (1, True)
+    # __getitem__() never reports stale value
+    assert await eager.__getitem__('a') == 1
+
+    lazy = AsyncCache(maxsize=10, ttl=10, early_refresh_beta=1e-9)
+    await lazy.__setitem__('a', 1, compute_time_ns=1_000_000_000)
+    assert await lazy.lookup('a') == (1, False)
+
+    with pytest.raises(ValueError):
+        AsyncCache(maxsize=10, early_refresh_beta=1.0)
+
+    calls = []
+
+    @async_cache(maxsize=10, ttl=10, early_refresh_beta=1e9)
+    async def compute(x):
+        calls.append(x)
+        await asyncio.sleep(0.001)
+        return x * len(calls)
+
+    assert await compute(2) == 2
+    # the value is still valid, it is returned at once and single background refresh is scheduled
+    assert await compute(2) == 2
+    await asyncio.sleep(0.05)
+    assert calls == [2, 2]
+    assert await compute(2) == 4
+    stats = await compute.cache_instance.get_stats()
+    assert stats['early_refreshes'] >= 1
+
+
+@pytest.mark.asyncio
+async def test_async_cache_ttl_jitter(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    cache = AsyncCache(maxsize=100, ttl=100, ttl_jitter=0.5)
+    await cache.set_many((i, i) for i in range(50))
+
+    ttls = [(expiry - min(cache.expiry_times.values())) for expiry in cache.expiry_times.values()]
+    assert len(set(cache.expiry_times.values())) > 1
+    assert max(ttls) <= 50 * 1e9
+
+    with pytest.raises(ValueError):
+        AsyncCache(maxsize=10, ttl=10, ttl_jitter=1.5)
+
+
+@pytest.mark.asyncio
+async def test_async_cache_negative_and_exception_caching(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    calls = []
+
+    class TransientError(Exception):
+        pass
+
+    @async_cache(maxsize=10, negative_ttl=0.05, cache_exceptions=(TransientError,), exception_ttl=0.05)
+    async def fetch(x):
+        calls.append(x)
+        if x == 'down':
+            raise TransientError(x)
+        if x == 'bug':
+            raise ValueError(x)
+        return None if x == 'missing' else x
+
+    assert await fetch('found') == 'found'
+    assert await fetch('missing') is None
+    assert await fetch('missing') is None
+    for _ in range(2):
+        with pytest.raises(TransientError) as exc_info:
+            await fetch('down')
+        assert exc_info.value.args == ('down',)
+    # not listed exceptions are not cached
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            await fetch('bug')
+    assert calls == ['found', 'missing', 'down', 'bug', 'bug']
+
+    # negative entries expire even though the cache has no ttl, the positive ones don't
+    await asyncio.sleep(0.1)
+    await fetch('found')
+    await fetch('missing')
+    with pytest.raises(TransientError):
+        await fetch('down')
+    assert calls == ['found', 'missing', 'down', 'bug', 'bug', 'missing', 'down']
+    assert await fetch.cache_instance.purge_expired() == 0
+
+    @async_cache(maxsize=10, cache_none=False)
+    async def lookup(x):
+        calls.append(x)
+        return None
+
+    await lookup(1)
+    await lookup(1)
+    assert calls[-2:] == [1, 1]
+    assert len(lookup.cache_instance.cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_async_cache_cached_exception_releases_frames(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    refs = []
+
+    class TransientError(Exception):
+        pass
+
+    class Payload:
+        pass
+
+    @async_cache(maxsize=10, cache_exceptions=(TransientError,))
+    async def fetch(x):
+        payload = Payload()
+        refs.append(weakref.ref(payload))
+        raise TransientError(x)
+
+    with pytest.raises(TransientError):
+        await fetch(1)
+    gc.collect()
+    # the cached exception doesn't keep the frame of the failed call (and its locals) alive
+    assert refs[0]() is None
+
+    with pytest.raises(TransientError) as exc_info:
+        await fetch(1)
+    assert exc_info.value.args == (1,)
+    assert 'fetch' not in [frame.name for frame in traceback.extract_tb(exc_info.value.__traceback__)]
+    assert len(refs) == 1
+
+
+def test_cache_decorator_negative_and_exception_caching(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    calls = mocker.Mock()
+
+    @cache(maxsize=10, ttl=60, negative_ttl=5, cache_exceptions=(KeyError,))
+    def get(x):
+        calls(x)
+        if x < 0:
+            raise KeyError(x)
+        return None if x == 0 else x
+
+    for _ in range(2):
+        assert get(0) is None
+        with pytest.raises(KeyError):
+            get(-1)
+    assert calls.call_count == 2
+    expiry_times = get.cache_instance.expiry_times
+    assert expiry_times[(0,)] < expiry_times[(-1,)]
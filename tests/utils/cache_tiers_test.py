@@ -0,0 +1,440 @@
+import asyncio
+import logging
+import subprocess
+import sys
+import pytest
+
+from alexber.utils.mains import make_hashable
+from alexber.utils.cache import AsyncCache, ShardedAsyncCache, async_cache
+from alexber.utils.cache_tiers import stable_key_digest, SqliteCacheTier, SharedMemoryCacheTier, \
+    _is_available_fcntl, RespCacheTier, RespStandInServer
+
+
+logger = logging.getLogger(__name__)
+
+
+def test_stable_key_digest(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    key = make_hashable(((1, 'a'), {'x': [1, 2], 'y': None}))
+
+    assert stable_key_digest(key) == stable_key_digest(key)
+    assert len(stable_key_digest(key)) == 16
+    assert stable_key_digest(key) != stable_key_digest(key, namespace='other')
+    assert stable_key_digest((1, 2)) != stable_key_digest([1, 2])
+    assert stable_key_digest(frozenset({'a', 'b'})) == stable_key_digest(frozenset({'b', 'a'}))
+
+
+def test_stable_key_digest_across_processes(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    code = ("from alexber.utils.cache_tiers import stable_key_digest; "
+            "print(stable_key_digest((frozenset({'alpha', 'beta', 'gamma'}), 'k', 1.5)).hex())")
+    digests = set()
+    for seed in ('1', '2', '3'):
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                             env={'PYTHONHASHSEED': seed, 'PYTHONPATH': '.'})
+        digests.add(out.stdout.strip())
+    assert len(digests) == 1
+
+
+@pytest.mark.asyncio
+async def test_sqlite_cache_tier_get_set_delete(request, tmp_path):
+    logger.info(f'{request._pyfuncitem.name}()')
+    tier = SqliteCacheTier(tmp_path / 'l2.sqlite')
+    try:
+        with pytest.raises(KeyError):
+            await tier.get('a')
+
+        await tier.set('a', {'value': [1, 2, 3]})
+        value, ttl_left = await tier.get('a')
+        assert value == {'value': [1, 2, 3]}
+        assert ttl_left is None
+
+        await tier.set(('b', 1), 'b', ttl=100)
+        value, ttl_left = await tier.get(('b', 1))
+        assert value == 'b'
+        assert 0 < ttl_left <= 100
+
+        await tier.delete('a')
+        with pytest.raises(KeyError):
+            await tier.get('a')
+
+        await tier.clear()
+        with pytest.raises(KeyError):
+            await tier.get(('b', 1))
+        assert tier.current_bytes == 0
+    finally:
+        await tier.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_cache_tier_miss_is_not_logged(request, tmp_path, mocker, caplog):
+    logger.info(f'{request._pyfuncitem.name}()')
+    tier = SqliteCacheTier(tmp_path / 'l2.sqlite')
+    clock = mocker.patch('alexber.utils.cache_tiers.time.time', return_value=1000.0)
+    try:
+        with caplog.at_level(logging.ERROR):
+            with pytest.raises(KeyError):
+                await tier.get('missing')
+            await tier.set('a', 1, ttl=10)
+            clock.return_value = 1011.0
+            with pytest.raises(KeyError):
+                await tier.get('a')
+            await asyncio.sleep(0.2)  # exec_in_executor() reports unconsumed exceptions after 0.1s
+        assert [r for r in caplog.records if r.levelno >= logging.ERROR] == []
+    finally:
+        await tier.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_cache_tier_ttl(request, tmp_path, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    tier = SqliteCacheTier(tmp_path / 'l2.sqlite')
+    clock = mocker.patch('alexber.utils.cache_tiers.time.time', return_value=1000.0)
+    try:
+        await tier.set('a', 1, ttl=10)
+        clock.return_value = 1011.0
+        with pytest.raises(KeyError):
+            await tier.get('a')
+    finally:
+        await tier.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_cache_tier_byte_budget(request, tmp_path):
+    logger.info(f'{request._pyfuncitem.name}()')
+    tier = SqliteCacheTier(tmp_path / 'l2.sqlite', max_bytes=10_000, low_watermark=0.5)
+    try:
+        for i in range(20):
+            await tier.set(i, b'x' * 1000)
+            # keep the first one hot
+            await tier.get(0)
+
+        assert tier.current_bytes <= 10_000
+        assert tier.evictions > 0
+        value, _ = await tier.get(0)
+        assert value == b'x' * 1000
+        with pytest.raises(KeyError):
+            await tier.get(1)
+
+        # value that doesn't fit at all is not stored
+        await tier.set('big', b'x' * 20_000)
+        with pytest.raises(KeyError):
+            await tier.get('big')
+    finally:
+        await tier.close()
+
+
+@pytest.mark.asyncio
+async def test_async_cache_with_sqlite_l2_survives_restart(request, tmp_path):
+    logger.info(f'{request._pyfuncitem.name}()')
+    path = tmp_path / 'l2.sqlite'
+    calls = []
+
+    def make_compute():
+        @async_cache(maxsize=10, ttl=60, l2=SqliteCacheTier(path, namespace='compute'))
+        async def compute(x, y=0):
+            calls.append(x)
+            return {'sum': x + y}
+        return compute
+
+    compute = make_compute()
+    assert await compute(1, y=2) == {'sum': 3}
+    await compute.cache_instance.l2.close()
+
+    # "restart": new L1, the same file
+    compute = make_compute()
+    assert await compute(1, y=2) == {'sum': 3}
+    assert await compute(1, y=2) == {'sum': 3}
+    assert calls == [1]
+
+    stats = await compute.cache_instance.get_stats()
+    assert stats['l2_hits'] == 1
+    assert stats['hits'] == 1
+    await compute.cache_instance.l2.close()
+
+
+@pytest.mark.asyncio
+async def test_sharded_async_cache_clear_clears_l2_once(request, tmp_path, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    tier = SqliteCacheTier(tmp_path / 'l2.sqlite')
+    cache = ShardedAsyncCache(maxsize=10, shards=4, l2=tier)
+    for key in range(8):
+        await cache.__setitem__(key, key)
+    assert await cache.__getitem__(0) == 0
+    clear_spy = mocker.spy(tier, 'clear')
+
+    await cache.clear()
+    clear_spy.assert_called_once_with()
+    assert all(len(shard.cache) == 0 for shard in cache.shards)
+    stats = await cache.get_stats()
+    assert stats['hits'] == 0
+    with pytest.raises(KeyError):
+        await tier.get(0)
+    await tier.close()
+
+
+@pytest.mark.asyncio
+async def test_async_cache_l2_promotion_keeps_per_entry_ttl(request, tmp_path):
+    logger.info(f'{request._pyfuncitem.name}()')
+    path = tmp_path / 'l2.sqlite'
+    calls = []
+
+    def make_find():
+        # no ttl of the cache, only negative entries expire
+        @async_cache(maxsize=10, l2=SqliteCacheTier(path, namespace='find'), negative_ttl=0.2)
+        async def find(x):
+            calls.append(x)
+            return None
+        return find
+
+    find = make_find()
+    assert await find(1) is None
+    assert await find(2) is None
+    await find.cache_instance.l2.close()
+
+    # "restarted" worker promotes the negative entries from L2
+    find = make_find()
+    assert await find(1) is None
+    assert await find.cache_instance.get_many([(2,)]) == {(2,): None}  # (2,) is the cache key of find(2)
+    assert calls == [1, 2]
+    assert set(find.cache_instance.expiry_times) == {(1,), (2,)}
+
+    await asyncio.sleep(0.3)
+    assert await find(1) is None
+    assert calls == [1, 2, 1]
+    await find.cache_instance.l2.close()
+
+
+@pytest.mark.asyncio
+async def test_async_cache_l2_failure_is_miss(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    l2 = mocker.Mock()
+    l2.get = mocker.AsyncMock(side_effect=OSError("disk is gone"))
+    l2.set = mocker.AsyncMock(side_effect=OSError("disk is gone"))
+    cache = AsyncCache(maxsize=10, l2=l2)
+
+    with pytest.raises(KeyError):
+        await cache.__getitem__('a')
+    await cache.__setitem__('a', 1)
+    assert await cache.__getitem__('a') == 1
+
+    stats = await cache.get_stats()
+    assert stats['l2_misses'] == 1
+
+
+@pytest.fixture
+def shared_tier_factory(tmp_path):
+    tiers = []
+
+    def factory(**kwargs):
+        kwargs.setdefault('slots', 64)
+        kwargs.setdefault('slot_size', 256)
+        kwargs.setdefault('probes', 4)
+        tier = SharedMemoryCacheTier(tmp_path / 'shared.cache', **kwargs)
+        tiers.append(tier)
+        return tier
+
+    yield factory
+    for tier in tiers:
+        tier._close()
+
+
+@pytest.mark.skipif(not _is_available_fcntl, reason="fcntl is not available")
+@pytest.mark.asyncio
+async def test_shared_memory_cache_tier_get_set_delete(request, shared_tier_factory):
+    logger.info(f'{request._pyfuncitem.name}()')
+    tier = shared_tier_factory()
+    with pytest.raises(KeyError):
+        await tier.get('a')
+
+    await tier.set('a', [1, 2, 3])
+    await tier.set(('b', 2), 'b', ttl=100)
+    assert await tier.get('a') == ([1, 2, 3], None)
+    value, ttl_left = await tier.get(('b', 2))
+    assert value == 'b'
+    assert 0 < ttl_left <= 100
+
+    await tier.set('a', 'updated')
+    assert (await tier.get('a'))[0] == 'updated'
+
+    await tier.delete('a')
+    with pytest.raises(KeyError):
+        await tier.get('a')
+
+    # value that doesn't fit into the slot is not stored
+    await tier.set('big', b'x' * 1000)
+    with pytest.raises(KeyError):
+        await tier.get('big')
+
+    await tier.clear()
+    with pytest.raises(KeyError):
+        await tier.get(('b', 2))
+
+
+@pytest.mark.skipif(not _is_available_fcntl, reason="fcntl is not available")
+@pytest.mark.asyncio
+async def test_shared_memory_cache_tier_ttl_and_overwrite(request, shared_tier_factory, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    clock = mocker.patch('alexber.utils.cache_tiers.time.time', return_value=1000.0)
+    tier = shared_tier_factory(slots=4, probes=4)
+    await tier.set('a', 1, ttl=10)
+    clock.return_value = 1011.0
+    with pytest.raises(KeyError):
+        await tier.get('a')
+
+    for i in range(4):
+        clock.return_value += 1
+        await tier.set(i, i)
+    clock.return_value += 1
+    assert await tier.get(0) == (0, None)  # 0 is the most recently accessed now
+
+    # the window is full, the least recently accessed slot (of 1) is overwritten
+    await tier.set(4, 4)
+    with pytest.raises(KeyError):
+        await tier.get(1)
+    assert await tier.get(0) == (0, None)
+    assert await tier.get(4) == (4, None)
+
+
+@pytest.mark.skipif(not _is_available_fcntl, reason="fcntl is not available")
+def test_shared_memory_cache_tier_is_shared_between_processes(request, shared_tier_factory, tmp_path):
+    logger.info(f'{request._pyfuncitem.name}()')
+    tier = shared_tier_factory()
+    tier._set('from-parent', 1)
+
+    code = ("import sys; from alexber.utils.cache_tiers import SharedMemoryCacheTier; "
+            "tier = SharedMemoryCacheTier(sys.argv[1]); "
+            "assert tier._get('from-parent') == (1, None); "
+            "tier._set('from-child', {'answer': 42})")
+    subprocess.run([sys.executable, '-c', code, str(tmp_path / 'shared.cache')], check=True,
+                   env={'PYTHONPATH': '.'})
+
+    assert tier._get('from-child') == ({'answer': 42}, None)
+    # the layout of existing file wins
+    assert tier.slots == 64
+
+
+@pytest.mark.skipif(not _is_available_fcntl, reason="fcntl is not available")
+@pytest.mark.asyncio
+async def test_shared_memory_cache_tier_contention_doesnt_block_event_loop(request, shared_tier_factory, tmp_path):
+    logger.info(f'{request._pyfuncitem.name}()')
+    tier = shared_tier_factory()
+    await tier.set('a', 1)
+
+    # another process holds the lock on the whole table
+    code = ("import fcntl, sys, time; fd = open(sys.argv[1], 'r+b'); "
+            "fcntl.lockf(fd, fcntl.LOCK_EX); print('locked', flush=True); "
+            "time.sleep(0.3); fcntl.lockf(fd, fcntl.LOCK_UN)")
+    child = subprocess.Popen([sys.executable, '-c', code, str(tmp_path / 'shared.cache')],
+                             stdout=subprocess.PIPE, text=True)
+    try:
+        assert child.stdout.readline().strip() == 'locked'
+        task = asyncio.create_task(tier.get('a'))
+        await asyncio.sleep(0.05)  # the event loop runs while get() waits for the lock
+        assert not task.done()
+        assert await asyncio.wait_for(task, timeout=5) == (1, None)
+    finally:
+        child.wait(timeout=5)
+
+
+@pytest.mark.skipif(not _is_available_fcntl, reason="fcntl is not available")
+@pytest.mark.asyncio
+async def test_async_cache_with_shared_memory_l2(request, shared_tier_factory):
+    logger.info(f'{request._pyfuncitem.name}()')
+    shared = shared_tier_factory(namespace='compute')
+    calls = []
+
+    async def compute(x):
+        calls.append(x)
+        return x * 2
+
+    # two "workers" with their own L1 and the shared L2
+    worker1 = async_cache(maxsize=10, l2=shared)(compute)
+    worker2 = async_cache(maxsize=10, l2=shared)(compute)
+
+    assert await worker1(21) == 42
+    assert await worker2(21) == 42
+    assert calls == [21]
+    stats = await worker2.cache_instance.get_stats()
+    assert stats['l2_hits'] == 1
+
+
+@pytest.mark.asyncio
+async def test_resp_cache_tier_get_set_delete(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    async with RespStandInServer() as server:
+        tier = RespCacheTier(port=server.port, namespace='f', max_connections=2)
+        try:
+            with pytest.raises(KeyError):
+                await tier.get('a')
+
+            await tier.set('a', {'value': [1, 2]})
+            assert await tier.get('a') == ({'value': [1, 2]}, None)
+
+            await tier.set(('b', 1), 'b', ttl=100)
+            value, ttl_left = await tier.get(('b', 1))
+            assert value == 'b'
+            assert 0 < ttl_left <= 100
+
+            # TTL is applied by the server
+            await tier.set('short', 1, ttl=0.02)
+            await asyncio.sleep(0.05)
+            with pytest.raises(KeyError):
+                await tier.get('short')
+
+            await tier.delete('a')
+            with pytest.raises(KeyError):
+                await tier.get('a')
+
+            # all commands of get_many() and set_many() are sent in one pipeline
+            commands = server.commands
+            await tier.set_many([(i, i * i) for i in range(10)])
+            found = await tier.get_many([1, 5, 'absent'])
+            assert found == {1: (1, None), 5: (25, None)}
+            assert server.commands - commands == 10 + 6
+
+            # the pool doesn't grow beyond max_connections
+            await asyncio.gather(*(tier.get(i) for i in range(10)))
+            assert len(tier._idle) <= 2
+
+            await tier.clear()
+            assert await tier.get_many(range(10)) == {}
+        finally:
+            await tier.close()
+
+
+@pytest.mark.asyncio
+async def test_async_cache_with_resp_l2_keeps_near_caches_coherent(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    async with RespStandInServer() as server:
+        tier_a = RespCacheTier(port=server.port, channel='invalidations')
+        tier_b = RespCacheTier(port=server.port, channel='invalidations')
+        node_a = AsyncCache(maxsize=10, l2=tier_a)
+        node_b = ShardedAsyncCache(maxsize=10, shards=2, l2=tier_b)
+        try:
+            await tier_a.start()
+            await tier_b.start()
+
+            await node_a.__setitem__('k', 1)
+            # node b misses L1 and hits remote
+            assert await node_b.__getitem__('k') == 1
+            assert 'k' in node_b._shard_for('k').cache
+
+            await node_b.__setitem__('k', 2)
+            for _ in range(100):
+                if 'k' not in node_a.cache:
+                    break
+                await asyncio.sleep(0.01)
+            # the stale near cache entry of node a was dropped, the new value comes from remote
+            assert 'k' not in node_a.cache
+            assert await node_a.__getitem__('k') == 2
+            # own writes don't invalidate own near cache
+            assert 'k' in node_b._shard_for('k').cache
+
+            await node_a.set_many({'x': 10, 'y': 20})
+            assert await node_b.get_many(['x', 'y', 'z']) == {'x': 10, 'y': 20}
+            stats = await node_b.get_stats()
+            assert stats['l2_hits'] == 3
+        finally:
+            await tier_a.close()
+            await tier_b.close()
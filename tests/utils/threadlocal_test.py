@@ -9,10 +9,11 @@ import contextvars
 import pytest
 import pytest
 import asyncio
-#import time
+import time
 
 
-from alexber.utils.thread_locals import RLock, LockingCallableMixin, \
+from alexber.utils.thread_locals import RLock, RWLock, Semaphore, reader_method, writer_method, LockingProxy, \
+    LockingCallableMixin, \
     LockingIterableMixin, LockingIterator, LockingAsyncIterableMixin, LockingAsyncIterator, LockingAccessMixin, \
     LockingPedanticObjMixin, LockingDefaultLockMixin, _coerce_base_language_model, LockingBaseLanguageModelMixin, \
     _is_pydantic_obj
@@ -284,6 +285,404 @@ async def test_async_fairness(request, mocker):
 
     assert results == [0, 1, 2], f"Results were {results}"
 
+def test_sync_contended_counter(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    lock = RLock()
+    counter = {'value': 0}
+
+    def thread_func():
+        for _ in range(1_000):
+            with lock:
+                with lock:
+                    value = counter['value']
+                    counter['value'] = value + 1
+
+    threads = [threading.Thread(target=thread_func) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert counter['value'] == 8_000
+    assert lock._sync_owner is None
+    assert not lock._sync_waiting
+
+@pytest.mark.asyncio
+async def test_async_cancelled_waiter_leaves_queue(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    lock = RLock()
+    results = []
+
+    async def async_task(task_id):
+        async with lock:
+            results.append(task_id)
+
+    await lock.async_acquire()
+    cancelled = asyncio.create_task(async_task(0))
+    waiter = asyncio.create_task(async_task(1))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    await lock.async_release()
+    await asyncio.wait_for(waiter, timeout=1)
+
+    assert results == [1]
+    assert cancelled.cancelled()
+    assert not lock._async_waiting
+
+@pytest.mark.asyncio
+async def test_async_fifo_handoff_under_contention(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    lock = RLock()
+    results = []
+
+    async def async_task(task_id):
+        async with lock:
+            results.append(task_id)
+            await asyncio.sleep(0)
+
+    await lock.async_acquire()
+    tasks = [asyncio.create_task(async_task(i)) for i in range(64)]
+    await asyncio.sleep(0)
+    assert len(lock._async_waiting) == 64
+    await lock.async_release()
+    await asyncio.gather(*tasks)
+
+    assert results == list(range(64))
+    assert lock._async_owner is None
+
+@pytest.mark.asyncio
+async def test_async_cancelled_after_handoff_passes_lock_on(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    lock = RLock()
+    results = []
+
+    async def async_task(task_id):
+        async with lock:
+            results.append(task_id)
+
+    await lock.async_acquire()
+    first = asyncio.create_task(async_task(0))
+    second = asyncio.create_task(async_task(1))
+    await asyncio.sleep(0)
+    await lock.async_release()
+    assert lock._async_owner is first  # handed over, but first didn't run yet
+    first.cancel()
+    await asyncio.wait_for(second, timeout=1)
+
+    assert results == [1]
+    assert first.cancelled()
+    assert lock._async_owner is None
+
+### Reader-writer lock
+def test_rwlock_sync_readers_run_in_parallel(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    lock = RWLock()
+    barrier = threading.Barrier(3, timeout=5)
+
+    def reader():
+        with lock.read_lock:
+            barrier.wait()  # would time out if the readers were serialized
+
+    threads = [threading.Thread(target=reader) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not barrier.broken
+
+def test_rwlock_sync_writer_is_exclusive(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    lock = RWLock()
+    events = []
+    reader_in = threading.Event()
+
+    def writer():
+        reader_in.wait()
+        with lock:
+            events.append('write')
+
+    t = threading.Thread(target=writer)
+    t.start()
+    with lock.read_lock:
+        reader_in.set()
+        time.sleep(0.05)
+        events.append('read')
+    t.join()
+
+    assert events == ['read', 'write']
+
+def test_rwlock_sync_reentrancy(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    lock = RWLock()
+    with lock:
+        with lock:
+            with lock.read_lock:  # owner of the write lock may read
+                pass
+    with lock.read_lock:
+        with lock.read_lock:
+            with pytest.raises(RuntimeError):
+                lock.acquire()  # upgrade is not supported
+    with pytest.raises(RuntimeError):
+        lock.release()
+    with pytest.raises(RuntimeError):
+        lock.read_lock.release()
+
+@pytest.mark.asyncio
+async def test_rwlock_async_readers_parallel_writer_fifo(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    lock = RWLock()
+    events = []
+
+    async def reader(i, hold):
+        async with lock.read_lock:
+            events.append(f'read{i}+')
+            await asyncio.sleep(hold)
+            events.append(f'read{i}-')
+
+    async def writer():
+        async with lock:
+            events.append('write+')
+            await asyncio.sleep(0)
+            events.append('write-')
+
+    first = asyncio.create_task(reader(1, 0.02))
+    second = asyncio.create_task(reader(2, 0.02))
+    await asyncio.sleep(0)
+    w = asyncio.create_task(writer())
+    await asyncio.sleep(0)
+    late = asyncio.create_task(reader(3, 0))  # queued behind the writer
+    await asyncio.gather(first, second, w, late)
+
+    assert events[:2] == ['read1+', 'read2+']
+    assert events[4:] == ['write+', 'write-', 'read3+', 'read3-']
+
+@pytest.mark.asyncio
+async def test_rwlock_async_cancelled_writer_lets_readers_in(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    lock = RWLock()
+
+    async def writer():
+        async with lock:
+            pass
+
+    async def reader():
+        async with lock.read_lock:
+            return True
+
+    await lock.read_lock.async_acquire()
+    w = asyncio.create_task(writer())
+    await asyncio.sleep(0)
+    r = asyncio.create_task(reader())
+    await asyncio.sleep(0)
+    w.cancel()
+    assert await asyncio.wait_for(r, timeout=1)
+    await lock.read_lock.async_release()
+    assert w.cancelled()
+
+def test_locking_proxy_with_rwlock_readers(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    barrier = threading.Barrier(2, timeout=5)
+
+    class Config:
+        def get(self):
+            barrier.wait()  # both readers are inside at the same time
+            return 'value'
+
+        @reader_method
+        def peek(self):
+            return 'peek'
+
+        @writer_method
+        def reload(self):
+            return 'reloaded'
+
+    lock = RWLock()
+    proxy = LockingProxy(obj=Config(), lock=lock, readers={'get', 'reload'})
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(proxy.get())) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ['value', 'value']
+
+    with lock.read_lock:
+        assert proxy.peek() == 'peek'  # reader_method
+        with pytest.raises(RuntimeError):
+            proxy.reload()  # writer_method wins over readers, and can't be taken under the read lock
+
+### Concurrency-limiting proxy
+@pytest.mark.asyncio
+async def test_locking_proxy_max_concurrency_async_fifo(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    state = {'running': 0, 'max_running': 0}
+    started = []
+
+    class Client:
+        async def ainvoke(self, i):
+            started.append(i)
+            state['running'] += 1
+            state['max_running'] = max(state['max_running'], state['running'])
+            await asyncio.sleep(0.01)
+            state['running'] -= 1
+            return i
+
+    proxy = LockingProxy(obj=Client(), max_concurrency=3)
+    results = await asyncio.gather(*(proxy.ainvoke(i) for i in range(10)))
+
+    assert results == list(range(10))
+    assert state['max_running'] == 3
+    assert started == list(range(10))  # callers beyond the limit are served in FIFO order
+
+def test_locking_proxy_max_concurrency_sync(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    state = {'running': 0, 'max_running': 0}
+    state_lock = threading.Lock()
+
+    class Client:
+        def invoke(self):
+            with state_lock:
+                state['running'] += 1
+                state['max_running'] = max(state['max_running'], state['running'])
+            time.sleep(0.02)
+            with state_lock:
+                state['running'] -= 1
+
+    proxy = LockingProxy(obj=Client(), max_concurrency=2)
+    threads = [threading.Thread(target=proxy.invoke) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert state['max_running'] == 2
+    assert isinstance(proxy._lock, Semaphore)
+
+def test_locking_proxy_max_concurrency_with_lock(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    with pytest.raises(ValueError):
+        LockingProxy(obj=mocker.Mock(), lock=RLock(), max_concurrency=2)
+    with pytest.raises(ValueError):
+        LockingProxy(obj=mocker.Mock(), max_concurrency=0)
+
+def test_locking_proxy_max_concurrency_pydantic_and_base_language_model(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    mocker.patch('alexber.utils.thread_locals._is_pydantic_obj', return_value=True)
+    mocker.patch('alexber.utils.thread_locals._is_available_base_language_model', True)
+
+    class MockBaseLanguageModel:
+        @staticmethod
+        def register(cls):
+            pass
+
+    mocker.patch('alexber.utils.thread_locals.BaseLanguageModel', MockBaseLanguageModel)
+    mock_register = mocker.patch.object(MockBaseLanguageModel, 'register')
+
+    class Model(MockBaseLanguageModel):
+        def _copy_and_set_values(self):
+            pass
+
+    proxy = LockingProxy(obj=Model(), max_concurrency=2)
+    mock_register.assert_called_once_with(LockingProxy)
+    assert proxy._copy_and_set_values() is proxy
+
+@pytest.mark.asyncio
+async def test_locking_proxy_max_concurrency_async_context_manager(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    proxy = LockingProxy(obj=mocker.Mock(), max_concurrency=1)
+    async with proxy:
+        pass
+    async with proxy:  # the permit was released by __aexit__
+        pass
+
+@pytest.mark.asyncio
+async def test_semaphore_shared_by_threads_and_tasks(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    semaphore = Semaphore(1)
+    acquired = threading.Event()
+    release = threading.Event()
+
+    def thread_func():
+        with semaphore:
+            acquired.set()
+            release.wait(5)
+
+    t = threading.Thread(target=thread_func)
+    t.start()
+    acquired.wait(5)
+    async def holder():
+        async with semaphore:
+            return True
+
+    task = asyncio.create_task(holder())
+    await asyncio.sleep(0.01)
+    assert not task.done()  # the thread holds the only permit
+    release.set()
+    assert await asyncio.wait_for(task, timeout=1)
+    t.join()
+    with pytest.raises(RuntimeError):
+        semaphore.release()  # not held by the current task
+
+@pytest.mark.asyncio
+async def test_semaphore_cancelled_waiter_passes_permit_on(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+    semaphore = Semaphore(1)
+
+    async def holder():
+        async with semaphore:
+            return True
+
+    await semaphore.async_acquire()
+    first = asyncio.create_task(holder())
+    second = asyncio.create_task(holder())
+    await asyncio.sleep(0)
+    await semaphore.async_release()  # the permit is on its way to first
+    first.cancel()
+    assert await asyncio.wait_for(second, timeout=1)
+    assert first.cancelled()
+    assert semaphore._value == 1
+
+def test_locking_proxy_max_concurrency_is_reentrant(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+
+    class Client:
+        def invoke(self):
+            return 'result'
+
+    proxy = LockingProxy(obj=Client(), max_concurrency=1)
+    result = []
+    # in a separate thread, so the test doesn't hang if the owner doesn't re-enter
+    t = threading.Thread(target=lambda: result.append(_reenter(proxy)), daemon=True)
+    t.start()
+    t.join(5)
+    assert result == ['result']
+
+def _reenter(proxy):
+    with proxy:
+        with proxy:
+            return proxy.invoke()
+
+@pytest.mark.asyncio
+async def test_locking_proxy_max_concurrency_sync_call_in_event_loop(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+
+    class Client:
+        def invoke(self):
+            return 'result'
+
+        async def ainvoke(self):
+            await asyncio.sleep(0.05)
+            return proxy.invoke()  # the task that holds the permit re-enters with synchronous call
+
+    proxy = LockingProxy(obj=Client(), max_concurrency=1)
+    holder = asyncio.create_task(proxy.ainvoke())
+    await asyncio.sleep(0)
+    with pytest.raises(RuntimeError):
+        proxy.invoke()  # waiting here would block the event loop that should run the holder
+    assert await asyncio.wait_for(holder, timeout=1) == 'result'
+    assert proxy.invoke() == 'result'
+
 ### Other Callable and Iterable Tests for Completeness
 def test_call_synchronous_function(request, mocker):
     logger.info(f'{request._pyfuncitem.name}()')
@@ -445,6 +844,29 @@ async def test_locking_access_async_method(request, mocker):
     lock.__aenter__.assert_called_once()
     lock.__aexit__.assert_called_once()
 
+def test_locking_access_reuses_wrapper_and_invalidates_it(request, mocker):
+    logger.info(f'{request._pyfuncitem.name}()')
+
+    class TestClass:
+        def method(self):
+            return "class"
+
+    obj = TestClass()
+    mixin = LockingAccessMixin(obj=obj, lock=RLock())
+    wrapped_method = mixin.method
+    assert mixin.method is wrapped_method  # cached, bound method is recreated on every access
+    assert wrapped_method() == "class"
+
+    obj.method = lambda: "instance"  # instance attribute shadows the method
+    assert mixin.method is not wrapped_method
+    assert mixin.method() == "instance"
+
+    del obj.method
+    assert mixin.method() == "class"
+
+    other = TestClass()
+    assert LockingAccessMixin(obj=other, lock=RLock()).method is not wrapped_method
+
 def test_locking_access_property_handling(request, mocker):
     logger.info(f'{request._pyfuncitem.name}()')
 